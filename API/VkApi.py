@@ -3,6 +3,8 @@ import requests
 
 from pathlib import Path
 
+from vk_client import VK_API_URL, VKAPIError
+
 
 class VKAPI:
     def __init__(self):
@@ -11,6 +13,7 @@ class VKAPI:
         self.response = None
         self.user_info = None
         self.user_id = None
+        self.session = requests.Session()  # одно keep-alive соединение на все запросы
 
     def _load_token(self):
         """Загружает токен из файла config/vk_token.txt"""
@@ -47,7 +50,7 @@ class VKAPI:
             else:
                 print("У пользователя нет альбомов или они скрыты настройками приватности")
         else:
-            self.response = requests.get("https://api.vk.com/method/photos.getAlbums", params={
+            self.response = self.session.get(f"{VK_API_URL}/photos.getAlbums", params={
                 "access_token": self.token,
                 "v": "5.199",
                 "owner_id": self.user_id,
@@ -57,8 +60,8 @@ class VKAPI:
 
     def get_user_info(self, user_id):
         """Получает информацию о пользователе"""
-        response = requests.get(
-            "https://api.vk.com/method/users.get",
+        response = self.session.get(
+            f"{VK_API_URL}/users.get",
             params={
                 "access_token": self.token,
                 "v": self.api_version,
@@ -81,9 +84,7 @@ class VKAPI:
             return user_info
         else:
             error = data.get("error", {})
-            raise Exception(
-                f"VK API Error {error.get('error_code')}: {error.get('error_msg')}"
-            )
+            raise VKAPIError(error.get('error_code'), error.get('error_msg'))
 
 def main():
     try:
@@ -0,0 +1,65 @@
+"""Замер: сколько занимает получение N пользователей через VK API.
+
+Сравниваются прежний способ (голый requests.get на каждого пользователя) и
+AsyncVKClient с пачками users.get, оба против локальной заглушки VKStub с
+ограничением частоты как у VK. Прежний способ на всех N не запускается: при
+ограничении rate он занимает N / rate секунд, замеряется выборка без ограничения.
+
+    python bench_vk_client.py --users 100000
+"""
+import argparse
+import asyncio
+import time
+
+import requests
+
+from vk_client import VK_RATE_LIMIT, AsyncVKClient
+from vk_stub import VKStub
+
+
+def bench_single(latency: float, sample: int) -> float:
+    """Секунд на пользователя при отдельном запросе без keep-alive"""
+    stub = VKStub(latency=latency).start()
+    try:
+        started = time.perf_counter()
+        for user_id in range(1, sample + 1):
+            requests.get(f"{stub.url}/users.get", params={'access_token': 'bench', 'v': '5.199',
+                                                          'user_ids': user_id}).json()
+        return (time.perf_counter() - started) / sample
+    finally:
+        stub.stop()
+
+
+async def bench_batched(url: str, users: int, rate: float):
+    async with AsyncVKClient('bench', url, rate=rate) as client:
+        started = time.perf_counter()
+        result = await client.get_users(range(1, users + 1))
+        elapsed = time.perf_counter() - started
+    found = sum(isinstance(user, dict) for user in result)
+    return elapsed, found, client.requests, client.retries
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер получения пользователей через VK API')
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--rate', type=float, default=VK_RATE_LIMIT, help='Запросов в секунду у заглушки и клиента')
+    parser.add_argument('--latency', type=float, default=0.02, help='Задержка ответа заглушки, с')
+    parser.add_argument('--sample', type=int, default=300, help='Пользователей для замера прежнего способа')
+    args = parser.parse_args()
+
+    per_user = bench_single(args.latency, args.sample)
+    single_total = max(per_user * args.users, args.users / args.rate)
+    print(f"requests.get на пользователя: {per_user * 1000:.1f} мс, "
+          f"на {args.users} при {args.rate:g} запросах/с: ~{single_total:.0f} с")
+
+    stub = VKStub(rate=args.rate, latency=args.latency).start()
+    try:
+        elapsed, found, calls, retries = asyncio.run(bench_batched(stub.url, args.users, args.rate))
+    finally:
+        stub.stop()
+    print(f"AsyncVKClient: {found} пользователей за {elapsed:.1f} с ({found / elapsed:.0f}/с), "
+          f"запросов {calls}, повторов после ошибки 6: {retries}, отказов заглушки: {stub.throttled}")
+
+
+if __name__ == '__main__':
+    main()
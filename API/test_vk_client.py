@@ -0,0 +1,81 @@
+import asyncio
+import time
+import unittest
+
+from vk_client import AsyncVKClient, VKAPIError
+from vk_stub import VKStub
+
+
+class TestAsyncVKClient(unittest.TestCase):
+    def start_stub(self, **kwargs) -> VKStub:
+        stub = VKStub(**kwargs).start()
+        self.addCleanup(stub.stop)
+        return stub
+
+    def run_client(self, stub, coroutine, **kwargs):
+        async def main():
+            async with AsyncVKClient('test-token', stub.url, **kwargs) as client:
+                return await coroutine(client), client
+        return asyncio.run(main())
+
+    def test_concurrent_lookups_are_batched(self):
+        stub = self.start_stub()
+        user_ids = list(range(1, 2501))
+        users, client = self.run_client(stub, lambda client: client.get_users(user_ids), rate=100)
+
+        self.assertEqual([user['id'] for user in users], user_ids)
+        self.assertEqual(stub.requests, 3)  # 1000 + 1000 + 500
+        self.assertEqual(stub.max_batch, 1000)
+        self.assertLessEqual(stub.connections, 4)
+
+    def test_full_batch_cancels_its_timer(self):
+        """Таймер пачки, отправленной по заполнению, не отправляет следующую раньше срока"""
+        stub = self.start_stub()
+
+        async def lookups(client):
+            first = asyncio.ensure_future(client.get_users(range(1, 1001)))
+            await asyncio.sleep(0.2)
+            second = asyncio.ensure_future(client.get_user(1001))
+            await asyncio.sleep(0.15)  # таймер первой пачки сработал бы здесь
+            third = await client.get_user(1002)
+            return [*await first, await second, third]
+
+        users, _ = self.run_client(stub, lookups, rate=100, batch_window=0.3)
+        self.assertEqual(len(users), 1002)
+        self.assertEqual(stub.requests, 2)
+
+    def test_screen_names_and_missing_users(self):
+        stub = self.start_stub()
+        users, _ = self.run_client(stub, lambda client: client.get_users(['id5', 7, 'no_such_user', '5']),
+                                   rate=100)
+
+        self.assertEqual([user['id'] if isinstance(user, dict) else user.code for user in users], [5, 7, 113, 5])
+        self.assertEqual(stub.requests, 1)
+
+    def test_token_bucket_limits_rate(self):
+        stub = self.start_stub(rate=10)
+        started = time.monotonic()
+        albums, _ = self.run_client(stub, lambda client: asyncio.gather(*(client.get_albums(1) for _ in range(12))),
+                                    rate=10)
+
+        self.assertEqual([album['count'] for album in albums], [2] * 12)
+        self.assertGreaterEqual(time.monotonic() - started, 1.0)  # 12 запросов при 10 в секунду
+
+    def test_too_many_requests_is_retried(self):
+        stub = self.start_stub(rate=2)
+        albums, client = self.run_client(stub, lambda client: asyncio.gather(*(client.get_albums(1) for _ in range(5))),
+                                         rate=50, retry_delay=0.2)
+
+        self.assertEqual(len(albums), 5)
+        self.assertGreater(stub.throttled, 0)
+        self.assertEqual(client.retries, stub.throttled)
+
+    def test_api_error(self):
+        stub = self.start_stub()
+        with self.assertRaises(VKAPIError) as raised:
+            self.run_client(stub, lambda client: client.call('no.such.method'))
+        self.assertEqual(raised.exception.code, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+VK_API_URL = "https://api.vk.com/method"
+VK_API_VERSION = "5.199"
+VK_RATE_LIMIT = 3           # запросов в секунду с пользовательским токеном
+VK_CONNECTIONS = 4          # keep-alive соединений и потоков для запросов
+USERS_GET_MAX_IDS = 1000    # user_ids в одном users.get
+USER_BATCH_WINDOW = 0.005   # секунд ожидания, пока копится пачка users.get
+USER_FIELDS = "first_name,last_name,photo_200,domain,city,bdate"
+
+ERROR_TOO_MANY_REQUESTS = 6
+ERROR_INVALID_USER_ID = 113
+MAX_RETRIES = 5
+RETRY_DELAY = 0.5           # секунд до первого повтора после ошибки 6, дальше вдвое больше
+
+
+class VKAPIError(Exception):
+    def __init__(self, code: Optional[int], message: Optional[str]):
+        super().__init__(f"VK API Error {code}: {message}")
+        self.code = code
+        self.message = message
+
+
+class TokenBucket:
+    """Ограничение частоты: rate запросов в секунду, не больше capacity подряд"""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()  # ожидающие получают разрешения по очереди
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncVKClient:
+    """Асинхронный клиент VK API.
+
+    Запросы идут через общую requests.Session с пулом keep-alive соединений
+    в пуле потоков (aiohttp в зависимостях нет), частоту ограничивает
+    TokenBucket, ошибка 6 (слишком много запросов) повторяется с
+    экспоненциальной задержкой. Одновременные get_user собираются в один
+    users.get до USERS_GET_MAX_IDS пользователей: пачка отправляется, когда
+    заполнится или через USER_BATCH_WINDOW после первого запроса в ней.
+    """
+
+    def __init__(self, token: str, api_url: str = VK_API_URL, version: str = VK_API_VERSION,
+                 rate: float = VK_RATE_LIMIT, connections: int = VK_CONNECTIONS, timeout: float = 10,
+                 max_retries: int = MAX_RETRIES, retry_delay: float = RETRY_DELAY,
+                 batch_window: float = USER_BATCH_WINDOW):
+        self.token = token
+        self.api_url = api_url.rstrip('/')  # можно подставить локальную заглушку вместо VK
+        self.version = version
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.batch_window = batch_window
+        self.bucket = TokenBucket(rate)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=connections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=connections)
+        self._batches: Dict[str, List[Tuple[str, asyncio.Future]]] = {}  # fields -> ожидающие users.get
+        self._timers: Dict[str, asyncio.TimerHandle] = {}  # fields -> таймер отправки пачки
+        self._tasks: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.retries = 0
+
+    async def __aenter__(self) -> 'AsyncVKClient':
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown()
+        self.session.close()
+
+    async def call(self, method: str, **params):
+        """Вызов метода API; возвращает поле response ответа или бросает VKAPIError"""
+        params = {**params, 'access_token': self.token, 'v': self.version}
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            self.requests += 1
+            data = await loop.run_in_executor(self._executor, self._post, method, params)
+            if 'error' not in data:
+                return data['response']
+            error = data['error']
+            if error.get('error_code') == ERROR_TOO_MANY_REQUESTS and attempt < self.max_retries:
+                self.retries += 1
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+                continue
+            raise VKAPIError(error.get('error_code'), error.get('error_msg'))
+
+    def _post(self, method: str, params: dict) -> dict:
+        # POST: тысяча user_ids не помещается в строку запроса
+        response = self.session.post(f"{self.api_url}/{method}", data=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    async def get_user(self, user_id, fields: str = USER_FIELDS) -> dict:
+        """Пользователь по id или короткому имени; запрос попадает в общую пачку users.get"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._batches.setdefault(fields, [])
+        batch.append((str(user_id), future))
+        if len(batch) >= USERS_GET_MAX_IDS:
+            self._flush(fields)
+        elif len(batch) == 1:
+            self._timers[fields] = loop.call_later(self.batch_window, self._flush, fields)
+        return await future
+
+    async def get_users(self, user_ids: Iterable, fields: str = USER_FIELDS) -> List:
+        """Пользователи по списку id; на месте несуществующих — VKAPIError"""
+        return await asyncio.gather(*(self.get_user(user_id, fields) for user_id in user_ids),
+                                    return_exceptions=True)
+
+    async def get_albums(self, owner_id, need_system: bool = True) -> dict:
+        return await self.call('photos.getAlbums', owner_id=owner_id, need_system=int(need_system))
+
+    def _flush(self, fields: str):
+        timer = self._timers.pop(fields, None)
+        if timer is not None:
+            timer.cancel()  # иначе таймер отправленной пачки раньше времени отправит следующую
+        batch = self._batches.pop(fields, None)
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._fetch_users(batch, fields))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch_users(self, batch: List[Tuple[str, asyncio.Future]], fields: str):
+        user_ids = list(dict.fromkeys(user_id for user_id, _ in batch))
+        try:
+            # domain нужен, чтобы сопоставить ответы коротким именам из запроса
+            users = await self.call('users.get', user_ids=','.join(user_ids), fields=f"{fields},domain")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        found = {}
+        for user in users:
+            for key in (str(user['id']), f"id{user['id']}", user.get('domain', '')):
+                found[key.lower()] = user
+        for user_id, future in batch:
+            if future.done():
+                continue  # вызывающий перестал ждать
+            user = found.get(user_id.lower())
+            if user is not None:
+                future.set_result(user)
+            else:
+                future.set_exception(VKAPIError(ERROR_INVALID_USER_ID, f"Invalid user id: {user_id}"))
@@ -0,0 +1,116 @@
+import collections
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class VKStub:
+    """Локальный HTTP-сервер вместо api.vk.com для тестов и замеров.
+
+    users.get отвечает на числовые id и idN пользователями id N (N > 0),
+    остальные id в ответ не попадают, как несуществующие короткие имена.
+    photos.getAlbums отдаёт два альбома. Если задан rate, запросы сверх rate
+    за последнюю секунду получают ошибку 6. Считает запросы, отказы по
+    частоте, TCP-соединения и наибольшее число user_ids в одном users.get.
+    """
+
+    def __init__(self, rate: float = None, latency: float = 0.0, host: str = '127.0.0.1', port: int = 0):
+        self.rate = rate
+        self.latency = latency
+        self.requests = 0
+        self.throttled = 0
+        self.connections = 0
+        self.max_batch = 0
+        self._recent = collections.deque()
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}/method"
+
+    def start(self) -> 'VKStub':
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _allowed(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            if self.rate is None:
+                return True
+            now = time.monotonic()
+            while self._recent and self._recent[0] <= now - 1:
+                self._recent.popleft()
+            if len(self._recent) >= self.rate:
+                self.throttled += 1
+                return False
+            self._recent.append(now)
+            return True
+
+    @staticmethod
+    def user(user_id: str):
+        number = user_id[2:] if user_id.startswith('id') else user_id
+        if not number.isdigit() or int(number) == 0:
+            return None
+        number = int(number)
+        return {'id': number, 'first_name': f"Имя{number}", 'last_name': f"Фамилия{number}",
+                'domain': f"id{number}", 'can_access_closed': True, 'is_closed': False}
+
+    def respond(self, method: str, params: dict) -> dict:
+        if not params.get('access_token'):
+            return {'error': {'error_code': 5, 'error_msg': 'User authorization failed'}}
+        if not self._allowed():
+            return {'error': {'error_code': 6, 'error_msg': 'Too many requests per second'}}
+        time.sleep(self.latency)
+        if method == 'users.get':
+            user_ids = [user_id for user_id in params.get('user_ids', '').split(',') if user_id]
+            with self._lock:
+                self.max_batch = max(self.max_batch, len(user_ids))
+            if len(user_ids) > 1000:
+                return {'error': {'error_code': 100, 'error_msg': 'One of the parameters specified was missing '
+                                                                   'or invalid: user_ids is too long'}}
+            return {'response': [user for user in map(self.user, user_ids) if user is not None]}
+        if method == 'photos.getAlbums':
+            return {'response': {'count': 2, 'items': [{'id': -7, 'title': 'Фото со стены', 'size': 3},
+                                                       {'id': 1, 'title': 'Отпуск', 'size': 12}]}}
+        return {'error': {'error_code': 3, 'error_msg': 'Unknown method passed'}}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def do_GET(self):
+                self.answer(urlparse(self.path).query)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                self.answer(self.rfile.read(length).decode())
+
+            def answer(self, query: str):
+                url = urlparse(self.path)
+                if not url.path.startswith('/method/'):
+                    self.send_error(404)
+                    return
+                params = {key: values[0] for key, values in parse_qs(query).items()}
+                body = json.dumps(stub.respond(url.path[len('/method/'):], params)).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,114 @@
+"""Список блокировки на 1, 5 и 10 млн имён: время загрузки, память и время проверки.
+
+Для каждого размера генерируется файл со случайными именами (одно в строке),
+затем в отдельном процессе он загружается в Blocklist и для сравнения в
+обычный set строк. Память — прирост RSS после загрузки и пиковый прирост во
+время неё (VmHWM). Проверка — blocked() для заблокированного имени, для его
+поддомена и для незаблокированного имени из четырёх меток.
+
+Запуск: python -m DnsServer.bench.bench_blocklist [--entries 1000000 5000000 10000000]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from DnsServer.main.blocklist import Blocklist, parse_blocklist
+
+TLDS = ('com', 'net', 'org', 'ru', 'io', 'info', 'xyz', 'de')
+LOOKUPS = 200_000
+
+
+def proc_status(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def write_list(path, count, seed=1):
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        for i in range(count):
+            f.write(f"{rng.getrandbits(40):x}.ads{i % 50_000}.{TLDS[i % len(TLDS)]}\n")
+
+
+def lookup_names(path, count):
+    """Запросы для проверки: заблокированные имена, их поддомены и незаблокированные"""
+    rng = random.Random(2)
+    with open(path) as f:
+        sample = [line.strip() for _, line in zip(range(count), f)]
+    return {
+        'blocked': sample,
+        'subdomain': [f'cdn.img.{name}' for name in sample],
+        'allowed': [f'www.static{rng.getrandbits(32)}.example.com' for _ in range(count)],
+    }
+
+
+def load_set(path):
+    with open(path) as f:
+        return set(parse_blocklist(f))
+
+
+def _measure(args):
+    variant, path = args
+    before = proc_status('VmRSS')
+    started = time.perf_counter()
+    if variant == 'blocklist':
+        index = Blocklist.load([path])
+        check = index.blocked
+    else:
+        index = load_set(path)
+
+        def check(name):  # та же проверка суффиксов, но поиском строк в set
+            name = name.lower()
+            start = 0
+            while True:
+                if (name[start:] if start else name) in index:
+                    return True
+                start = name.find('.', start) + 1
+                if not start:
+                    return False
+    load_s = time.perf_counter() - started
+    result = {
+        'load_s': load_s,
+        'rss_mb': (proc_status('VmRSS') - before) / 2**20,
+        'peak_mb': (proc_status('VmHWM') - before) / 2**20,
+    }
+    for kind, names in lookup_names(path, LOOKUPS // 10).items():
+        names = names * 10
+        started = time.perf_counter()
+        for name in names:
+            check(name)
+        result[f'{kind}_us'] = (time.perf_counter() - started) / len(names) * 1e6
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Загрузка, память и проверка списка блокировки')
+    parser.add_argument('--entries', type=int, nargs='+', default=[1_000_000, 5_000_000, 10_000_000])
+    parser.add_argument('--no-set', action='store_false', dest='compare_set', help='не сравнивать с set строк')
+    args = parser.parse_args()
+
+    variants = ['blocklist', 'set'] if args.compare_set else ['blocklist']
+    ctx = multiprocessing.get_context('spawn')  # чистый процесс: VmHWM без памяти родителя
+    print(f"{'имён':>10} {'вариант':<10} {'загрузка, с':>12} {'память, МБ':>11} {'пик, МБ':>9} "
+          f"{'байт/имя':>9} {'блок., мкс':>11} {'поддомен':>9} {'разреш.':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.entries:
+            path = os.path.join(tmp, f'blocklist-{count}.txt')
+            write_list(path, count)
+            for variant in variants:
+                with ctx.Pool(1) as pool:
+                    r = pool.map(_measure, [(variant, path)])[0]
+                print(f"{count:>10} {variant:<10} {r['load_s']:>12.1f} {r['rss_mb']:>11.0f} {r['peak_mb']:>9.0f} "
+                      f"{r['rss_mb'] * 2**20 / count:>9.1f} {r['blocked_us']:>11.2f} {r['subdomain_us']:>9.2f} "
+                      f"{r['allowed_us']:>8.2f}")
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
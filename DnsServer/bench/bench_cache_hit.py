@@ -0,0 +1,67 @@
+"""Микробенчмарк: задержка обработки запроса при попадании и промахе кэша.
+
+Запуск: python -m DnsServer.bench.bench_cache_hit [--iterations N]
+"""
+import argparse
+import time
+
+from DnsServer.bench.fake_upstream import FakeUpstream
+from DnsServer.main.dns_packet import DNSPacket, DNSQuestion, DNSType
+from DnsServer.main.server import DNSServer
+
+
+class NullSocket:
+    """Сокет-заглушка: считает отправленные ответы"""
+
+    def __init__(self):
+        self.sent = 0
+
+    def sendto(self, data, addr):
+        self.sent += 1
+
+
+def make_query(name, query_id=0x4242):
+    packet = DNSPacket(query_id, 0x0100, [DNSQuestion(name, DNSType.A, 1)], [], [], [])
+    return packet.to_wire()
+
+
+def measure(fn, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение задержки hit/miss для DNSCache')
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    upstream = FakeUpstream().start()
+    server = DNSServer(':memory:')
+    server.upstreams = [upstream.address]
+    sock = NullSocket()
+    addr = ('127.0.0.1', 5353)
+
+    hit_query = make_query('hit.example.com')
+    server.handle_request(sock, hit_query, addr)  # прогрев кэша
+
+    hit_us = measure(lambda i: server.handle_request(sock, hit_query, addr), args.iterations)
+
+    request = DNSPacket.parse(hit_query)
+    wire_us = measure(lambda i: server.cache.get_wire(request), args.iterations)
+    rebuild_us = measure(lambda i: server.cache.get_response(request), args.iterations)
+
+    miss_iterations = max(args.iterations // 10, 1)
+    miss_queries = [make_query(f'miss{i}.example.com') for i in range(miss_iterations)]
+    miss_us = measure(lambda i: server.handle_request(sock, miss_queries[i], addr), miss_iterations)
+
+    upstream.stop()
+    print(f"hit  (handle_request целиком):       {hit_us:8.2f} мкс/запрос")
+    print(f"hit  (только get_wire):              {wire_us:8.2f} мкс/запрос")
+    print(f"hit  (get_response со сборкой):      {rebuild_us:8.2f} мкс/запрос")
+    print(f"miss (локальный upstream по UDP):    {miss_us:8.2f} мкс/запрос")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Доля попаданий и вытеснения ограниченного кэша на трассе с распределением Ципфа.
+
+Сравниваются LRU и W-TinyLFU на чистой трассе и на трассе с примесью
+одноразовых случайных поддоменов.
+
+Запуск: python -m DnsServer.bench.bench_eviction --keyspace 100000 --length 500000 --capacity 5000
+"""
+import argparse
+import time
+
+from DnsServer.bench.traces import with_random_subdomains, zipf_names
+from DnsServer.main.cache import DNSCache
+from DnsServer.main.dns_packet import DNSPacket, DNSQuestion, DNSRecord, DNSType
+from DnsServer.main.eviction import LRUPolicy, TinyLFUPolicy
+
+
+def replay(names, policy, capacity):
+    cache = DNSCache(None, max_entries=capacity, max_bytes=1 << 40, policy=policy)
+    started = time.perf_counter()
+    for name in names:
+        request = DNSPacket(1, 0x0100, [DNSQuestion(name, DNSType.A, 1)], [], [], [])
+        if cache.get_wire(request) is None:
+            response = request.create_response()
+            response.add_answer(DNSRecord(name, DNSType.A, 1, 3600, b'\xc0\x00\x02\x01'))
+            cache.update(response)
+    elapsed = time.perf_counter() - started
+    stats = cache.stats()
+    stats['us_per_query'] = elapsed / len(names) * 1e6
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк вытеснения в DNSCache')
+    parser.add_argument('--keyspace', type=int, default=100_000)
+    parser.add_argument('--length', type=int, default=300_000)
+    parser.add_argument('--capacity', type=int, default=5_000)
+    parser.add_argument('--zipf-s', type=float, default=1.0)
+    parser.add_argument('--flood', type=float, default=0.3, help='Доля случайных поддоменов во второй трассе')
+    args = parser.parse_args()
+
+    base = zipf_names(args.keyspace, args.length, args.zipf_s)
+    traces = {
+        'zipf': base,
+        f'zipf+{args.flood:.0%} flood': with_random_subdomains(base, args.flood),
+    }
+    print(f"ключей {args.keyspace}, запросов {args.length}, ёмкость {args.capacity}, s={args.zipf_s}")
+    print(f"{'трасса':<16} {'политика':<14} {'hit rate':>9} {'вытеснено':>10} {'отклонено':>10} {'мкс/запрос':>11}")
+    for trace_name, names in traces.items():
+        for policy in (LRUPolicy, TinyLFUPolicy):
+            stats = replay(names, policy, args.capacity)
+            print(f"{trace_name:<16} {policy.__name__:<14} {stats['hit_rate']:>9.1%} {stats['evictions']:>10} "
+                  f"{stats['rejected']:>10} {stats['us_per_query']:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Память на одну закэшированную запись: прежнее представление против текущего.
+
+«До» — frozen dataclass с __dict__ и expiration_time, кэш из двух словарей
+name_to_records / value_to_names. «После» — DNSRecord со __slots__,
+интернированные имена и DNSCache с ключом (имя, тип, класс).
+Каждый вариант измеряется в отдельном процессе по приросту RSS.
+
+Запуск: python -m DnsServer.bench.bench_memory --records 1000000
+"""
+import argparse
+import multiprocessing
+import socket
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+
+from DnsServer.main.cache import DNSCache
+from DnsServer.main.dns_packet import DNSPacket, DNSQuestion, DNSRecord, DNSType
+
+
+@dataclass(frozen=True)
+class LegacyRecord:
+    name: str
+    type: int
+    cls: int
+    ttl: int
+    data: bytes
+
+    def __post_init__(self):
+        object.__setattr__(self, 'expiration_time', time.time() + self.ttl)
+
+    @property
+    def value(self):
+        if self.type == 1:
+            return socket.inet_ntoa(self.data)
+        return self.data.decode('ascii', errors='ignore')
+
+
+def rss_bytes():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def fresh_name(i):
+    # Имя, как после разбора пакета: новый объект строки на каждую запись
+    return ''.join(('host', str(i), '.bench.test'))
+
+
+def rdata(i):
+    return i.to_bytes(4, 'big')
+
+
+def legacy_records(count):
+    return [LegacyRecord(fresh_name(i), 1, 1, 3600, rdata(i)) for i in range(count)]
+
+
+def slots_records(count):
+    return [DNSRecord(fresh_name(i), DNSType.A, 1, 3600, rdata(i)) for i in range(count)]
+
+
+def legacy_cache(count):
+    name_to_records = defaultdict(set)
+    value_to_names = defaultdict(set)
+    for i in range(count):
+        record = LegacyRecord(fresh_name(i), 1, 1, 3600, rdata(i))
+        name = record.name.lower()
+        name_to_records[name].add(record)
+        value_to_names[record.value].add(name)
+    return name_to_records, value_to_names
+
+
+def current_cache(count):
+    cache = DNSCache(None, max_entries=count * 2, max_bytes=1 << 42)
+    for i in range(count):
+        name = fresh_name(i)
+        record = DNSRecord(name, DNSType.A, 1, 3600, rdata(i))
+        cache.update(DNSPacket(0, 0x8180, [DNSQuestion(name, DNSType.A, 1)], [record], [], []))
+    return cache
+
+
+VARIANTS = {
+    'записи: dataclass с __dict__': legacy_records,
+    'записи: DNSRecord со __slots__': slots_records,
+    'кэш: прежний (2 словаря)': legacy_cache,
+    'кэш: DNSCache': current_cache,
+}
+
+
+def _measure(args):
+    name, count = args
+    before = rss_bytes()
+    data = VARIANTS[name](count)
+    used = rss_bytes() - before
+    del data
+    return used / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Память на закэшированную запись')
+    parser.add_argument('--records', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f"записей: {args.records}")
+    ctx = multiprocessing.get_context('fork')
+    for name in VARIANTS:
+        with ctx.Pool(1) as pool:
+            per_record = pool.map(_measure, [(name, args.records)])[0]
+        print(f"{name:<34} {per_record:8.0f} байт/запись")
+
+
+if __name__ == '__main__':
+    main()
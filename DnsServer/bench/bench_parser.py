@@ -0,0 +1,168 @@
+"""Пропускная способность парсера DNSPacket (пакетов в секунду).
+
+Корпус по умолчанию — синтетические ответы типичных форм: A/AAAA, CNAME-цепочки,
+MX с glue, делегирования NS и NXDOMAIN с SOA, все со сжатием имён.
+Реальные ответы можно передать через --pcap: захват tcpdump -w (например,
+tcpdump -i any -w dns.pcap udp src port 53), из которого берутся UDP-ответы
+с порта 53, — или через --corpus: файл из сообщений с 2-байтовым префиксом
+длины, как в DNS поверх TCP.
+
+Запуск: python -m DnsServer.bench.bench_parser [--packets N] [--corpus FILE | --pcap FILE]
+"""
+import argparse
+import random
+import struct
+import time
+
+from DnsServer.main.dns_packet import DNSPacket, DNSQuestion, DNSRecord, DNSType, encode_name
+
+try:
+    import dns.message
+except ImportError:  # dnspython нужен только для сравнения
+    dns = None
+
+
+def synthetic_response(rng, index):
+    zone = f"zone{rng.randrange(500)}.{rng.choice(['com', 'net', 'org', 'ru'])}"
+    name = f"host{index}.{zone}"
+    ttl = rng.randrange(30, 86400)
+    kind = rng.randrange(6)
+    answers, authorities, additionals = [], [], []
+    qtype, flags = DNSType.A, 0x8180
+    if kind == 0:
+        answers = [DNSRecord(name, DNSType.A, 1, ttl, rng.randbytes(4)) for _ in range(rng.randint(1, 4))]
+    elif kind == 1:
+        qtype = DNSType.AAAA
+        answers = [DNSRecord(name, DNSType.AAAA, 1, ttl, rng.randbytes(16)) for _ in range(rng.randint(1, 2))]
+    elif kind == 2:
+        target = f"edge{index % 50}.cdn.{zone}"
+        answers = [DNSRecord(name, DNSType.CNAME, 1, ttl, encode_name(target)),
+                   DNSRecord(target, DNSType.A, 1, ttl, rng.randbytes(4)),
+                   DNSRecord(target, DNSType.A, 1, ttl, rng.randbytes(4))]
+    elif kind == 3:
+        qtype, name = DNSType.MX, zone
+        for i in range(rng.randint(1, 3)):
+            exchange = f"mx{i}.{zone}"
+            answers.append(DNSRecord(zone, DNSType.MX, 1, ttl, struct.pack('!H', 10 * i) + encode_name(exchange)))
+            additionals.append(DNSRecord(exchange, DNSType.A, 1, ttl, rng.randbytes(4)))
+    elif kind == 4:
+        flags = 0x8100
+        for i in range(4):
+            server = f"ns{i}.{zone}"
+            authorities.append(DNSRecord(zone, DNSType.NS, 1, ttl, encode_name(server)))
+            additionals.append(DNSRecord(server, DNSType.A, 1, ttl, rng.randbytes(4)))
+    else:
+        flags = 0x8183
+        soa = encode_name(f"ns0.{zone}") + encode_name(f"hostmaster.{zone}") + struct.pack('!IIIII', 1, 7200, 3600, 1209600, 300)
+        authorities = [DNSRecord(zone, DNSType.SOA, 1, 300, soa)]
+    packet = DNSPacket(rng.randrange(0x10000), flags, [DNSQuestion(name, qtype, 1)], answers, authorities, additionals)
+    return packet.to_wire()
+
+
+def load_corpus(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    messages, offset = [], 0
+    while offset + 2 <= len(data):
+        length = struct.unpack_from('!H', data, offset)[0]
+        messages.append(data[offset + 2:offset + 2 + length])
+        offset += 2 + length
+    return messages
+
+
+# Длина заголовка канального уровня по linktype pcap: Ethernet, raw IP, Linux cooked (SLL)
+_LINK_HEADERS = {1: 14, 101: 0, 113: 16}
+
+
+def load_pcap(path):
+    """Ответы DNS (UDP с порта 53, бит QR) из файла pcap; pcapng сначала переводится
+    в pcap: editcap -F pcap dns.pcapng dns.pcap"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] in (b'\xd4\xc3\xb2\xa1', b'\x4d\x3c\xb2\xa1'):
+        order = '<'
+    elif data[:4] in (b'\xa1\xb2\xc3\xd4', b'\xa1\xb2\x3c\x4d'):
+        order = '>'
+    else:
+        raise ValueError(f"{path}: не pcap")
+    linktype = struct.unpack_from(order + 'I', data, 20)[0] & 0xFFFF
+    if linktype not in _LINK_HEADERS:
+        raise ValueError(f"{path}: неподдерживаемый linktype {linktype}")
+    messages, offset = [], 24
+    while offset + 16 <= len(data):
+        captured = struct.unpack_from(order + 'I', data, offset + 8)[0]
+        frame = data[offset + 16:offset + 16 + captured]
+        offset += 16 + captured
+        message = _dns_response(frame, linktype)
+        if message is not None:
+            messages.append(message)
+    return messages
+
+
+def _dns_response(frame, linktype):
+    start = _LINK_HEADERS[linktype]
+    if linktype == 1 and frame[12:14] == b'\x81\x00':
+        start += 4  # метка VLAN
+    ip = frame[start:]
+    if len(ip) < 20:
+        return None
+    if ip[0] >> 4 == 4:
+        if ip[9] != 17 or struct.unpack_from('!H', ip, 6)[0] & 0x3FFF:
+            return None  # не UDP или фрагмент
+        udp = ip[(ip[0] & 0x0F) * 4:]
+    elif ip[0] >> 4 == 6 and len(ip) >= 48 and ip[6] == 17:
+        udp = ip[40:]
+    else:
+        return None
+    if len(udp) < 20 or struct.unpack_from('!H', udp, 0)[0] != 53:
+        return None
+    message = udp[8:struct.unpack_from('!H', udp, 4)[0]]
+    return message if len(message) >= 12 and message[2] & 0x80 else None
+
+
+def throughput(fn, corpus, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for wire in corpus:
+            fn(wire)
+    return len(corpus) * rounds / (time.perf_counter() - started)
+
+
+def parse_full(wire):
+    packet = DNSPacket.parse(wire)
+    packet.answers  # секции разбираются при первом обращении
+    return packet
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пропускная способность парсера DNS пакетов')
+    parser.add_argument('--packets', type=int, default=20000, help='размер синтетического корпуса')
+    sources = parser.add_mutually_exclusive_group()
+    sources.add_argument('--corpus', help='файл с ответами (2 байта длины + сообщение)')
+    sources.add_argument('--pcap', help='захват tcpdump -w с ответами DNS по UDP')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+    elif args.pcap:
+        corpus = load_pcap(args.pcap)
+    else:
+        rng = random.Random(1)
+        corpus = [synthetic_response(rng, i) for i in range(args.packets)]
+    if not corpus:
+        parser.error('в корпусе нет ответов DNS')
+    print(f"корпус: {len(corpus)} пакетов, средний размер {sum(map(len, corpus)) / len(corpus):.0f} байт")
+
+    results = [
+        ('заголовок + вопрос (попадание в кэш)', DNSPacket.parse),
+        ('полный разбор всех секций', parse_full),
+    ]
+    if dns is not None:
+        results.append(('dnspython dns.message.from_wire', dns.message.from_wire))
+    for title, fn in results:
+        print(f"{title:40s} {throughput(fn, corpus, args.rounds):10.0f} пакетов/с")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Время сохранения и запуска кэша: снимок с mmap-индексом против полной выгрузки pickle.
+
+Запуск: python -m DnsServer.bench.bench_persistence --records 1000000
+"""
+import argparse
+import os
+import pickle
+import random
+import tempfile
+import time
+
+from DnsServer.main.cache import DNSCache
+from DnsServer.main.dns_packet import DNSPacket, DNSQuestion, DNSRecord, DNSType
+
+
+def fill(cache, count):
+    for i in range(count):
+        name = f'host{i}.bench.test'
+        record = DNSRecord(name, DNSType.A, 1, 86400, i.to_bytes(4, 'big'))
+        cache.update(DNSPacket(0, 0x8180, [DNSQuestion(name, DNSType.A, 1)], [record], [], []))
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк сохранения и загрузки кэша')
+    parser.add_argument('--records', type=int, default=1_000_000)
+    parser.add_argument('--lookups', type=int, default=10_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'cache.snapshot')
+        cache = DNSCache(path, max_entries=args.records * 2, max_bytes=1 << 42)
+        fill(cache, args.records)
+        cache.pending.clear()  # журнал не нужен: сразу пишем снимок
+        _, save_time = timed(cache.save)
+
+        # Прежний формат для сравнения: полный список записей в pickle
+        pickle_path = os.path.join(tmp, 'cache.pickle')
+        entries = [(key, entry.wire, entry.ttl_offsets, entry.question_end, entry.stored_at, entry.expires)
+                   for key, entry in cache.entries.items()]
+        _, pickle_save_time = timed(lambda: pickle.dump(entries, open(pickle_path, 'wb')))
+        del entries, cache
+
+        restored, start_time = timed(lambda: DNSCache(path, max_entries=args.records * 2, max_bytes=1 << 42))
+        names = [f'host{random.randrange(args.records)}.bench.test' for _ in range(args.lookups)]
+        requests = [DNSPacket(1, 0x0100, [DNSQuestion(name, DNSType.A, 1)], [], [], []) for name in names]
+        _, lookup_time = timed(lambda: [restored.get_wire(request) for request in requests])
+        _, pickle_load_time = timed(lambda: pickle.load(open(pickle_path, 'rb')))
+
+        print(f"записей: {args.records}, снимок {os.path.getsize(path) / 2**20:.1f} МиБ, "
+              f"pickle {os.path.getsize(pickle_path) / 2**20:.1f} МиБ")
+        print(f"сохранение снимка:            {save_time:8.2f} с")
+        print(f"сохранение pickle:            {pickle_save_time:8.2f} с")
+        print(f"запуск со снимком (mmap):     {start_time * 1000:8.2f} мс")
+        print(f"загрузка pickle:              {pickle_load_time:8.2f} с")
+        print(f"первое чтение из снимка:      {lookup_time / args.lookups * 1e6:8.2f} мкс/запрос")
+
+
+if __name__ == '__main__':
+    main()
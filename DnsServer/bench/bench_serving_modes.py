@@ -0,0 +1,110 @@
+"""Сравнение пропускной способности режимов сервера (threaded и asyncio).
+
+Для каждого режима сервер запускается отдельным процессом на loopback
+с локальным фейковым upstream, после чего на него подаётся нагрузка.
+Кроме задержек у процесса сервера снимаются CPU-время и RSS (из /proc).
+
+Запуск: python -m DnsServer.bench.bench_serving_modes --duration 5
+"""
+import argparse
+import contextlib
+import itertools
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from DnsServer.bench.fake_upstream import FakeUpstream
+from DnsServer.bench.loadgen import LoadGenerator
+
+HEADER = (f"{'режим':<10} {'QPS':>10} {'p50, мс':>9} {'p99, мс':>9} {'p999, мс':>9} {'потери':>8} "
+          f"{'CPU':>7} {'RSS, МБ':>8}")
+
+
+@contextlib.contextmanager
+def server_process(mode, port, upstream, extra_args=()):
+    """Сервер в отдельном процессе; останавливается по SIGINT при выходе"""
+    with tempfile.TemporaryDirectory() as tmp:
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'DnsServer.run_server', '--mode', mode, '--port', str(port),
+             '--upstream', f'{upstream[0]}:{upstream[1]}', '--cache-file', os.path.join(tmp, 'cache'),
+             *extra_args],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            time.sleep(1.0)
+            yield process
+        finally:
+            process.send_signal(signal.SIGINT)
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def process_usage(pid):
+    """CPU-время процесса (user + system, секунды), текущий и пиковый RSS (байты);
+    None, если /proc недоступен"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # Имя процесса в скобках может содержать пробелы: поля считаем после ')'
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/status') as f:
+            status = dict(line.split(':', 1) for line in f if ':' in line)
+    except OSError:
+        return None
+    ticks = os.sysconf('SC_CLK_TCK')
+    return {
+        'cpu_s': (int(fields[11]) + int(fields[12])) / ticks,  # utime, stime
+        'rss_bytes': int(status['VmRSS'].split()[0]) * 1024,
+        'peak_rss_bytes': int(status['VmHWM'].split()[0]) * 1024,
+    }
+
+
+def run_mode(mode, port, upstream, names, args, trace=None, extra_args=()):
+    """Нагрузка на сервер в режиме mode: по кругу по именам или по трассе номеров имён"""
+    with server_process(mode, port, upstream, extra_args) as process:
+        # Прогрев: первый проход по именам заполняет кэш
+        LoadGenerator(('127.0.0.1', port), names, 1, 8, 1.0).run()
+        before = process_usage(process.pid)
+        result = LoadGenerator(('127.0.0.1', port), names, args.clients, args.window, args.duration,
+                               trace=itertools.cycle(trace) if trace else None).run()
+        after = process_usage(process.pid)
+    if before and after:
+        result['cpu_s'] = after['cpu_s'] - before['cpu_s']
+        result['cpu_percent'] = result['cpu_s'] / result['duration_s'] * 100
+        result['rss_mb'] = after['rss_bytes'] / 2 ** 20
+        result['peak_rss_mb'] = after['peak_rss_bytes'] / 2 ** 20
+    return result
+
+
+def format_result(title, result):
+    line = (f"{title:<10} {result['qps']:>10.0f} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+            f"{result['p999_ms']:>9.2f} {result['lost']:>8}")
+    if 'cpu_percent' in result:
+        line += f" {result['cpu_percent']:>6.0f}% {result['rss_mb']:>8.1f}"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение режимов обслуживания DNS сервера')
+    parser.add_argument('--modes', nargs='+', default=['threaded', 'asyncio'])
+    parser.add_argument('--port', type=int, default=53600)
+    parser.add_argument('--names', type=int, default=1000)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--window', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    upstream = FakeUpstream().start()
+    names = [f'host{i}.bench.test' for i in range(args.names)]
+    print(HEADER)
+    for mode in args.modes:
+        print(format_result(mode, run_mode(mode, args.port, upstream.address, names, args)))
+    upstream.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""p99 задержки на повторяемой трассе: без и с фоновым обновлением и serve-stale.
+
+Upstream отвечает с задержкой и коротким TTL, поэтому популярные записи
+постоянно истекают. Первая фаза — обычная работа, вторая — upstream
+перестаёт отвечать. Сервер запускается отдельным процессом для каждого варианта.
+
+Запуск: python -m DnsServer.bench.bench_stale --duration 10
+"""
+import argparse
+import itertools
+
+from DnsServer.bench.bench_serving_modes import server_process
+from DnsServer.bench.fake_upstream import FakeUpstream
+from DnsServer.bench.loadgen import LoadGenerator
+from DnsServer.bench.traces import zipf_ranks
+
+VARIANTS = {
+    'без prefetch/stale': ['--no-prefetch', '--stale-max-age', '0'],
+    'prefetch + stale': [],
+}
+
+
+def replay(port, names, ranks, duration, args):
+    generator = LoadGenerator(('127.0.0.1', port), names, args.clients, args.window, duration,
+                              timeout=args.timeout, trace=itertools.cycle(ranks))
+    return generator.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Задержка при истечении TTL и недоступности upstream')
+    parser.add_argument('--mode', default='asyncio')
+    parser.add_argument('--port', type=int, default=53610)
+    parser.add_argument('--names', type=int, default=500)
+    parser.add_argument('--ttl', type=int, default=3, help='TTL ответов upstream, секунды')
+    parser.add_argument('--latency', type=float, default=0.05, help='задержка upstream, секунды')
+    parser.add_argument('--clients', type=int, default=2)
+    parser.add_argument('--window', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=2.0, help='ожидание ответа клиентом, секунды')
+    parser.add_argument('--duration', type=float, default=10.0, help='длительность обычной фазы')
+    parser.add_argument('--outage', type=float, default=5.0, help='длительность фазы без upstream')
+    args = parser.parse_args()
+
+    names = [f'host{i}.bench.test' for i in range(args.names)]
+    ranks = zipf_ranks(len(names), 200_000)
+    print(f"{'вариант':<20} {'фаза':<10} {'QPS':>8} {'p50, мс':>9} {'p99, мс':>9} {'p999, мс':>9} {'потери':>7}")
+    for title, extra_args in VARIANTS.items():
+        upstream = FakeUpstream(ttl=args.ttl, latency=args.latency).start()
+        with server_process(args.mode, args.port, upstream.address, extra_args):
+            replay(args.port, names, ranks, 1.0, args)  # прогрев
+            phases = [('обычная', replay(args.port, names, ranks, args.duration, args))]
+            upstream.silent = True
+            phases.append(('сбой', replay(args.port, names, ranks, args.outage, args)))
+        upstream.stop()
+        for phase, result in phases:
+            print(f"{title:<20} {phase:<10} {result['qps']:>8.0f} {result['p50_ms']:>9.2f} "
+                  f"{result['p99_ms']:>9.2f} {result['p999_ms']:>9.2f} {result['lost']:>7}")
+
+
+if __name__ == '__main__':
+    main()
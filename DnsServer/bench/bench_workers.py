@@ -0,0 +1,57 @@
+"""Масштабирование QPS по числу процессов-воркеров (--workers 1..N).
+
+Нагрузку создают несколько процессов-генераторов, у каждого свои сокеты,
+поэтому SO_REUSEPORT распределяет их запросы по разным воркерам.
+
+Запуск: python -m DnsServer.bench.bench_workers --max-workers 4
+"""
+import argparse
+import multiprocessing
+import os
+
+from DnsServer.bench.bench_serving_modes import server_process
+from DnsServer.bench.fake_upstream import FakeUpstream
+from DnsServer.bench.loadgen import LoadGenerator
+
+
+def _generate(task):
+    port, names, clients, window, duration = task
+    return LoadGenerator(('127.0.0.1', port), names, clients, window, duration).run()
+
+
+def run_workers(mode, workers, port, upstream, names, args):
+    with server_process(mode, port, upstream, ['--workers', str(workers)]):
+        LoadGenerator(('127.0.0.1', port), names, 4, 8, 1.0).run()
+        tasks = [(port, names, args.clients, args.window, args.duration)] * args.generators
+        with multiprocessing.Pool(args.generators) as pool:
+            results = pool.map(_generate, tasks)
+    return sum(result['qps'] for result in results), max(result['p99_ms'] for result in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Масштабирование DNS сервера по ядрам')
+    parser.add_argument('--mode', default='asyncio', choices=['threaded', 'asyncio'])
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    parser.add_argument('--generators', type=int, default=max(os.cpu_count() // 2, 1),
+                        help='Процессов генератора нагрузки')
+    parser.add_argument('--port', type=int, default=53610)
+    parser.add_argument('--names', type=int, default=1000)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--window', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    upstream = FakeUpstream().start()
+    names = [f'host{i}.bench.test' for i in range(args.names)]
+    print(f"ядер: {os.cpu_count()}, режим: {args.mode}, генераторов: {args.generators}")
+    print(f"{'воркеров':<10} {'QPS':>10} {'p99, мс':>9}")
+    workers = 1
+    while workers <= args.max_workers:
+        qps, p99 = run_workers(args.mode, workers, args.port, upstream.address, names, args)
+        print(f"{workers:<10} {qps:>10.0f} {p99:>9.2f}")
+        workers *= 2
+    upstream.stop()
+
+
+if __name__ == '__main__':
+    main()
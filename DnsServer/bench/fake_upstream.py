@@ -0,0 +1,152 @@
+import random
+import socket
+import threading
+
+from DnsServer.main.dns_packet import MAX_UDP_PAYLOAD, DNSPacket, DNSRecord, DNSType, patch_id, truncate
+from DnsServer.main.resolver import is_subdomain
+
+
+class FakeUpstream:
+    """Локальный UDP-ответчик, изображающий вышестоящий DNS сервер.
+
+    На любой A-запрос отвечает records A-записями 192.0.2.1, 192.0.2.2, ...
+    с заданным TTL, при latency > 0 — с задержкой в секундах. Пока silent=True,
+    запросы молча отбрасываются (имитация недоступного upstream), а при loss > 0
+    теряется такая доля запросов (случайно, но воспроизводимо).
+
+    UDP-ответ, не помещающийся в 512 байт или в размер из OPT запроса,
+    отправляется обрезанным с флагом TC; при tcp=True на том же порту
+    принимаются запросы по TCP (в том числе конвейером).
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, ttl=300, latency=0.0, records=1, tcp=False, loss=0.0, seed=1):
+        self.ttl = ttl
+        self.latency = latency
+        self.loss = loss
+        self.rng = random.Random(seed)
+        self.records = records
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.address = self.sock.getsockname()
+        self.queries = 0
+        self.tcp_queries = 0
+        self.silent = False
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.listener = None
+        if tcp:
+            self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.listener.bind(self.address)
+            self.listener.listen(16)
+
+    def start(self):
+        self.thread.start()
+        if self.listener is not None:
+            threading.Thread(target=self._serve_tcp, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.sock.close()
+        if self.listener is not None:
+            self.listener.close()
+
+    def answer(self, data):
+        request = DNSPacket.parse(data)
+        response = request.create_response()
+        question = request.questions[0]
+        for i in range(self.records):
+            address = bytes((192, 0, 2 + i // 254, 1 + i % 254))
+            response.add_answer(DNSRecord(question.name, DNSType.A, 1, self.ttl, address))
+        return patch_id(response.to_wire(), request.id)
+
+    def udp_answer(self, data):
+        wire = self.answer(data)
+        if len(wire) > (DNSPacket.parse(data).edns_payload() or MAX_UDP_PAYLOAD):
+            return truncate(wire)
+        return wire
+
+    def _serve(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(4096)
+            except OSError:
+                return
+            self.queries += 1
+            if self.silent or (self.loss and self.rng.random() < self.loss):
+                continue
+            if self.latency:
+                threading.Timer(self.latency, self._reply, args=(data, addr)).start()
+            else:
+                self._reply(data, addr)
+
+    def _reply(self, data, addr):
+        try:
+            self.sock.sendto(self.udp_answer(data), addr)
+        except OSError:
+            pass
+
+    def _serve_tcp(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _serve_connection(self, conn):
+        with conn:
+            stream = conn.makefile('rb')
+            while True:
+                try:
+                    length = stream.read(2)
+                    data = stream.read(int.from_bytes(length, 'big')) if len(length) == 2 else b''
+                except OSError:
+                    return
+                if not data:
+                    return
+                self.tcp_queries += 1
+                wire = self.answer(data)
+                try:
+                    conn.sendall(len(wire).to_bytes(2, 'big') + wire)
+                except OSError:
+                    return
+
+
+class FakeAuthority(FakeUpstream):
+    """Авторитетный сервер зоны origin для проверки итеративного резолвера без сети.
+
+    records — записи зоны: ответы, NS-записи делегированных поддоменов и их glue.
+    Отвечает с флагом AA, на имена в делегированных поддоменах — направлением
+    (NS в authority, glue в additional), на отсутствующие имена — NXDOMAIN с SOA.
+    """
+
+    def __init__(self, origin, records, host='127.0.0.1', port=0):
+        super().__init__(host, port)
+        self.origin = origin
+        self.records = records
+        self.soa = DNSRecord(origin, DNSType.SOA, 1, 300,
+                             b'\x00\x00' + bytes(20))  # корневые mname/rname и нулевые счётчики
+
+    def answer(self, data):
+        request = DNSPacket.parse(data)
+        question = request.questions[0]
+        name = question.name.lower()
+        response = DNSPacket(request.id, 0x8400, request.questions, [], [], [])  # QR + AA
+
+        cuts = {record.name for record in self.records
+                if record.type == DNSType.NS and record.name != self.origin and is_subdomain(name, record.name)}
+        if cuts:
+            cut = max(cuts, key=len)
+            response.flags = 0x8000  # направление — не авторитетный ответ
+            response.authorities = [r for r in self.records if r.type == DNSType.NS and r.name == cut]
+            targets = {r.value for r in response.authorities}
+            response.additionals = [r for r in self.records if r.type == DNSType.A and r.name in targets]
+        else:
+            owned = [record for record in self.records if record.name == name]
+            response.answers = [r for r in owned if r.type == question.type] \
+                or [r for r in owned if r.type == DNSType.CNAME]
+            if not owned:
+                response.flags |= 3  # NXDOMAIN
+            if not response.answers:
+                response.authorities = [self.soa]
+        return response.to_wire()
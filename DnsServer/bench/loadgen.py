@@ -0,0 +1,148 @@
+"""Генератор нагрузки по UDP для DNS сервера на loopback.
+
+Каждый клиент держит окно из `window` неотвеченных запросов и отправляет
+следующий запрос сразу после ответа (замкнутый цикл).
+
+Запуск: python -m DnsServer.bench.loadgen --port 53535 --duration 5
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+
+from DnsServer.main.dns_packet import DNSPacket, DNSQuestion, DNSType
+
+
+def build_queries(names):
+    """Заранее сериализованные запросы; ID подставляется при отправке"""
+    return [DNSPacket(0, 0x0100, [DNSQuestion(name, DNSType.A, 1)], [], [], []).to_wire()[2:] for name in names]
+
+
+class _Client(asyncio.DatagramProtocol):
+    def __init__(self, generator):
+        self.generator = generator
+        self.transport = None
+        self.pending = {}
+        self.ids = itertools.cycle(random.sample(range(65536), 65536))
+
+    def connection_made(self, transport):
+        self.transport = transport
+        for _ in range(self.generator.window):
+            self.send()
+
+    def send(self):
+        if not self.generator.running:
+            return
+        query_id = next(self.ids)
+        self.pending[query_id] = time.perf_counter()
+        self.transport.sendto(query_id.to_bytes(2, 'big') + self.generator.next_query())
+        self.generator.sent += 1
+
+    def datagram_received(self, data, addr):
+        sent_at = self.pending.pop(int.from_bytes(data[:2], 'big'), None)
+        if sent_at is None:
+            return
+        self.generator.record(time.perf_counter() - sent_at)
+        self.send()
+
+    def expire(self, now, timeout):
+        """Считает потерянными запросы старше timeout и отправляет замену"""
+        lost = [query_id for query_id, sent_at in self.pending.items() if now - sent_at > timeout]
+        for query_id in lost:
+            del self.pending[query_id]
+            self.generator.lost += 1
+            self.send()
+
+
+class LoadGenerator:
+    def __init__(self, address, names, clients=4, window=16, duration=5.0, timeout=1.0, trace=None):
+        self.address = address
+        self.queries = build_queries(names)
+        self.trace = trace
+        self.clients = clients
+        self.window = window
+        self.duration = duration
+        self.timeout = timeout
+        self.running = False
+        self.sent = 0
+        self.lost = 0
+        self.latencies = []
+        self._position = 0
+
+    def next_query(self):
+        if self.trace is not None:
+            index = next(self.trace)
+        else:
+            index = self._position % len(self.queries)
+            self._position += 1
+        return self.queries[index]
+
+    def record(self, latency):
+        self.latencies.append(latency)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        self.running = True
+        clients = []
+        for _ in range(self.clients):
+            _, client = await loop.create_datagram_endpoint(lambda: _Client(self), remote_addr=self.address)
+            clients.append(client)
+
+        started = time.perf_counter()
+        while time.perf_counter() - started < self.duration:
+            await asyncio.sleep(min(self.timeout / 4, 0.1))
+            now = time.perf_counter()
+            for client in clients:
+                client.expire(now, self.timeout)
+        self.running = False
+        elapsed = time.perf_counter() - started
+        for client in clients:
+            client.transport.close()
+        return elapsed
+
+    def run(self):
+        """Запускает нагрузку и возвращает сводку"""
+        elapsed = asyncio.run(self._run())
+        return summarize(self.latencies, elapsed, self.sent, self.lost)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def summarize(latencies, elapsed, sent, lost):
+    latencies = sorted(latencies)
+    return {
+        'sent': sent,
+        'received': len(latencies),
+        'lost': lost,
+        'qps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'p999_ms': percentile(latencies, 0.999) * 1000,
+        'duration_s': elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Генератор нагрузки для DNS сервера')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=53535)
+    parser.add_argument('--names', type=int, default=1000, help='Количество различных имён в запросах')
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--window', type=int, default=16, help='Неотвеченных запросов на клиента')
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    names = [f'host{i}.bench.test' for i in range(args.names)]
+    generator = LoadGenerator((args.host, args.port), names, args.clients, args.window, args.duration)
+    result = generator.run()
+    print(' '.join(f'{key}={value:.2f}' if isinstance(value, float) else f'{key}={value}'
+                   for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
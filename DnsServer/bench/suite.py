@@ -0,0 +1,177 @@
+"""Набор бенчмарков с сохранением результатов для отслеживания регрессий.
+
+Всё работает на loopback без внешней сети:
+- parser  — пакетов/с DNSPacket.parse (только заголовок и с разбором секций);
+- cache   — DNSCache: get_wire при попадании и промахе, update;
+- server  — DNSServer.handle_request при попадании в кэш;
+- serving — нагрузка на сервер в каждом режиме (отдельный процесс) от нескольких
+  клиентов по трассе Ципфа или записанной трассе имён (--trace), upstream с
+  задержкой и потерями; QPS, p50/p99/p999, CPU и RSS процесса сервера.
+
+Каждый запуск дописывает одну JSON-строку в --output (по умолчанию
+bench-results.jsonl) и печатает изменения относительно предыдущей строки.
+
+Запуск: python -m DnsServer.bench.suite [--only parser cache] [--trace FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+
+from DnsServer.bench.bench_cache_hit import NullSocket, make_query, measure
+from DnsServer.bench.bench_parser import parse_full, synthetic_response, throughput
+from DnsServer.bench.bench_serving_modes import HEADER, format_result, run_mode
+from DnsServer.bench.fake_upstream import FakeUpstream
+from DnsServer.bench.traces import load_trace, zipf_ranks
+from DnsServer.main.cache import DNSCache
+from DnsServer.main.dns_packet import DNSPacket
+from DnsServer.main.server import DNSServer
+
+SECTIONS = ('parser', 'cache', 'server', 'serving')
+
+
+def bench_parser(args):
+    rng = random.Random(1)
+    corpus = [synthetic_response(rng, i) for i in range(args.packets)]
+    return {
+        'header_pps': throughput(DNSPacket.parse, corpus, 3),
+        'full_pps': throughput(parse_full, corpus, 3),
+    }
+
+
+def bench_cache(args):
+    cache = DNSCache(':memory:')
+    rng = random.Random(2)
+    responses = [DNSPacket.parse(synthetic_response(rng, i)) for i in range(args.iterations)]
+    started = time.perf_counter()
+    for response in responses:
+        cache.update(response)
+    update_us = (time.perf_counter() - started) / len(responses) * 1e6
+
+    answered = next(response for response in responses if response.answers)
+    hit = DNSPacket(0x4242, 0x0100, answered.questions, [], [], [])
+    hit.raw_data = hit.to_wire()
+    miss = DNSPacket.parse(make_query('absent.bench.test'))
+    return {
+        'update_us': update_us,
+        'hit_us': measure(lambda i: cache.get_wire(hit), args.iterations),
+        'miss_us': measure(lambda i: cache.get_wire(miss), args.iterations),
+        'entries': len(cache.entries),
+    }
+
+
+def bench_server(args):
+    upstream = FakeUpstream().start()
+    server = DNSServer(':memory:')
+    server.upstreams = [upstream.address]
+    sock, addr = NullSocket(), ('127.0.0.1', 5353)
+    query = make_query('hit.bench.test')
+    server.handle_request(sock, query, addr)  # прогрев кэша
+    hit_us = measure(lambda i: server.handle_request(sock, query, addr), args.iterations)
+    server.stop()
+    upstream.stop()
+    return {'hit_us': hit_us}
+
+
+def bench_serving(args):
+    if args.trace:
+        names, trace = load_trace(args.trace)
+    else:
+        names = [f'host{i}.bench.test' for i in range(args.names)]
+        trace = zipf_ranks(len(names), 200_000, args.zipf_s)
+    upstream = FakeUpstream(ttl=args.ttl, latency=args.upstream_latency, loss=args.upstream_loss).start()
+    results = {}
+    print(HEADER)
+    for mode in args.modes:
+        results[mode] = run_mode(mode, args.port, upstream.address, names, args, trace)
+        print(format_result(mode, results[mode]))
+    upstream.stop()
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def flatten(results, prefix=''):
+    """{'cache': {'hit_us': 1.0}} -> {'cache.hit_us': 1.0}"""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)):
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def previous_run(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            lines = [line for line in f if line.strip()]
+    except FileNotFoundError:
+        return None
+    return json.loads(lines[-1]) if lines else None
+
+
+def print_changes(previous, current):
+    before, after = flatten(previous['results']), flatten(current['results'])
+    print(f"\nизменения относительно {previous['environment'].get('commit') or previous['environment']['time']}:")
+    for key, value in after.items():
+        if before.get(key):
+            print(f"  {key:<32} {before[key]:>12.2f} -> {value:>12.2f} ({(value / before[key] - 1) * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарки DNS сервера с сохранением результатов в JSON')
+    parser.add_argument('--only', nargs='+', choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument('--output', default='bench-results.jsonl', help='файл истории результатов (JSON Lines)')
+    parser.add_argument('--packets', type=int, default=20000, help='размер корпуса для parser')
+    parser.add_argument('--iterations', type=int, default=20000, help='итераций для cache и server')
+    parser.add_argument('--modes', nargs='+', default=['threaded', 'asyncio'])
+    parser.add_argument('--port', type=int, default=53620)
+    parser.add_argument('--trace', help='записанная трасса: одно имя в строке')
+    parser.add_argument('--names', type=int, default=10000, help='имён в трассе Ципфа')
+    parser.add_argument('--zipf-s', type=float, default=1.0)
+    parser.add_argument('--ttl', type=int, default=30, help='TTL ответов upstream, секунды')
+    parser.add_argument('--upstream-latency', type=float, default=0.02, help='задержка upstream, секунды')
+    parser.add_argument('--upstream-loss', type=float, default=0.0, help='доля потерянных upstream запросов')
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--window', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    benches = {'parser': bench_parser, 'cache': bench_cache, 'server': bench_server, 'serving': bench_serving}
+    results = {}
+    for section in args.only:
+        print(f"[{section}]")
+        results[section] = benches[section](args)
+        if section != 'serving':
+            print('  ' + ', '.join(f'{key}={value:.2f}' for key, value in results[section].items()))
+
+    params = {key: value for key, value in vars(args).items() if key != 'output'}
+    run = {'environment': environment(), 'params': params, 'results': results}
+    previous = previous_run(args.output)
+    with open(args.output, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(run, ensure_ascii=False) + '\n')
+    print(f"\nрезультаты дописаны в {args.output}")
+    if previous is not None:
+        print_changes(previous, run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+import bisect
+import itertools
+import random
+
+
+def zipf_ranks(keyspace, length, s=1.0, seed=1):
+    """Последовательность рангов 0..keyspace-1 с распределением Ципфа"""
+    rng = random.Random(seed)
+    weights = [1 / (rank ** s) for rank in range(1, keyspace + 1)]
+    cdf = list(itertools.accumulate(weights))
+    total = cdf[-1]
+    return [bisect.bisect_left(cdf, rng.random() * total) for _ in range(length)]
+
+
+def zipf_names(keyspace, length, s=1.0, seed=1, zone='bench.test'):
+    return [f'host{rank}.{zone}' for rank in zipf_ranks(keyspace, length, s, seed)]
+
+
+def with_random_subdomains(names, fraction, seed=2, zone='flood.test'):
+    """Подмешивает долю одноразовых случайных поддоменов (атака random subdomain)"""
+    rng = random.Random(seed)
+    return [f'{rng.getrandbits(48):012x}.{zone}' if rng.random() < fraction else name for name in names]
+
+
+def load_trace(path):
+    """Записанная трасса: одно имя в строке (первое поле строки, # — комментарий).
+
+    Возвращает список различных имён и последовательность их номеров в порядке
+    запросов — в том же виде, что zipf_ranks, для LoadGenerator(trace=...).
+    """
+    names, index, ranks = [], {}, []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            name = fields[0].rstrip('.').lower()
+            if name not in index:
+                index[name] = len(names)
+                names.append(name)
+            ranks.append(index[name])
+    return names, ranks
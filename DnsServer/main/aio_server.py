@@ -0,0 +1,248 @@
+import asyncio
+
+from DnsServer.main.cache import question_key
+from DnsServer.main.const import (CACHE_MAX_BYTES, CACHE_MAX_ENTRIES, STALE_CLIENT_TIMEOUT, STALE_MAX_AGE,
+                                  TCP_IDLE_TIMEOUT, TCP_PIPELINE_LIMIT)
+from DnsServer.main.dns_packet import DNSPacket
+from DnsServer.main.server import DNSServer
+from DnsServer.main.singleflight import AsyncSingleFlight
+
+try:
+    import uvloop
+except ImportError:  # uvloop необязателен, без него работает стандартный цикл событий
+    uvloop = None
+
+
+class DNSDatagramProtocol(asyncio.DatagramProtocol):
+    """Обработка входящих датаграмм: попадания в кэш отвечаются сразу,
+    промахи разрешаются в отдельной задаче"""
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if not self.server.allow(addr):
+            return
+        metrics = self.server.metrics
+        try:
+            started = metrics.start()
+            request = DNSPacket.parse(data)
+            started = metrics.lap('parse', started)
+            metrics.queries['udp'][request.questions[0].type] += 1
+            wire = self.server.lookup(request)
+            started = metrics.lap('cache', started)
+        except Exception as e:
+            print(f"Ошибка обработки запроса: {e}")
+            return
+
+        if wire is not None:
+            self.send(request, wire, addr, started)
+        else:
+            self.server.spawn(self.resolve(request, addr, started))
+
+    async def resolve(self, request, addr, started):
+        try:
+            response = await self.server.resolve_or_stale_async(request)
+            started = self.server.metrics.lap('resolve', started)
+            self.send(request, self.server.build_reply(request, response), addr, started)
+        except Exception as e:
+            print(f"Ошибка обработки запроса: {e}")
+
+    def send(self, request, wire, addr, started):
+        metrics = self.server.metrics
+        reply = self.server.limit_reply(request, self.server.udp_reply(request, wire), addr)
+        started = metrics.lap('encode', started)
+        if reply is None:
+            return
+        self.transport.sendto(reply, addr)
+        metrics.lap('send', started)
+
+
+class DNSStreamProtocol(asyncio.Protocol):
+    """TCP-соединение клиента (RFC 7766): сообщения с 2-байтовой длиной, запросы могут
+    идти конвейером, ответы пишутся по мере готовности, а не в порядке запросов.
+
+    Одновременно разрешается не больше TCP_PIPELINE_LIMIT промахов соединения: дальше
+    сообщения ждут в буфере, а чтение из сокета приостанавливается. Соединение и каждое
+    сообщение проверяются ограничением частоты; сверх лимита соединение закрывается.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.peer = None
+        self.buffer = bytearray()
+        self.idle = None
+        self.inflight = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.peer = transport.get_extra_info('peername')
+        if not self.server.allow(self.peer):
+            transport.close()
+            return
+        self._touch()
+
+    def connection_lost(self, exc):
+        if self.idle is not None:
+            self.idle.cancel()
+
+    def data_received(self, data):
+        self.buffer += data
+        self._touch()
+        self._process()
+
+    def _process(self):
+        while len(self.buffer) >= 2 and self.inflight < TCP_PIPELINE_LIMIT:
+            length = int.from_bytes(self.buffer[:2], 'big')
+            if len(self.buffer) < 2 + length:
+                break
+            message = bytes(self.buffer[2:2 + length])
+            del self.buffer[:2 + length]
+            if not self.server.allow(self.peer):
+                self.buffer.clear()
+                self.transport.close()
+                return
+            try:
+                request = DNSPacket.parse(message)
+                self.server.metrics.queries['tcp'][request.questions[0].type] += 1
+                wire = self.server.lookup(request)
+            except Exception as e:
+                print(f"Ошибка обработки TCP запроса: {e}")
+                continue
+            if wire is not None:
+                self.transport.write(self.server.tcp_reply(request, wire))
+            else:
+                self.inflight += 1
+                self.server.spawn(self.resolve(request)).add_done_callback(self._resolved)
+        if self.inflight >= TCP_PIPELINE_LIMIT:
+            self.transport.pause_reading()
+
+    def _resolved(self, _):
+        self.inflight -= 1
+        if self.transport.is_closing():
+            return
+        self._process()
+        if self.inflight < TCP_PIPELINE_LIMIT:
+            self.transport.resume_reading()
+
+    async def resolve(self, request):
+        try:
+            response = await self.server.resolve_or_stale_async(request)
+            if not self.transport.is_closing():
+                self.transport.write(self.server.tcp_reply(request, self.server.build_reply(request, response)))
+        except Exception as e:
+            print(f"Ошибка обработки TCP запроса: {e}")
+
+    def _touch(self):
+        """Перезапуск таймера простоя соединения"""
+        if self.idle is not None:
+            self.idle.cancel()
+        self.idle = self.server.loop.call_later(TCP_IDLE_TIMEOUT, self.transport.close)
+
+
+class AsyncDNSServer(DNSServer):
+    """DNS сервер на asyncio: один поток, без создания потока на каждый пакет"""
+
+    def __init__(self, cache_file='data/cache.snapshot', cache_max_entries=CACHE_MAX_ENTRIES,
+                 cache_max_bytes=CACHE_MAX_BYTES, stale_max_age=STALE_MAX_AGE, prefetch=True):
+        super().__init__(cache_file, cache_max_entries, cache_max_bytes, stale_max_age, prefetch)
+        self.loop = None
+        self.inflight = AsyncSingleFlight()
+        self.tasks = set()  # цикл событий хранит на задачи лишь слабые ссылки
+
+    def start(self, port=53):
+        """Запуск DNS сервера на указанном порту"""
+        if uvloop is not None:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.running = True
+            self.cleanup_thread.start()
+            self.cache.start_persistence()
+            self.start_metrics()
+            transport, _ = self.loop.run_until_complete(self.loop.create_datagram_endpoint(
+                lambda: DNSDatagramProtocol(self), local_addr=('0.0.0.0', port), reuse_port=self.reuse_port or None
+            ))
+            tcp_server = self.loop.run_until_complete(self.loop.create_server(
+                lambda: DNSStreamProtocol(self), '0.0.0.0', port, reuse_port=self.reuse_port or None
+            ))
+            print(f"DNS сервер (asyncio) запущен на порту {port}")
+            try:
+                self.loop.run_forever()
+            finally:
+                transport.close()
+                tcp_server.close()
+        except Exception as e:
+            print(f"Не удалось запустить сервер: {e}")
+        finally:
+            self.loop.close()
+            self.stop()
+
+    def spawn(self, coroutine):
+        """Задача в цикле событий, которую не соберёт сборщик мусора до завершения"""
+        task = self.loop.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def resolve_async(self, request):
+        """Разрешение промаха кэша: одновременные одинаковые вопросы ждут один запрос к upstream"""
+        return await self.inflight.do(question_key(request.questions[0]), lambda: self._resolve_and_cache_async(request))
+
+    async def resolve_or_stale_async(self, request):
+        """Как resolve_or_stale(): при наличии просроченного ответа ждём upstream не дольше STALE_CLIENT_TIMEOUT"""
+        if not self.cache.has_stale(request):
+            return await self.resolve_async(request)
+        try:
+            # shield: по таймауту клиенту уходит просроченный ответ, а запрос к upstream продолжается
+            return await asyncio.wait_for(asyncio.shield(self.spawn(self.resolve_async(request))),
+                                          STALE_CLIENT_TIMEOUT)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _resolve_and_cache_async(self, request):
+        response = await self.recursive_resolve_async(request)
+        if response:
+            self.cache.update(response)
+        return response
+
+    def prefetch(self, request):
+        """Фоновое обновление записи задачей в цикле событий (кэш вызывает его из обработчика датаграммы)"""
+        key = self._claim_prefetch(request)
+        if key is not None:
+            self.spawn(self._prefetch_async(key, request))
+
+    async def _prefetch_async(self, key, request):
+        try:
+            await self.resolve_async(request)
+        except Exception as e:
+            print(f"Ошибка фонового обновления записи: {e}")
+        finally:
+            self._release_prefetch(key)
+
+    async def recursive_resolve_async(self, request):
+        """Запрос к вышестоящим серверам без блокировки цикла событий"""
+        try:
+            if self.iterative:
+                # Итеративный проход — несколько последовательных запросов, выполняем его в пуле потоков
+                response = await asyncio.get_running_loop().run_in_executor(None, self.resolver.resolve, request)
+            else:
+                response = await asyncio.wrap_future(self.upstream_client.query(request))
+            if response is None:
+                print("Таймаут при запросе к вышестоящему DNS серверу")
+            return response
+        except Exception as e:
+            print(f"Ошибка рекурсивного разрешения: {e}")
+            return None
+
+    def stop(self):
+        """Остановка сервера"""
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            return
+        super().stop()
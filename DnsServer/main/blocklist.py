@@ -0,0 +1,167 @@
+import heapq
+import socket
+import struct
+from array import array
+from bisect import bisect_left
+from itertools import accumulate, islice
+
+from DnsServer.main.const import BLOCK_TTL
+from DnsServer.main.dns_packet import RCODE_NXDOMAIN, DNSType
+
+_HEADER = struct.Struct('!HHHHHH')
+_SINKHOLE = struct.Struct('!2sHHIH')
+_QUESTION_POINTER = b'\xc0\x0c'
+
+FLAGS_BLOCKED = 0x8080  # QR, RA; RD копируется из запроса
+FILTER_BITS_PER_ENTRY = 16  # ложных срабатываний фильтра с двумя битами на имя около (1 - e^(-2/16))^2 ≈ 1.4%
+ENTRIES_PER_BUCKET = 4      # средний размер диапазона бинарного поиска после каталога
+SORT_CHUNK = 1 << 20        # хеши сортируются кусками и сливаются: пик памяти при загрузке ~16 байт на имя
+
+# Имена из строк hosts-файлов, которые не блокируются
+HOSTS_SKIP = frozenset(('localhost', 'localhost.localdomain', 'local', 'broadcasthost', 'ip6-localhost',
+                        'ip6-loopback', '0.0.0.0'))
+
+
+class Blocklist:
+    """Список блокируемых доменов: блокируется имя и все его поддомены.
+
+    Имена хранятся не строками, а 64-битными хешами в отсортированном
+    array (8 байт на имя). Перед ним стоит фильтр Блума (2 байта на имя,
+    два бита из младшей и старшей половин того же хеша): для суффиксов,
+    которых нет в списке, почти всегда хватает одного-двух чтений байта.
+    Каталог по старшим битам хеша (около байта на имя) сужает бинарный
+    поиск до нескольких элементов. Запрос проверяется по полному имени и по каждому
+    родительскому суффиксу: a.b.ads.com, b.ads.com, ads.com, com.
+
+    Хеши — встроенный hash() строк: он случаен для процесса, поэтому индекс
+    строится при загрузке и не сохраняется. Совпадение хеша считается
+    совпадением имени: при 10 млн имён вероятность ложной блокировки
+    запроса порядка 1e-12.
+
+    Индекс только читается; перезагрузка строит новый объект и подменяет его целиком.
+    """
+
+    def __init__(self, names, sinkholes=()):
+        self.hashes = _sorted_hashes(iter(names))
+        size = 64
+        while size < FILTER_BITS_PER_ENTRY * len(self.hashes):
+            size *= 2
+        self.mask = mask = size - 1  # номер бита в фильтре
+        bits = bytearray(size // 8)
+        # Каталог: starts[j] — первый хеш со старшими битами j (со сдвигом на half для знаковых)
+        depth = max(1, (len(self.hashes) // ENTRIES_PER_BUCKET).bit_length())
+        self.shift, self.half = shift, half = 64 - depth, 1 << (depth - 1)
+        counts = array('I', bytes(4 << depth))
+        for h in self.hashes:
+            i = h & mask
+            bits[i >> 3] |= 1 << (i & 7)
+            i = (h >> 32) & mask
+            bits[i >> 3] |= 1 << (i & 7)
+            counts[(h >> shift) + half] += 1
+        self.bits = bytes(bits)
+        self.starts = array('I', accumulate(counts, initial=0))
+        self.sinkholes = list(sinkholes)
+        # тип запроса -> (ANCOUNT, готовые записи); без адресов — NXDOMAIN
+        self.answers = {}
+        for address in self.sinkholes:
+            if ':' in address:
+                rtype, data = DNSType.AAAA, socket.inet_pton(socket.AF_INET6, address)
+            else:
+                rtype, data = DNSType.A, socket.inet_pton(socket.AF_INET, address)
+            count, body = self.answers.get(rtype, (0, b''))
+            self.answers[rtype] = (count + 1, body + _SINKHOLE.pack(_QUESTION_POINTER, rtype, 1, BLOCK_TTL,
+                                                                    len(data)) + data)
+
+    @classmethod
+    def load(cls, paths, sinkholes=()):
+        def names():
+            for path in paths:
+                with open(path, encoding='utf-8', errors='replace') as f:
+                    yield from parse_blocklist(f)
+        return cls(names(), sinkholes)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @property
+    def nbytes(self):
+        """Память индекса в байтах"""
+        return len(self.hashes) * self.hashes.itemsize + len(self.bits) + len(self.starts) * self.starts.itemsize
+
+    def blocked(self, name):
+        """Заблокировано ли имя или один из его родительских доменов"""
+        name = name.lower()
+        bits, mask, hashes, starts = self.bits, self.mask, self.hashes, self.starts
+        start = 0
+        while True:
+            h = hash(name[start:] if start else name)
+            i = h & mask
+            if bits[i >> 3] >> (i & 7) & 1:
+                i = (h >> 32) & mask
+                if bits[i >> 3] >> (i & 7) & 1:
+                    j = (h >> self.shift) + self.half
+                    i = bisect_left(hashes, h, starts[j], starts[j + 1])
+                    if i < starts[j + 1] and hashes[i] == h:
+                        return True
+            start = name.find('.', start) + 1
+            if not start:
+                return False
+
+    def answer(self, request):
+        """Байты ответа на заблокированное имя или None"""
+        question = request.questions[0]
+        if not self.blocked(question.name):
+            return None
+        flags = FLAGS_BLOCKED | (request.flags & 0x0100)
+        if not self.sinkholes:
+            return _HEADER.pack(request.id, flags | RCODE_NXDOMAIN, 1, 0, 0, 0) + request.question_wire()
+        count, body = self.answers.get(question.type, (0, b''))  # другой тип — NODATA
+        return _HEADER.pack(request.id, flags, 1, count, 0, 0) + request.question_wire() + body
+
+
+def _sorted_hashes(names):
+    """Отсортированные хеши имён; список объектов int держится только для одного куска"""
+    chunks = []
+    while True:
+        chunk = [hash(name) for name in islice(names, SORT_CHUNK)]
+        if not chunk:
+            break
+        chunk.sort()
+        chunks.append(array('q', chunk))
+    if len(chunks) == 1:
+        return chunks[0]
+    return array('q', heapq.merge(*chunks))
+
+
+def parse_blocklist(lines):
+    """Имена из списка: по одному в строке, строки hosts-файлов (0.0.0.0 имя ...)
+    и правила вида ||имя^ (параметры $... отбрасываются); комментарии начинаются
+    с # или !, строки hosts с одним адресом пропускаются"""
+    for line in lines:
+        fields = line.split()
+        if not fields or fields[0][0] in '#!':
+            continue
+        if len(fields) > 1:
+            fields = line.split('#', 1)[0].split()  # комментарий в конце строки
+        if len(fields) > 1:
+            for name in fields[1:]:
+                name = name.rstrip('.').lower()
+                if name not in HOSTS_SKIP:
+                    yield name
+            continue
+        name = fields[0]
+        if name.startswith('||'):
+            name = name[2:].split('^', 1)[0].split('$', 1)[0]
+        elif _is_address(name):
+            continue  # строка hosts без имён
+        yield name.rstrip('.').lower()
+
+
+def _is_address(text):
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, text)
+            return True
+        except OSError:
+            pass
+    return False
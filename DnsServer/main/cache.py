@@ -1,108 +1,530 @@
-import pickle
+import heapq
+import struct
+import sys
+import threading
 import time
-from collections import defaultdict
+from array import array
+from collections import deque
 from threading import Lock
 
+from DnsServer.main.const import (CACHE_MAX_BYTES, CACHE_MAX_ENTRIES, CACHE_PERSIST_INTERVAL, PREFETCH_FRACTION,
+                                  NEGATIVE_TTL_MAX, STALE_ANSWER_TTL, STALE_RECHECK_INTERVAL)
+from DnsServer.main.dns_packet import (RCODE_NOERROR, RCODE_NXDOMAIN, DNSClass, DNSPacket, DNSQuestion, DNSRecord,
+                                       DNSType, encode_name, patch_id)
+from DnsServer.main.eviction import TinyLFUPolicy
+from DnsServer.main.persistence import SnapshotStore
+
+IN_MEMORY = ':memory:'  # имя файла кэша без сохранения на диск (как в sqlite)
+
+_TTL = struct.Struct('!I')
+_SOA_MINIMUM = struct.Struct('!I')  # последнее поле rdata SOA
+
+# Тип в ключе (имя, тип, класс), под которым хранится NXDOMAIN для имени и всех его поддоменов
+# (RFC 8020); тип 0 зарезервирован и в запросах не встречается
+NXDOMAIN_CUT = 0
+_TTL_OFFSET = struct.Struct('=HI')  # смещение поля TTL в ответе и исходный TTL
+
+# Приблизительные накладные расходы Python-объектов для учёта памяти кэша
+ENTRY_OVERHEAD = 200
+RECORD_OVERHEAD = 150
+# Обращения копятся в буфере и передаются политике вытеснения пачками под замком
+READ_BUFFER_SIZE = 256
+READ_BUFFER_DRAIN = 32
+
+
+def question_key(question):
+    """Ключ кэша: (интернированное имя в нижнем регистре, тип, класс)"""
+    return sys.intern(question.name.lower()), int(question.type), int(question.cls)
+
+
+def pack_ttl_offsets(pairs):
+    """Пары (смещение, TTL) в компактном виде: 6 байт на запись вместо кортежей"""
+    return b''.join(_TTL_OFFSET.pack(offset, ttl) for offset, ttl in pairs)
+
+
+def record_key(record):
+    return sys.intern(record.name.lower()), int(record.type), int(record.cls)
+
+
+class CacheEntry:
+    """RRset или готовый ответ на вопрос с единым сроком жизни (по time.monotonic)"""
+    __slots__ = ('records', 'wire', 'ttl_offsets', 'question_end', 'stored_at', 'expires')
+
+    def __init__(self, records, stored_at, expires, wire=None, ttl_offsets=None, question_end=0):
+        self.records = records
+        self.stored_at = stored_at
+        self.expires = expires
+        self.wire = wire
+        self.ttl_offsets = ttl_offsets
+        self.question_end = question_end
+
+    @classmethod
+    def from_wire(cls, wire, ttl_offsets, question_end, stored_at):
+        """Запись по сериализованному ответу (записи разбираются только по требованию)"""
+        expires = stored_at + min(ttl for _, ttl in _TTL_OFFSET.iter_unpack(ttl_offsets))
+        return cls(None, stored_at, expires, wire, ttl_offsets, question_end)
+
+    def answer_records(self):
+        if self.records is None:
+            self.records = DNSPacket.parse(self.wire).answers
+        return self.records
+
+    def _serialize(self, question):
+        """Сериализация RRset как ответа на вопрос при первом обращении"""
+        packet = DNSPacket(0, 0x8180, [question], list(self.records), [], [])
+        wire, ttl_offsets = packet.encode()
+        # Вопрос всегда идёт первым и не сжимается: имя + QTYPE + QCLASS
+        self.question_end = 12 + len(encode_name(question.name)) + 4
+        self.ttl_offsets = pack_ttl_offsets(ttl_offsets)
+        self.wire = wire
+
+    def render(self, request, now, stale=False):
+        """Копия ответа с ID запроса и TTL, уменьшенными на время хранения.
+
+        Просроченный ответ (stale=True) отдаётся с коротким TTL STALE_ANSWER_TTL.
+        """
+        if self.wire is None:
+            self._serialize(request.questions[0])
+        wire = bytearray(self.wire)
+        raw = request.raw_data
+        if len(raw) >= self.question_end:
+            # ID и вопрос берём из запроса как есть, чтобы сохранить регистр букв клиента
+            wire[0:2] = raw[0:2]
+            wire[12:self.question_end] = raw[12:self.question_end]
+        else:
+            wire[0:2] = patch_id(b'\x00\x00', request.id)
+        elapsed = int(now - self.stored_at)
+        for offset, ttl in _TTL_OFFSET.iter_unpack(self.ttl_offsets):
+            _TTL.pack_into(wire, offset, STALE_ANSWER_TTL if stale else ttl - elapsed)
+        return bytes(wire)
+
 
 class DNSCache:
-    def __init__(self, cache_file):
+    """Кэш с доступом за O(1) по ключу (имя, тип, класс).
+
+    Просроченные записи удаляются лениво при чтении, а cleanup() снимает
+    с кучи сроков истечения только те записи, срок которых уже наступил.
+    Размер ограничен max_entries и max_bytes; какие записи вытеснять, решает
+    политика (по умолчанию W-TinyLFU). Чтение выполняется без блокировки,
+    изменения — под self.lock.
+
+    При stale_max_age > 0 просроченные ответы хранятся ещё stale_max_age секунд
+    и отдаются через get_stale_wire(), если upstream не ответил (RFC 8767).
+    После такой неудачи get_wire() STALE_RECHECK_INTERVAL секунд сразу отдаёт
+    просроченный ответ, не дожидаясь upstream.
+    Если задан prefetch, он вызывается с запросом при попадании в последние
+    PREFETCH_FRACTION срока жизни записи, чтобы сервер обновил её заранее.
+    """
+
+    def __init__(self, cache_file, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, policy=TinyLFUPolicy,
+                 stale_max_age=0):
         self.cache_file = cache_file
+        self.store = SnapshotStore(cache_file) if cache_file not in (None, IN_MEMORY) else None
+        self.pending = deque()  # новые записи, ещё не дописанные в журнал
+        self.persist_lock = Lock()
+        self._absorbed = None  # версии слотов общей таблицы, уже перенесённых в кэш
         self.lock = Lock()
-        self.name_to_records = defaultdict(set)
-        self.value_to_names = defaultdict(set)
+        self.entries = {}
+        self.expiry_heap = []
+        self.policy = policy(max_entries, max_bytes)
+        self.reads = deque(maxlen=READ_BUFFER_SIZE)
+        self.shared = None
+        self.stale_max_age = stale_max_age
+        self.prefetch = None
+        self.failed = {}  # ключ -> до какого момента отдавать просроченный ответ без запроса к upstream
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.stale_hits = 0
+        self.negative_hits = 0  # ответы NXDOMAIN по закэшированному NXDOMAIN родительского имени
         self.load()
 
     def update(self, dns_packet):
         """Обновление кэша на основе DNS пакета"""
+        now = time.monotonic()
         with self.lock:
-            # Обрабатываем все секции
-            for record in dns_packet.answers + dns_packet.authorities + dns_packet.additionals:
-                self._add_record(record)
+            # Записи из секции ответов надёжнее, чем из authority/additional (RFC 2181, 5.4.1)
+            for key, records in _group_rrsets(dns_packet.answers).items():
+                self._store_rrset(key, records, now, replace=True)
+            for key, records in _group_rrsets(dns_packet.authorities + dns_packet.additionals).items():
+                self._store_rrset(key, records, now, replace=False)
+            self._add_answer(dns_packet, now)
+
+    def _store(self, key, entry, journal=True):
+        self._drain_reads()
+        self.entries[key] = entry
+        if journal and self.store is not None:
+            self.pending.append((key, entry))
+        heapq.heappush(self.expiry_heap, (entry.expires, key))
+        for evicted in self.policy.insert(key, _entry_size(entry)):
+            del self.entries[evicted]
+            self.evictions += 1
+            if self.store is not None:
+                # Иначе вытесненный ключ вернулся бы из снимка в обход политики
+                self.store.discard(evicted)
 
-    def _add_record(self, record):
-        """Добавление одной записи в кэш"""
-        name = record.name.lower()
-        value = getattr(record, 'value', None)
+    def _remove(self, key):
+        del self.entries[key]
+        self.policy.remove(key)
 
-        # Добавляем в name_to_records
-        self.name_to_records[name].add(record)
+    def _drain_reads(self):
+        """Передача накопленных обращений политике вытеснения (под self.lock)"""
+        reads = self.reads
+        while reads:
+            key = reads.popleft()
+            if key in self.entries:
+                self.policy.access(key)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.policy.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'evictions': self.evictions,
+            'stale_hits': self.stale_hits,
+            'negative_hits': self.negative_hits,
+            'rejected': self.policy.rejected,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def _store_rrset(self, key, records, now, replace):
+        ttl = min(record.ttl for record in records)
+        if ttl <= 0:
+            return
+        existing = self.entries.get(key)
+        if not replace and existing is not None and existing.expires > now:
+            return
+        self._store(key, CacheEntry(records, now, now + ttl))
+
+    def _add_answer(self, dns_packet, now):
+        """Сохранение сериализованного ответа для отдачи из кэша без сборки пакета.
+
+        NXDOMAIN и NODATA кэшируются со временем жизни из SOA в секции authority
+        (RFC 2308); ответ без SOA не кэшируется.
+        """
+        if len(dns_packet.questions) != 1:
+            return
+        question = dns_packet.questions[0]
+        soa = _negative_soa(dns_packet)
+        if soa is not None:
+            # В кэше остаются только цепочка CNAME и SOA с отрицательным TTL
+            dns_packet = DNSPacket(dns_packet.id, dns_packet.flags, dns_packet.questions, dns_packet.answers,
+                                   [soa], [])
+            if dns_packet.rcode == RCODE_NXDOMAIN:
+                self._add_nxdomain_cut(question, dns_packet.answers, soa, now)
+        elif not dns_packet.answers or dns_packet.rcode != RCODE_NOERROR:
+            return
+        elif any(record.type == DNSType.OPT for record in dns_packet.additionals):
+            # OPT относится к обмену с upstream; клиенту он добавляется при отправке
+            dns_packet = DNSPacket(dns_packet.id, dns_packet.flags, dns_packet.questions, dns_packet.answers,
+                                   dns_packet.authorities,
+                                   [record for record in dns_packet.additionals if record.type != DNSType.OPT])
+        wire, ttl_offsets = dns_packet.encode()
+        if min(ttl for _, ttl in ttl_offsets) <= 0:
+            return
+        # Вопрос всегда идёт первым и не сжимается: имя + QTYPE + QCLASS
+        question_end = 12 + len(encode_name(question.name)) + 4
+        # Записи ответа не храним: при необходимости они разбираются из wire
+        entry = CacheEntry.from_wire(wire, pack_ttl_offsets(ttl_offsets), question_end, now)
+        key = question_key(question)
+        self._store(key, entry)
+        self.failed.pop(key, None)
+        if self.shared is not None:
+            self.shared.put(key, wire, entry.ttl_offsets, question_end, entry.stored_at, entry.expires)
+
+    def _add_nxdomain_cut(self, question, answers, soa, now):
+        """Запоминает, что имени (последнему в CNAME-цепочке) и его поддоменов нет"""
+        name = question.name.lower()
+        aliases = {record.name.lower(): record.value.lower() for record in answers if record.type == DNSType.CNAME}
+        seen = set()
+        while name in aliases and name not in seen:
+            seen.add(name)
+            name = aliases[name]
+        self._store((sys.intern(name), NXDOMAIN_CUT, int(question.cls)), CacheEntry([soa], now, now + soa.ttl))
+
+    def attach_shared(self, shared):
+        """Подключение общей для воркеров таблицы ответов и выгрузка в неё текущих ответов и снимка"""
+        with self.lock:
+            self.shared = shared
+            for key, entry in self.entries.items():
+                if entry.wire is not None:
+                    shared.put(key, entry.wire, entry.ttl_offsets, entry.question_end, entry.stored_at, entry.expires)
+            if self.store is not None:
+                # Снимок в entries не загружается, а у воркеров нет файла кэша: они видят его только здесь
+                shift = time.monotonic() - time.time()
+                now = time.monotonic()
+                for key, wire, ttl_offsets, question_end, stored_at, expires in self.store.iter_records():
+                    if key not in self.entries and expires + shift > now:
+                        shared.put(key, wire, ttl_offsets, question_end, stored_at + shift, expires + shift)
+            # Выгруженное только что уже есть в кэше или снимке, переносить обратно его не нужно
+            self._absorbed = shared.versions()
 
-        # Добавляем в value_to_names, если есть значение
-        if value:
-            self.value_to_names[value].add(name)
+    def absorb_shared(self):
+        """Перенос ответов из общей таблицы в локальный кэш (перед сохранением на диск)"""
+        if self.shared is None:
+            return
+        with self.lock:
+            if self._absorbed is None:
+                self._absorbed = array('I', bytes(4 * self.shared.slots))
+            for wire, ttl_offsets, question_end, stored_at in self.shared.entries(time.monotonic(), self._absorbed):
+                name, offset = DNSPacket.parse_name(wire, 12)
+                qtype, qclass = struct.unpack_from('!HH', wire, offset)
+                self._store((name.lower(), qtype, qclass),
+                            CacheEntry.from_wire(wire, ttl_offsets, question_end, stored_at))
 
     def load(self):
-        """Загрузка кэша с диска"""
+        """Загрузка кэша с диска: снимок только отображается в память, журнал загружается сразу"""
+        if self.store is None:  # Кэш без сохранения на диск
+            return
+        records = self.store.open()
+        # На диске сроки хранятся по настенным часам, в памяти — по monotonic
+        shift = time.monotonic() - time.time()
+        now = time.monotonic()
+        with self.lock:
+            for (name, qtype, qclass), wire, ttl_offsets, question_end, stored_at, expires in records:
+                if expires + shift > now:
+                    self._store((sys.intern(name), qtype, qclass),
+                                CacheEntry.from_wire(wire, ttl_offsets, question_end, stored_at + shift),
+                                journal=False)
+
+    def _from_snapshot(self, key, now):
+        """Запись из снимка на диске при первом обращении к ключу.
+
+        Запись проходит через политику вытеснения, как ответ upstream: если её
+        не допустят, она отдаётся один раз и из снимка больше не читается.
+        """
+        found = self.store.take(key)
+        if found is None:
+            return None
+        wire, ttl_offsets, question_end, stored_at, expires = found
+        shift = time.monotonic() - time.time()
+        if expires + shift <= now:
+            return None
+        entry = CacheEntry.from_wire(wire, ttl_offsets, question_end, stored_at + shift)
+        with self.lock:
+            self._store(key, entry, journal=False)
+        return entry
+
+    def _disk_record(self, key, entry, shift):
+        if entry.wire is None:
+            entry._serialize(DNSQuestion(*key))
+        return key, entry.wire, entry.ttl_offsets, entry.question_end, entry.stored_at + shift, entry.expires + shift
+
+    def persist(self):
+        """Дописывает новые записи в журнал; при разрастании журнала пересобирает снимок"""
+        if self.store is None:
+            return
+        with self.persist_lock:
+            self._write_journal()
+            if self.store.needs_compaction():
+                self._compact()
+
+    def _write_journal(self):
+        shift = time.time() - time.monotonic()
+        records = []
+        while self.pending:
+            key, entry = self.pending.popleft()
+            records.append(self._disk_record(key, entry, shift))
         try:
-            with open(self.cache_file, 'rb') as f:
-                data = pickle.load(f)
-                self.name_to_records = data['name_to_records']
-                self.value_to_names = data['value_to_names']
-                self.cleanup()  # Удаляем просроченные записи при загрузке
-        except (FileNotFoundError, EOFError, pickle.PickleError):
-            print("Не удалось загрузить кэш, начнем с пустого")
-            self.name_to_records = defaultdict(set)
-            self.value_to_names = defaultdict(set)
+            self.store.write_journal(records)
+        except OSError as e:
+            print(f"Ошибка записи журнала кэша: {e}")
+
+    def _compact(self):
+        shift = time.time() - time.monotonic()
+        # Копия словаря снимается без замка: поиск и обновление кэша не блокируются
+        records = [self._disk_record(key, entry, shift) for key, entry in list(self.entries.items())]
+        try:
+            self.store.compact(records, time.time(), self.policy.max_entries, self.policy.max_bytes)
+        except OSError as e:
+            print(f"Ошибка сохранения кэша: {e}")
 
     def save(self):
-        """Сохранение кэша на диск"""
-        with self.lock:
+        """Сохранение кэша на диск: дописывание журнала и пересборка снимка"""
+        if self.store is None:
+            return
+        with self.persist_lock:
+            self._write_journal()
+            self._compact()
+
+    def start_persistence(self, interval=CACHE_PERSIST_INTERVAL):
+        """Фоновое сохранение: раз в interval секунд новые записи дописываются в журнал"""
+        if self.store is None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.absorb_shared()
+                self.persist()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def lookup(self, key, now, count=True):
+        """Непросроченная запись по ключу; просроченная удаляется при обращении.
+
+        count=False — служебное чтение (например, резолвером), не учитываемое в статистике попаданий.
+        """
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires <= now:
+            if entry.expires + self.stale_max_age <= now:
+                with self.lock:
+                    if self.entries.get(key) is entry:
+                        self._remove(key)
+                        self.expired += 1
+            entry = None
+        if entry is None and self.store is not None:
+            entry = self._from_snapshot(key, now)
+        if entry is None and self.shared is not None:
+            # Ответ мог получить другой воркер
+            found = self.shared.get(key, now)
+            if found is not None:
+                entry = CacheEntry.from_wire(*found)
+                with self.lock:
+                    self._store(key, entry)
+        if entry is None:
+            if count:
+                self.misses += 1
+            return None
+        if count:
+            self.hits += 1
+        self.reads.append(key)
+        if len(self.reads) >= READ_BUFFER_DRAIN and self.lock.acquire(blocking=False):
             try:
-                with open(self.cache_file, 'wb') as f:
-                    pickle.dump({
-                        'name_to_records': self.name_to_records,
-                        'value_to_names': self.value_to_names
-                    }, f)
-            except Exception as e:
-                print(f"Ошибка сохранения кэша: {e}")
+                self._drain_reads()
+            finally:
+                self.lock.release()
+        return entry
 
-    def get_response(self, request):
-        """Попытка получить ответ из кэша"""
-        with self.lock:
-            # Проверяем, есть ли запрашиваемые данные в кэше
-            # Это упрощенная версия - в реальности нужно проверять тип записи и т.д.
-            query_name = request.questions[0].name.lower()
-
-            if query_name in self.name_to_records:
-                # Создаем ответ на основе данных из кэша
-                response = request.create_response()
-                for record in self.name_to_records[query_name]:
-                    if time.time() < record.expiration_time:
-                        response.add_answer(record)
-                    else:
-                        # Удаляем просроченную запись
-                        self._remove_record(record)
-
-                if len(response.answers) > 0:
-                    return response
+    def get_wire(self, request):
+        """Готовый к отправке ответ из кэша или None.
 
+        Попадание в кэш сводится к копированию байтов, подмене ID и TTL.
+        """
+        if len(request.questions) != 1:
+            return None
+        now = time.monotonic()
+        key = question_key(request.questions[0])
+        entry = self.lookup(key, now)
+        if entry is None:
+            if self.failed.get(key, 0) > now:
+                return self._render_stale(key, request, now)
+            return self._from_nxdomain_cut(request, key, now)
+        if self.prefetch is not None:
+            refresh_at = entry.expires - (entry.expires - entry.stored_at) * PREFETCH_FRACTION
+            if now >= refresh_at:
+                self.prefetch(request)
+        return entry.render(request, now)
+
+    def _from_nxdomain_cut(self, request, key, now):
+        """NXDOMAIN для имени, если закэширован NXDOMAIN для него самого или родительского имени"""
+        name, _, qclass = key
+        while name:
+            entry = self.lookup((name, NXDOMAIN_CUT, qclass), now, count=False)
+            if entry is not None:
+                soa = entry.answer_records()[0]
+                response = request.create_error_response(RCODE_NXDOMAIN)
+                response.authorities = [DNSRecord(soa.name, soa.type, soa.cls, int(entry.expires - now), soa.data)]
+                self.negative_hits += 1
+                return response.to_wire()
+            name = name.partition('.')[2]
         return None
 
-    def _remove_record(self, record):
-        """Удаление записи из кэша"""
-        name = record.name.lower()
-        value = record.value.lower() if hasattr(record, 'value') else None
+    def has_stale(self, request):
+        """Есть ли для запроса ответ, который можно отдать при недоступности upstream"""
+        if len(request.questions) != 1 or not self.stale_max_age:
+            return False
+        entry = self.entries.get(question_key(request.questions[0]))
+        return entry is not None and entry.expires + self.stale_max_age > time.monotonic()
+
+    def get_stale_wire(self, request):
+        """Просроченный ответ с коротким TTL, когда upstream не ответил (RFC 8767).
 
-        if name in self.name_to_records and record in self.name_to_records[name]:
-            self.name_to_records[name].remove(record)
-            if not self.name_to_records[name]:
-                del self.name_to_records[name]
+        Запускает таймер повторной проверки: следующие запросы сразу получают
+        просроченный ответ из get_wire().
+        """
+        if not self.has_stale(request):
+            return None
+        now = time.monotonic()
+        key = question_key(request.questions[0])
+        self.failed[key] = now + STALE_RECHECK_INTERVAL
+        return self._render_stale(key, request, now)
 
-        if value and value in self.value_to_names and name in self.value_to_names[value]:
-            self.value_to_names[value].remove(name)
-            if not self.value_to_names[value]:
-                del self.value_to_names[value]
+    def _render_stale(self, key, request, now):
+        entry = self.entries.get(key)
+        if entry is None or entry.expires + self.stale_max_age <= now:
+            self.failed.pop(key, None)
+            return None
+        self.stale_hits += 1
+        return entry.render(request, now, stale=entry.expires <= now)
+
+    def get_records(self, name, rtype, rclass=DNSClass.IN):
+        """Непросроченные записи RRset (имя, тип, класс) или пустой список"""
+        name = sys.intern(name.lower())
+        entry = self.lookup((name, int(rtype), int(rclass)), time.monotonic(), count=False)
+        if entry is None:
+            return []
+        # В готовом ответе на вопрос могут быть и записи CNAME-цепочки
+        return [record for record in entry.answer_records()
+                if record.type == rtype and record.name.lower() == name]
+
+    def get_response(self, request):
+        """Попытка получить ответ из кэша"""
+        now = time.monotonic()
+        entry = self.lookup(question_key(request.questions[0]), now)
+        if entry is None:
+            return None
+        response = request.create_response()
+        response.answers = list(entry.answer_records())
+        response.raw_data = entry.render(request, now)
+        return response
 
     def cleanup(self):
-        """Очистка просроченных записей"""
+        """Удаление записей, срок которых (с учётом окна serve-stale) наступил, без обхода всего кэша"""
+        now = time.monotonic()
         with self.lock:
-            current_time = time.time()
-            expired_records = []
+            heap = self.expiry_heap
+            while heap and heap[0][0] + self.stale_max_age <= now:
+                expires, key = heapq.heappop(heap)
+                entry = self.entries.get(key)
+                # В куче могут остаться устаревшие элементы для перезаписанных ключей
+                if entry is not None and entry.expires == expires:
+                    self._remove(key)
+                    self.expired += 1
+            for key in [key for key, until in list(self.failed.items()) if until <= now]:
+                self.failed.pop(key, None)
+
+
+def _entry_size(entry):
+    """Оценка памяти, занимаемой записью кэша"""
+    size = ENTRY_OVERHEAD + len(entry.wire or b'')
+    for record in entry.records or ():
+        size += RECORD_OVERHEAD + len(record.name) + len(record.data)
+    return size
+
+
+def _negative_soa(dns_packet):
+    """SOA с отрицательным TTL для NXDOMAIN/NODATA или None (RFC 2308, разделы 3 и 5)"""
+    rcode = dns_packet.rcode
+    qtype = dns_packet.questions[0].type
+    if rcode != RCODE_NXDOMAIN and (rcode != RCODE_NOERROR or any(r.type == qtype for r in dns_packet.answers)):
+        return None
+    for record in dns_packet.authorities:
+        if record.type == DNSType.SOA and len(record.data) >= 4:
+            minimum = _SOA_MINIMUM.unpack_from(record.data, len(record.data) - 4)[0]
+            ttl = min(record.ttl, minimum, NEGATIVE_TTL_MAX)
+            return DNSRecord(record.name, record.type, record.cls, ttl, record.data)
+    return None
 
-            for name, records in self.name_to_records.items():
-                for record in records:
-                    if current_time >= record.expiration_time:
-                        expired_records.append(record)
 
-            for record in expired_records:
-                self._remove_record(record)
\ No newline at end of file
+def _group_rrsets(records):
+    """Группировка записей в RRset по (имя, тип, класс); OPT не кэшируется"""
+    rrsets = {}
+    for record in records:
+        if record.type != DNSType.OPT:
+            rrsets.setdefault(record_key(record), []).append(record)
+    return rrsets
@@ -4,5 +4,35 @@ DEFAULT_DNS_SERVERS = [
     '9.9.9.9'     # Quad9 DNS
 ]
 
+# Корневые серверы (root hints, IPv4 адреса a–m.root-servers.net)
+ROOT_SERVERS = [
+    '198.41.0.4', '170.247.170.2', '192.33.4.12', '199.7.91.13', '192.203.230.10', '192.5.5.241',
+    '192.112.36.4', '198.97.190.53', '192.36.148.17', '192.58.128.30', '193.0.14.129', '199.7.83.42',
+    '202.12.27.33',
+]
+
 CACHE_CLEANUP_INTERVAL = 60  # секунды
-SOCKET_TIMEOUT = 5           # секунды
\ No newline at end of file
+SOCKET_TIMEOUT = 5           # секунды
+EDNS_UDP_PAYLOAD = 1232      # размер UDP-пакета для EDNS(0): без фрагментации IP (DNS Flag Day 2020)
+TCP_IDLE_TIMEOUT = 10        # секунды простоя, после которых TCP-соединение клиента закрывается
+TCP_PIPELINE_LIMIT = 16      # запросов одного TCP-соединения в обработке одновременно
+CACHE_PERSIST_INTERVAL = 5   # секунды между дописываниями журнала кэша
+
+CACHE_MAX_ENTRIES = 100_000          # записей в кэше
+CACHE_MAX_BYTES = 64 * 1024 * 1024   # оценка занимаемой памяти, байты
+PREFETCH_FRACTION = 0.1       # попадание в последние 10% TTL запускает фоновое обновление записи
+STALE_ANSWER_TTL = 30         # TTL просроченного ответа при недоступности upstream (RFC 8767)
+STALE_MAX_AGE = 24 * 3600     # сколько секунд после истечения хранить ответ для serve-stale
+STALE_CLIENT_TIMEOUT = 1.8    # через сколько секунд ожидания upstream клиенту отдаётся просроченный ответ
+STALE_RECHECK_INTERVAL = 30   # после неудачи upstream столько секунд сразу отдаём просроченный ответ
+
+LOCAL_TTL = 3600              # TTL записей hosts-файлов и зон без $TTL
+BLOCK_TTL = 300               # TTL адреса-заглушки для заблокированных имён
+
+RATE_LIMIT_SLOTS = 65536      # слотов в таблицах ограничения частоты (около 24 байт на слот)
+RATE_LIMIT_WAYS = 4           # слотов в наборе: ключ ищется и вытесняет только внутри своего набора
+RATE_LIMIT_IPV4_PREFIX = 24   # запросы считаются по подсетям, а не по отдельным адресам
+RATE_LIMIT_IPV6_PREFIX = 56
+RRL_SLIP = 2                  # каждый второй ответ сверх лимита RRL уходит обрезанным (TC), как в BIND
+
+NEGATIVE_TTL_MAX = 3 * 3600   # верхняя граница TTL для NXDOMAIN/NODATA (RFC 2308, раздел 5)
@@ -1,7 +1,7 @@
 import struct
 import socket
-import time
-from dataclasses import dataclass
+import sys
+from dataclasses import dataclass, field
 from enum import IntEnum
 
 
@@ -10,119 +10,236 @@ class DNSType(IntEnum):
     NS = 2
     CNAME = 5
     SOA = 6
+    PTR = 12
     MX = 15
+    TXT = 16
     AAAA = 28
+    SRV = 33
+    OPT = 41
 
 
 class DNSClass(IntEnum):
     IN = 1
 
 
-@dataclass
+FLAG_TC = 0x0200
+MAX_UDP_PAYLOAD = 512  # предел UDP-сообщения без EDNS (RFC 1035)
+
+RCODE_NOERROR = 0
+RCODE_SERVFAIL = 2
+RCODE_NXDOMAIN = 3
+RCODE_REFUSED = 5
+
+# Типы, в rdata которых лежит одно доменное имя
+NAME_RDATA_TYPES = (DNSType.NS, DNSType.CNAME, DNSType.PTR)
+
+_HEADER = struct.Struct('!HHHHHH')
+_QUESTION = struct.Struct('!HH')
+_RECORD = struct.Struct('!HHIH')
+_USHORT = struct.Struct('!H')
+_TTL = struct.Struct('!I')
+
+
+def patch_id(wire, packet_id):
+    """Возвращает копию пакета с подменённым ID"""
+    return _USHORT.pack(packet_id) + wire[2:]
+
+
+@dataclass(slots=True)
 class DNSQuestion:
     name: str
     type: DNSType
     cls: DNSClass
 
 
-@dataclass(frozen=True)  # Добавляем frozen=True для хешируемости
+@dataclass(frozen=True, slots=True)  # frozen=True для хешируемости, slots — без __dict__ на запись
 class DNSRecord:
     name: str
     type: int
     cls: int
     ttl: int
     data: bytes
-
-    def __post_init__(self):
-        object.__setattr__(self, 'expiration_time', time.time() + self.ttl)
+    _value: str = field(default=None, init=False, repr=False, compare=False)
 
     @property
     def value(self):
-        if self.type == 1:  # A record
+        """Текстовое значение rdata; декодируется один раз при первом обращении"""
+        if self._value is None:
+            object.__setattr__(self, '_value', self._decode())
+        return self._value
+
+    def _decode(self):
+        if self.type == DNSType.A and len(self.data) == 4:
             return socket.inet_ntoa(self.data)
+        if self.type == DNSType.AAAA and len(self.data) == 16:
+            return socket.inet_ntop(socket.AF_INET6, self.data)
+        if self.type in NAME_RDATA_TYPES:
+            return DNSPacket.parse_name(self.data, 0)[0]
         return self.data.decode('ascii', errors='ignore')
 
 
-@dataclass
 class DNSPacket:
-    id: int
-    flags: int
-    questions: list[DNSQuestion]
-    answers: list[DNSRecord]
-    authorities: list[DNSRecord]
-    additionals: list[DNSRecord]
-    raw_data: bytes = b''
+    """DNS пакет.
+
+    При разборе сразу декодируются только заголовок и вопрос; секции ответа,
+    полномочий и дополнительных записей разбираются при первом обращении
+    к любой из них. Поэтому при попадании в кэш записи ответа не декодируются.
+    """
+
+    __slots__ = ('id', 'flags', 'questions', 'raw_data', '_answers', '_authorities', '_additionals',
+                 '_view', '_sections_offset', '_counts', '_names')
+
+    def __init__(self, id, flags, questions, answers=None, authorities=None, additionals=None, raw_data=b''):
+        self.id = id
+        self.flags = flags
+        self.questions = questions
+        self.raw_data = raw_data
+        self._answers = answers if answers is not None else []
+        self._authorities = authorities if authorities is not None else []
+        self._additionals = additionals if additionals is not None else []
+        self._view = None
+        self._sections_offset = None
+
+    def __repr__(self):
+        return (f"DNSPacket(id={self.id}, flags={self.flags:#06x}, questions={self.questions}, "
+                f"answers={self.answers}, authorities={self.authorities}, additionals={self.additionals})")
+
+    def __eq__(self, other):
+        if not isinstance(other, DNSPacket):
+            return NotImplemented
+        return ((self.id, self.flags, self.questions, self.answers, self.authorities, self.additionals)
+                == (other.id, other.flags, other.questions, other.answers, other.authorities, other.additionals))
+
+    @property
+    def rcode(self):
+        return self.flags & 0x000F
+
+    def edns_payload(self):
+        """Размер UDP-ответа из OPT-записи запроса (EDNS0) или None, если клиент не прислал OPT"""
+        if self._view is not None and not self._counts[2]:
+            return None  # секция additional пуста — не разбираем остальные
+        for record in self.additionals:
+            if record.type == DNSType.OPT:
+                return max(int(record.cls), MAX_UDP_PAYLOAD)
+        return None
+
+    @property
+    def answers(self):
+        if self._view is not None:
+            self._parse_sections()
+        return self._answers
+
+    @answers.setter
+    def answers(self, records):
+        self._parse_sections_if_pending()
+        self._answers = records
+
+    @property
+    def authorities(self):
+        if self._view is not None:
+            self._parse_sections()
+        return self._authorities
+
+    @authorities.setter
+    def authorities(self, records):
+        self._parse_sections_if_pending()
+        self._authorities = records
+
+    @property
+    def additionals(self):
+        if self._view is not None:
+            self._parse_sections()
+        return self._additionals
+
+    @additionals.setter
+    def additionals(self, records):
+        self._parse_sections_if_pending()
+        self._additionals = records
 
     @classmethod
     def parse(cls, data):
-        """Парсинг DNS пакета из bytes"""
-        raw_data = data
-        header = struct.unpack('!HHHHHH', data[:12])
-        id = header[0]
-        flags = header[1]
-        qdcount = header[2]
-        ancount = header[3]
-        nscount = header[4]
-        arcount = header[5]
+        """Парсинг DNS пакета: заголовок и вопрос сразу, остальные секции — по требованию"""
+        view = memoryview(data)
+        id, flags, qdcount, ancount, nscount, arcount = _HEADER.unpack_from(view, 0)
+        names = {}
 
         offset = 12
         questions = []
         for _ in range(qdcount):
-            name, offset = cls.parse_name(data, offset)
-            qtype, qclass = struct.unpack('!HH', data[offset:offset + 4])
-            questions.append(DNSQuestion(name, DNSType(qtype), DNSClass(qclass)))
+            name, offset = _read_name(view, offset, names)
+            qtype, qclass = _QUESTION.unpack_from(view, offset)
+            questions.append(DNSQuestion(name, _TYPES.get(qtype, qtype), _CLASSES.get(qclass, qclass)))
             offset += 4
 
-        answers = cls.parse_records(data, offset, ancount)
-        offset += ancount * (12 if ancount else 0)  # Упрощение
-        authorities = cls.parse_records(data, offset, nscount)
-        offset += nscount * (12 if nscount else 0)  # Упрощение
-        additionals = cls.parse_records(data, offset, arcount)
+        packet = cls(id, flags, questions, raw_data=data)
+        packet._sections_offset = offset
+        if ancount or nscount or arcount:
+            packet._view = view
+            packet._counts = (ancount, nscount, arcount)
+            packet._names = names
+        return packet
+
+    def question_wire(self):
+        """Секция вопросов в том виде, в каком пришла в raw_data (для ответов, повторяющих вопрос)"""
+        end = self._sections_offset
+        if end is None:
+            end = _question_end(self.raw_data, len(self.questions))
+        return self.raw_data[12:end]
+
+    def _parse_sections_if_pending(self):
+        if self._view is not None:
+            self._parse_sections()
 
-        return cls(id, flags, questions, answers, authorities, additionals, raw_data)
+    def _parse_sections(self):
+        """Разбор секций ответа, полномочий и дополнительных записей"""
+        view, names = self._view, self._names
+        ancount, nscount, arcount = self._counts
+        offset = self._sections_offset
+        self._answers, offset = _read_records(view, offset, ancount, names)
+        self._authorities, offset = _read_records(view, offset, nscount, names)
+        self._additionals, offset = _read_records(view, offset, arcount, names)
+        # Записи не ссылаются на пакет, буфер можно отпустить
+        self._view = self._names = None
 
     @staticmethod
     def parse_name(data, offset):
-        """Парсинг доменного имени"""
-        parts = []
-        while True:
-            length = data[offset]
-            if length == 0:
-                offset += 1
-                break
-            if length & 0xC0 == 0xC0:  # Указатель
-                pointer = struct.unpack('!H', data[offset:offset + 2])[0] & 0x3FFF
-                part, _ = DNSPacket.parse_name(data, pointer)
-                parts.append(part)
-                offset += 2
-                break
-            else:
-                offset += 1
-                parts.append(data[offset:offset + length].decode('ascii'))
-                offset += length
-        return '.'.join(parts), offset
+        """Парсинг доменного имени, возвращает имя и смещение после него"""
+        return _read_name(data, offset, {})
 
     @staticmethod
     def parse_records(data, offset, count):
-        """Парсинг DNS записей"""
-        records = []
-        for _ in range(count):
-            name, offset = DNSPacket.parse_name(data, offset)
-            rtype, rclass, ttl, rdlength = struct.unpack('!HHIH', data[offset:offset + 10])
-            offset += 10
-            rdata = data[offset:offset + rdlength]
-            offset += rdlength
-
-            if DNSType(rtype) == DNSType.A and rdlength == 4:
-                records.append(DNSRecord(name, DNSType(rtype), DNSClass(rclass), ttl, rdata))
-            elif DNSType(rtype) == DNSType.AAAA and rdlength == 16:
-                records.append(DNSRecord(name, DNSType(rtype), DNSClass(rclass), ttl, rdata))
-            elif DNSType(rtype) in (DNSType.NS, DNSType.CNAME):
-                name_value, _ = DNSPacket.parse_name(data, offset - rdlength)
-                records.append(DNSRecord(name, DNSType(rtype), DNSClass(rclass), ttl, rdata))
-            else:
-                records.append(DNSRecord(name, DNSType(rtype), DNSClass(rclass), ttl, rdata))
-        return records
+        """Парсинг DNS записей, возвращает записи и смещение после них"""
+        return _read_records(memoryview(data), offset, count, {})
+
+    def encode(self):
+        """Сериализация пакета со сжатием имён.
+
+        Возвращает байты пакета и список пар (смещение поля TTL, TTL),
+        по которым кэш может переписать TTL без повторной сборки пакета.
+        """
+        buf = bytearray(_HEADER.pack(
+            self.id & 0xFFFF, self.flags,
+            len(self.questions), len(self.answers), len(self.authorities), len(self.additionals)
+        ))
+        offsets = {}
+        for question in self.questions:
+            _write_name(buf, question.name, offsets)
+            buf += _QUESTION.pack(question.type, question.cls)
+
+        ttl_offsets = []
+        for record in self.answers + self.authorities + self.additionals:
+            _write_name(buf, record.name, offsets)
+            if record.type != DNSType.OPT:  # в OPT на месте TTL лежат флаги EDNS
+                ttl_offsets.append((len(buf) + 4, record.ttl))
+            buf += _RECORD.pack(record.type, record.cls, record.ttl, 0)
+            start = len(buf)
+            _write_rdata(buf, record, offsets)
+            _USHORT.pack_into(buf, start - 2, len(buf) - start)
+        return bytes(buf), ttl_offsets
+
+    def to_wire(self):
+        """Сериализация пакета в формат для отправки по сети"""
+        return self.encode()[0]
 
     def create_response(self):
         """Создание ответного пакета"""
@@ -140,13 +257,154 @@ class DNSPacket:
         """Добавление записи в ответ"""
         self.answers.append(record)
 
-    def create_error_response(self):
-        """Создание пакета с ошибкой"""
+    def create_error_response(self, rcode=RCODE_NXDOMAIN):
+        """Создание пакета с ошибкой (по умолчанию Name Error)"""
         return DNSPacket(
             id=self.id,
-            flags=0x8183,  # QR=1, RD=1, RA=1, RCODE=3 (Name Error)
+            flags=0x8180 | rcode,  # QR=1, RD=1, RA=1, RCODE
             questions=self.questions,
             answers=[],
             authorities=[],
             additionals=[]
-        )
\ No newline at end of file
+        )
+
+
+def encode_name(name):
+    """Кодирование имени в wire-формат без сжатия"""
+    buf = bytearray()
+    for label in name.rstrip('.').split('.'):
+        if label:
+            encoded = label.encode('ascii')
+            buf.append(len(encoded))
+            buf += encoded
+    buf.append(0)
+    return bytes(buf)
+
+
+_TYPES = {member.value: member for member in DNSType}
+_CLASSES = {member.value: member for member in DNSClass}
+
+
+def _read_name(data, offset, names):
+    """Декодирование имени по смещению.
+
+    names — кэш уже разобранных имён пакета по смещению: указатели сжатия
+    обычно ссылаются на одни и те же суффиксы, и они декодируются один раз.
+    Указатель может ссылаться только назад, поэтому циклы невозможны.
+    """
+    cached = names.get(offset)
+    if cached is not None:
+        return cached
+    start = offset
+    labels = []
+    while True:
+        length = data[offset]
+        if length == 0:
+            offset += 1
+            break
+        if length & 0xC0 == 0xC0:  # Указатель
+            pointer = (length & 0x3F) << 8 | data[offset + 1]
+            if pointer >= start:
+                raise ValueError(f"Некорректный указатель сжатия {pointer} на смещении {offset}")
+            suffix = _read_name(data, pointer, names)[0]
+            if suffix:
+                labels.append(suffix)
+            offset += 2
+            break
+        if length & 0xC0:
+            raise ValueError(f"Неподдерживаемый тип метки {length:#x} на смещении {offset}")
+        offset += 1
+        labels.append(str(data[offset:offset + length], 'ascii'))
+        offset += length
+    result = names[start] = ('.'.join(labels), offset)
+    return result
+
+
+def _read_records(data, offset, count, names):
+    """Разбор count записей начиная со смещения, возвращает записи и смещение после них"""
+    records = []
+    for _ in range(count):
+        name, offset = _read_name(data, offset, names)
+        rtype, rclass, ttl, rdlength = _RECORD.unpack_from(data, offset)
+        offset += 10
+        end = offset + rdlength
+        if end > len(data):
+            raise ValueError(f"rdata выходит за конец пакета ({end} > {len(data)})")
+        rdata = _expand_rdata(data, offset, end, rtype, names)
+        offset = end
+        # Имена интернируются: одно и то же имя в пакетах и кэше хранится в одном экземпляре
+        records.append(DNSRecord(sys.intern(name), _TYPES.get(rtype, rtype), _CLASSES.get(rclass, rclass),
+                                 ttl, rdata))
+    return records, offset
+
+
+def _expand_rdata(data, offset, end, rtype, names):
+    """Разворачивает сжатые имена внутри rdata, чтобы запись не ссылалась на исходный пакет"""
+    if rtype in NAME_RDATA_TYPES:
+        return encode_name(_read_name(data, offset, names)[0])
+    if rtype == DNSType.MX:
+        return bytes(data[offset:offset + 2]) + encode_name(_read_name(data, offset + 2, names)[0])
+    if rtype == DNSType.SOA:
+        mname, pos = _read_name(data, offset, names)
+        rname, pos = _read_name(data, pos, names)
+        return encode_name(mname) + encode_name(rname) + bytes(data[pos:end])
+    return bytes(data[offset:end])
+
+
+def opt_record(payload):
+    """OPT-запись EDNS(0) без опций: корневое имя, в поле класса — размер UDP-пакета (RFC 6891)"""
+    return b'\x00' + _RECORD.pack(DNSType.OPT, payload, 0, 0)
+
+
+def add_opt(wire, payload):
+    """Копия пакета с OPT-записью в конце секции additional"""
+    arcount = _USHORT.unpack_from(wire, 10)[0]
+    return wire[:10] + _USHORT.pack(arcount + 1) + wire[12:] + opt_record(payload)
+
+
+def truncate(wire):
+    """Заголовок с флагом TC и вопрос без записей: клиент повторит запрос по TCP"""
+    packet_id, flags, qdcount = _HEADER.unpack_from(wire, 0)[:3]
+    return _HEADER.pack(packet_id, flags | FLAG_TC, qdcount, 0, 0, 0) + wire[12:_question_end(wire, qdcount)]
+
+
+def _question_end(wire, qdcount):
+    end = 12
+    for _ in range(qdcount):
+        end = _read_name(wire, end, {})[1] + 4
+    return end
+
+
+def _write_name(buf, name, offsets):
+    """Запись имени в буфер со сжатием по уже записанным суффиксам"""
+    labels = [label for label in name.rstrip('.').split('.') if label]
+    for i in range(len(labels)):
+        suffix = '.'.join(labels[i:]).lower()
+        pointer = offsets.get(suffix)
+        if pointer is not None:
+            buf += _USHORT.pack(0xC000 | pointer)
+            return
+        if len(buf) < 0x3FFF:
+            offsets[suffix] = len(buf)
+        label = labels[i].encode('ascii')
+        buf.append(len(label))
+        buf += label
+    buf.append(0)
+
+
+def _write_rdata(buf, record, offsets):
+    """Запись rdata; имена в NS/CNAME/PTR/MX/SOA сжимаются (RFC 1035, 4.1.4)"""
+    data = record.data
+    if record.type in NAME_RDATA_TYPES:
+        _write_name(buf, DNSPacket.parse_name(data, 0)[0], offsets)
+    elif record.type == DNSType.MX:
+        buf += data[:2]
+        _write_name(buf, DNSPacket.parse_name(data, 2)[0], offsets)
+    elif record.type == DNSType.SOA:
+        mname, pos = DNSPacket.parse_name(data, 0)
+        rname, pos = DNSPacket.parse_name(data, pos)
+        _write_name(buf, mname, offsets)
+        _write_name(buf, rname, offsets)
+        buf += data[pos:]
+    else:
+        buf += data
@@ -0,0 +1,162 @@
+from collections import OrderedDict
+
+_HALVE = bytes(count >> 1 for count in range(256))
+
+
+class FrequencySketch:
+    """Count-Min sketch с 4-битными (до 15) счётчиками и периодическим старением.
+
+    Оценивает частоту обращений к ключу, в том числе к уже вытесненным,
+    за фиксированный объём памяти.
+    """
+
+    DEPTH = 4
+    MAX_COUNT = 15
+
+    def __init__(self, capacity):
+        width = 64
+        while width < capacity:
+            width <<= 1
+        self.mask = width - 1
+        self.table = bytearray(width * self.DEPTH)
+        self.width = width
+        self.sample_size = 10 * max(capacity, 1)
+        self.additions = 0
+
+    def _indexes(self, key):
+        h = hash(key)
+        for row in range(self.DEPTH):
+            h = (h * 0x9E3779B97F4A7C15 + row) & 0xFFFFFFFFFFFFFFFF
+            yield row * self.width + ((h >> 32) & self.mask)
+
+    def increment(self, key):
+        table = self.table
+        for index in self._indexes(key):
+            if table[index] < self.MAX_COUNT:
+                table[index] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self._age()
+
+    def frequency(self, key):
+        return min(self.table[index] for index in self._indexes(key))
+
+    def _age(self):
+        """Делим все счётчики пополам, чтобы старая популярность забывалась"""
+        self.table = self.table.translate(_HALVE)
+        self.additions //= 2
+
+
+class LRUPolicy:
+    """Простое вытеснение давно не использовавшихся записей (для сравнения)"""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.order = OrderedDict()
+        self.bytes = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self.order)
+
+    def access(self, key):
+        if key in self.order:
+            self.order.move_to_end(key)
+
+    def insert(self, key, size):
+        """Добавляет ключ; возвращает список вытесненных ключей"""
+        self.remove(key)
+        self.order[key] = size
+        self.bytes += size
+        evicted = []
+        while len(self.order) > self.max_entries or self.bytes > self.max_bytes:
+            victim, victim_size = self.order.popitem(last=False)
+            self.bytes -= victim_size
+            evicted.append(victim)
+        return evicted
+
+    def remove(self, key):
+        size = self.order.pop(key, None)
+        if size is not None:
+            self.bytes -= size
+
+
+class TinyLFUPolicy:
+    """W-TinyLFU: маленькое LRU-окно + сегментированный LRU с допуском по частоте.
+
+    Новые ключи попадают в окно (1% ёмкости). Вытесненный из окна кандидат
+    допускается в основную область, только если по оценке FrequencySketch
+    он популярнее жертвы из испытательного сегмента. Поэтому поток одноразовых
+    имён (например, случайные поддомены) не вымывает популярные записи.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.window_capacity = max(1, max_entries // 100)
+        main_capacity = max(1, max_entries - self.window_capacity)
+        self.protected_capacity = max(1, main_capacity * 8 // 10)
+        self.window = OrderedDict()
+        self.probation = OrderedDict()
+        self.protected = OrderedDict()
+        self.sketch = FrequencySketch(max_entries)
+        self.bytes = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self.window) + len(self.probation) + len(self.protected)
+
+    def access(self, key):
+        self.sketch.increment(key)
+        if key in self.window:
+            self.window.move_to_end(key)
+        elif key in self.protected:
+            self.protected.move_to_end(key)
+        elif key in self.probation:
+            # Повторное обращение переводит ключ в защищённый сегмент
+            self.protected[key] = self.probation.pop(key)
+            if len(self.protected) > self.protected_capacity:
+                demoted, size = self.protected.popitem(last=False)
+                self.probation[demoted] = size
+
+    def insert(self, key, size):
+        """Добавляет ключ; возвращает список вытесненных ключей"""
+        self.remove(key)
+        self.sketch.increment(key)
+        self.window[key] = size
+        self.bytes += size
+        evicted = []
+        while len(self.window) > self.window_capacity:
+            candidate, candidate_size = self.window.popitem(last=False)
+            if len(self) < self.max_entries:
+                self.probation[candidate] = candidate_size
+                continue
+            victims = self.probation or self.protected
+            if not victims:
+                # Основная область пуста (max_entries меньше двух): вытесняем из окна
+                self.bytes -= candidate_size
+                evicted.append(candidate)
+                continue
+            victim = next(iter(victims))
+            if self.sketch.frequency(candidate) > self.sketch.frequency(victim):
+                self.bytes -= victims.pop(victim)
+                self.probation[candidate] = candidate_size
+                evicted.append(victim)
+            else:
+                self.bytes -= candidate_size
+                self.rejected += 1
+                evicted.append(candidate)
+        while self.bytes > self.max_bytes and len(self):
+            victims = self.probation or self.protected or self.window
+            victim, victim_size = victims.popitem(last=False)
+            self.bytes -= victim_size
+            evicted.append(victim)
+        return evicted
+
+    def remove(self, key):
+        for segment in (self.window, self.probation, self.protected):
+            size = segment.pop(key, None)
+            if size is not None:
+                self.bytes -= size
+                return
@@ -0,0 +1,291 @@
+import re
+import socket
+import struct
+
+from DnsServer.main.const import LOCAL_TTL
+from DnsServer.main.dns_packet import RCODE_NXDOMAIN, DNSRecord, DNSType, encode_name
+
+_HEADER = struct.Struct('!HHHHHH')
+_RECORD = struct.Struct('!HHIH')
+_QUESTION_POINTER = b'\xc0\x0c'  # имя из вопроса: он всегда начинается сразу после заголовка
+
+FLAGS_LOCAL = 0x8480  # QR, AA, RA; RD копируется из запроса
+MAX_CNAME_CHAIN = 8
+
+_DURATION = re.compile(r'(\d+)([smhdw]?)', re.IGNORECASE)
+_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+class _Node:
+    """Узел дерева меток: имя читается от корня, то есть метки идут в обратном порядке"""
+    __slots__ = ('children', 'rrsets', 'soa', 'answers', 'negative')
+
+    def __init__(self):
+        self.children = {}
+        self.rrsets = {}      # тип -> записи
+        self.soa = None       # SOA, если узел — вершина зоны
+        self.answers = {}     # тип -> (ANCOUNT, NSCOUNT, готовые байты секций)
+        self.negative = None  # для вершины зоны: (NSCOUNT, байты SOA в authority)
+
+
+class LocalZones:
+    """Авторитетные локальные данные из зон-файлов и hosts-файлов.
+
+    Записи раскладываются по дереву меток (от корня к листьям), после чего
+    для каждого имени и типа заранее собираются байты секций ответа: имя
+    владельца записано указателем на вопрос, поэтому одни и те же байты
+    подходят и для точного совпадения, и для wildcard (`*.zone`). На запрос
+    остаётся пройти по дереву и приклеить заголовок и вопрос.
+
+    Индекс только читается; при перезагрузке строится новый объект и
+    подменяется целиком, так что запросы не ждут и не видят полусобранных данных.
+
+    Внутри зоны (есть SOA) отсутствующее имя — NXDOMAIN, отсутствующий тип —
+    NODATA, оба с SOA. Имена из hosts-файлов вне зон отвечаются только сами:
+    их поддомены уходят дальше, в кэш и upstream.
+    """
+
+    def __init__(self, records):
+        self.root = _Node()
+        self.names = 0
+        for record in records:
+            node = self._insert(record.name.lower())
+            if not node.rrsets:
+                self.names += 1
+            node.rrsets.setdefault(record.type, []).append(record)
+            if record.type == DNSType.SOA:
+                node.soa = record
+        self.types = {DNSType.A, DNSType.AAAA} | {rtype for node in self._walk(self.root) for rtype in node.rrsets}
+        for node in self._walk(self.root):
+            self._compile(node)
+
+    @classmethod
+    def load(cls, zone_files=(), hosts_files=()):
+        records = []
+        for path in zone_files:
+            with open(path, encoding='utf-8') as f:
+                records += parse_zone(f.read())
+        for path in hosts_files:
+            with open(path, encoding='utf-8') as f:
+                records += parse_hosts(f.read())
+        return cls(records)
+
+    def answer(self, request):
+        """Байты ответа из локальных данных или None, если имя не локальное"""
+        if len(request.questions) != 1:
+            return None
+        question = request.questions[0]
+        node, apex = self._match(question.name.lower())
+        if node is None:
+            if apex is None:
+                return None
+            return self._reply(request, RCODE_NXDOMAIN, 0, *apex.negative)
+        entry = node.answers.get(question.type)
+        if entry is None and DNSType.CNAME in node.rrsets:
+            entry = node.answers[DNSType.CNAME]  # тип, которого нет в данных: только CNAME
+        if entry is None:
+            if apex is None and not node.rrsets:
+                return None  # промежуточная метка имени из hosts-файла
+            entry = (0,) + (apex.negative if apex is not None else (0, b''))
+        return self._reply(request, 0, *entry)
+
+    @staticmethod
+    def _reply(request, rcode, ancount, nscount, body):
+        flags = FLAGS_LOCAL | (request.flags & 0x0100) | rcode
+        return _HEADER.pack(request.id, flags, 1, ancount, nscount, 0) + request.question_wire() + body
+
+    def _match(self, name):
+        """Узел имени (точный или wildcard ближайшего предка) и вершина ближайшей зоны"""
+        node, apex = self.root, (self.root if self.root.soa else None)
+        for label in reversed(name.split('.')) if name else ():
+            child = node.children.get(label)
+            if child is None:
+                return node.children.get('*'), apex
+            node = child
+            if node.soa is not None:
+                apex = node
+        return node, apex
+
+    def _insert(self, name):
+        node = self.root
+        for label in reversed(name.split('.')) if name else ():
+            node = node.children.setdefault(label, _Node())
+        return node
+
+    @staticmethod
+    def _walk(root):
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(node.children.values())
+
+    def _compile(self, node):
+        if node.soa is not None:
+            soa = node.soa
+            minimum = struct.unpack('!I', soa.data[-4:])[0]
+            negative = DNSRecord(soa.name, soa.type, soa.cls, min(soa.ttl, minimum), soa.data)
+            node.negative = (1, _encode_rr(encode_name(soa.name), negative))
+        for rtype, records in node.rrsets.items():
+            node.answers[rtype] = (len(records), 0, b''.join(_encode_rr(_QUESTION_POINTER, r) for r in records))
+        cnames = node.rrsets.get(DNSType.CNAME)
+        if cnames:
+            for rtype in self.types - node.rrsets.keys():
+                node.answers[rtype] = self._chase(cnames[0], rtype)
+
+    def _chase(self, cname, rtype):
+        """CNAME и цепочка за ним в пределах локальных данных"""
+        body = [_encode_rr(_QUESTION_POINTER, cname)]
+        target = cname.value.lower()
+        for _ in range(MAX_CNAME_CHAIN):
+            node, _ = self._match(target)
+            if node is None:
+                break
+            records = node.rrsets.get(rtype) or node.rrsets.get(DNSType.CNAME)
+            if not records:
+                break
+            owner = encode_name(target)
+            body += [_encode_rr(owner, record) for record in records]
+            if records[0].type != DNSType.CNAME:
+                break
+            target = records[0].value.lower()
+        return len(body), 0, b''.join(body)
+
+
+def _encode_rr(owner, record):
+    return owner + _RECORD.pack(record.type, record.cls, record.ttl, len(record.data)) + record.data
+
+
+def parse_hosts(text, ttl=LOCAL_TTL):
+    """Записи A/AAAA из hosts-файла: адрес и одно или несколько имён в строке"""
+    records = []
+    for line in text.splitlines():
+        fields = line.split('#', 1)[0].split()
+        if len(fields) < 2:
+            continue
+        address = fields[0].split('%', 1)[0]  # fe80::1%eth0
+        if ':' in address:
+            rtype, data = DNSType.AAAA, socket.inet_pton(socket.AF_INET6, address)
+        else:
+            rtype, data = DNSType.A, socket.inet_pton(socket.AF_INET, address)
+        records += [DNSRecord(name.rstrip('.').lower(), rtype, 1, ttl, data) for name in fields[1:]]
+    return records
+
+
+def parse_zone(text, origin=''):
+    """Записи из зон-файла (RFC 1035, раздел 5): $ORIGIN, $TTL, @, относительные имена,
+    пропущенный владелец, скобки и комментарии; типы A, AAAA, NS, CNAME, PTR, MX, TXT, SRV, SOA"""
+    records = []
+    ttl, owner = LOCAL_TTL, origin
+    for indented, tokens in _zone_lines(text):
+        directive = tokens[0].upper()
+        if directive == '$ORIGIN':
+            origin = _absolute(tokens[1], origin)
+            continue
+        if directive == '$TTL':
+            ttl = _seconds(tokens[1])
+            continue
+        if directive.startswith('$'):
+            raise ValueError(f"Директива {tokens[0]} не поддерживается")
+        if not indented:
+            owner = _absolute(tokens.pop(0), origin)
+        record_ttl = ttl
+        # TTL и класс могут идти перед типом в любом порядке
+        while tokens and (tokens[0].upper() == 'IN' or tokens[0][0].isdigit()):
+            token = tokens.pop(0)
+            if token.upper() != 'IN':
+                record_ttl = _seconds(token)
+        if not tokens or tokens[0].upper() not in DNSType.__members__:
+            raise ValueError(f"Неподдерживаемая запись: {owner} {' '.join(tokens)}")
+        rtype = DNSType[tokens[0].upper()]
+        try:
+            data = _rdata(rtype, tokens[1:], origin)
+        except (IndexError, OSError, ValueError, struct.error):
+            raise ValueError(f"Некорректная запись: {owner} {' '.join(tokens)}") from None
+        records.append(DNSRecord(owner, rtype, 1, record_ttl, data))
+    return records
+
+
+def _rdata(rtype, args, origin):
+    if rtype == DNSType.A:
+        return socket.inet_pton(socket.AF_INET, args[0])
+    if rtype == DNSType.AAAA:
+        return socket.inet_pton(socket.AF_INET6, args[0])
+    if rtype in (DNSType.NS, DNSType.CNAME, DNSType.PTR):
+        return encode_name(_absolute(args[0], origin))
+    if rtype == DNSType.MX:
+        return struct.pack('!H', int(args[0])) + encode_name(_absolute(args[1], origin))
+    if rtype == DNSType.SRV:
+        return struct.pack('!HHH', *map(int, args[:3])) + encode_name(_absolute(args[3], origin))
+    if rtype == DNSType.TXT:
+        data = b''
+        for arg in args:
+            text = arg[1:-1] if arg.startswith('"') else arg
+            encoded = text.encode('utf-8')
+            for i in range(0, len(encoded) or 1, 255):
+                chunk = encoded[i:i + 255]
+                data += bytes((len(chunk),)) + chunk
+        return data
+    if rtype == DNSType.SOA:
+        mname, rname = _absolute(args[0], origin), _absolute(args[1], origin)
+        return encode_name(mname) + encode_name(rname) + struct.pack('!IIIII', *map(_seconds, args[2:7]))
+    raise ValueError(f"Тип {rtype.name} не поддерживается")
+
+
+def _absolute(name, origin):
+    if name == '@':
+        return origin
+    if name.endswith('.'):
+        return name[:-1].lower()
+    return f"{name}.{origin}".lower() if origin else name.lower()
+
+
+def _seconds(value):
+    """Длительность в секундах: 3600, 1h, 1h30m, 2w"""
+    parts = _DURATION.findall(value)
+    if not parts or ''.join(number + unit for number, unit in parts) != value:
+        raise ValueError(f"Некорректная длительность: {value}")
+    return sum(int(number) * _UNITS[unit.lower()] for number, unit in parts)
+
+
+def _zone_lines(text):
+    """Логические строки зон-файла: (начинается ли с отступа, токены) со склеенными скобками"""
+    tokens, indented, depth = [], False, 0
+    for line in text.splitlines():
+        if depth == 0:
+            if tokens:
+                yield indented, tokens
+            tokens, indented = [], line[:1] in (' ', '\t')
+        for token in _tokenize(line):
+            if token == '(':
+                depth += 1
+            elif token == ')':
+                depth -= 1
+            else:
+                tokens.append(token)
+    if tokens:
+        yield indented, tokens
+
+
+def _tokenize(line):
+    tokens, i = [], 0
+    while i < len(line):
+        char = line[i]
+        if char in ' \t':
+            i += 1
+        elif char == ';':
+            break
+        elif char in '()':
+            tokens.append(char)
+            i += 1
+        elif char == '"':
+            end = line.find('"', i + 1)
+            end = len(line) if end < 0 else end + 1
+            tokens.append(line[i:end])
+            i = end
+        else:
+            start = i
+            while i < len(line) and line[i] not in ' \t;()"':
+                i += 1
+            tokens.append(line[start:i])
+    return tokens
@@ -0,0 +1,163 @@
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+SUB_BITS = 3                  # 8 линейных подбакетов на степень двойки: погрешность не больше 12.5%
+HISTOGRAM_MAX_SECONDS = 100   # большие значения попадают в последний бакет
+SAMPLE_EVERY = 16             # этапы замеряются у каждого 16-го запроса
+
+STAGES = ('parse', 'cache', 'resolve', 'encode', 'send')
+
+
+def _bucket(micros):
+    """Номер бакета для значения в микросекундах"""
+    if micros < 2 << SUB_BITS:
+        return micros
+    shift = micros.bit_length() - SUB_BITS - 1
+    return ((shift + 1) << SUB_BITS) + (micros >> shift) - (1 << SUB_BITS)
+
+
+def _bucket_upper(index):
+    """Верхняя граница бакета в микросекундах (не включительно)"""
+    if index < 2 << SUB_BITS:
+        return index + 1
+    shift = (index >> SUB_BITS) - 1
+    return ((index & ((1 << SUB_BITS) - 1)) + (1 << SUB_BITS) + 1) << shift
+
+
+_MAX_MICROS = HISTOGRAM_MAX_SECONDS * 1_000_000
+_BUCKETS = _bucket(_MAX_MICROS) + 1
+# Границы le для Prometheus: степени двойки от 16 мкс, каждая совпадает с началом бакета
+_EXPORT_BOUNDS = [(1 << power, _bucket(1 << power))
+                  for power in range(SUB_BITS + 1, _MAX_MICROS.bit_length() + 1)]
+
+
+class Histogram:
+    """Гистограмма задержек в духе HdrHistogram: логарифмические бакеты по степеням
+    двойки, каждый поделён на 2**SUB_BITS линейных, значения — в микросекундах.
+
+    Запись — вычисление номера бакета и инкремент в списке, без блокировок:
+    при одновременной записи из нескольких потоков изредка теряется единица,
+    что для статистики задержек несущественно.
+    """
+    __slots__ = ('counts', 'count', 'total')
+
+    def __init__(self):
+        self.counts = [0] * _BUCKETS
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds, weight=1):
+        """Запись значения; weight > 1 — значение представляет weight замеров (выборка)"""
+        micros = int(seconds * 1_000_000)
+        self.counts[_bucket(micros) if micros < _MAX_MICROS else _BUCKETS - 1] += weight
+        self.count += weight
+        self.total += seconds * weight
+
+    def percentile(self, q):
+        """Верхняя граница бакета, в который попадает q-й процентиль, в секундах"""
+        if not self.count:
+            return 0.0
+        rank = self.count * q / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return _bucket_upper(index) / 1_000_000
+        return HISTOGRAM_MAX_SECONDS
+
+    def cumulative(self):
+        """Пары (граница в секундах, число значений меньше неё) для экспорта"""
+        result = []
+        seen, start = 0, 0
+        for bound, end in _EXPORT_BOUNDS:
+            seen += sum(self.counts[start:end])
+            start = end
+            result.append((bound / 1_000_000, seen))
+        return result
+
+
+class Metrics:
+    """Счётчики запросов по типам и гистограммы этапов обработки запроса.
+
+    Этапы: parse — разбор пакета, cache — поиск в кэше, resolve — ожидание
+    upstream при промахе, encode — сборка ответа, send — отправка.
+
+    Счётчики точные, а этапы замеряются у каждого sample_every-го запроса:
+    замер с записью в гистограмму стоит около микросекунды, что сравнимо со
+    всей обработкой попадания в кэш. Замер записывается с весом sample_every,
+    поэтому _count и _sum гистограмм оценивают полное число запросов и время.
+    """
+
+    def __init__(self, sample_every=SAMPLE_EVERY):
+        self.sample_every = sample_every
+        self.ticks = 0
+        self.queries = {'udp': Counter(), 'tcp': Counter()}  # транспорт -> тип запроса -> число
+        self.stages = {stage: Histogram() for stage in STAGES}
+
+    def start(self):
+        """Начало обработки запроса: момент времени, если запрос попал в выборку, иначе 0"""
+        self.ticks += 1
+        if self.ticks % self.sample_every:
+            return 0
+        return perf_counter()
+
+    def lap(self, stage, started):
+        """Записывает время этапа, начатого в started; возвращает конец этапа"""
+        if not started:
+            return 0
+        now = perf_counter()
+        self.stages[stage].record(now - started, self.sample_every)
+        return now
+
+
+def format_metric(name, kind, help_text, samples):
+    """Метрика в текстовом формате Prometheus; samples — пары (метки, значение)"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels)} {value}")
+    return lines
+
+
+def format_histogram(name, help_text, histograms):
+    """Гистограммы в формате Prometheus; histograms — пары (метки, Histogram)"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for labels, histogram in histograms:
+        for bound, count in histogram.cumulative():
+            lines.append(f"{name}_bucket{_labels(labels + (('le', f'{bound:g}'),))} {count}")
+        lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(labels)} {histogram.total}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+    return lines
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def serve_metrics(render, port, host='127.0.0.1'):
+    """HTTP-сервер с /metrics в фоновом потоке; render() возвращает текст метрик.
+    Возвращает сервер, который останавливается через shutdown()"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # без строки в консоли на каждый опрос
+
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
@@ -0,0 +1,253 @@
+import bisect
+import hashlib
+import itertools
+from array import array
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+SNAPSHOT_MAGIC = b'DNSCSNP1'
+JOURNAL_MAGIC = b'DNSCJRN1'
+
+# Заголовок снимка: магия, число записей
+_SNAPSHOT_HEADER = struct.Struct('<8sQ')
+# Заголовок записи: crc32 остатка записи, длина имени, тип, класс, конец вопроса в wire,
+# длина wire, длина упакованных TTL, время сохранения и истечения (по настенным часам)
+_RECORD = struct.Struct('<IHHHHHHdd')
+
+
+def key_hash(name, qtype, qclass):
+    """64-битный хеш ключа, одинаковый между запусками (в отличие от hash())"""
+    digest = hashlib.blake2b(b'%s/%d/%d' % (name.encode('ascii', 'replace'), qtype, qclass), digest_size=8)
+    return int.from_bytes(digest.digest(), 'little')
+
+
+def encode_record(key, wire, ttl_offsets, question_end, stored_at, expires):
+    name, qtype, qclass = key
+    name_bytes = name.encode('ascii', 'replace')
+    body = struct.pack('<HHHHHHdd', len(name_bytes), qtype, qclass, question_end, len(wire), len(ttl_offsets),
+                       stored_at, expires) + name_bytes + wire + ttl_offsets
+    return struct.pack('<I', zlib.crc32(body)) + body
+
+
+def decode_record(buffer, offset):
+    """Разбор записи; возвращает (key, wire, ttl_offsets, question_end, stored_at, expires, конец) или None"""
+    if offset + _RECORD.size > len(buffer):
+        return None
+    crc, name_len, qtype, qclass, question_end, wire_len, ttl_len, stored_at, expires = \
+        _RECORD.unpack_from(buffer, offset)
+    end = offset + _RECORD.size + name_len + wire_len + ttl_len
+    if end > len(buffer) or zlib.crc32(buffer[offset + 4:end]) != crc:
+        return None  # запись оборвана или повреждена (например, при аварийном завершении)
+    position = offset + _RECORD.size
+    name = bytes(buffer[position:position + name_len]).decode('ascii')
+    position += name_len
+    wire = bytes(buffer[position:position + wire_len])
+    position += wire_len
+    ttl_offsets = bytes(buffer[position:end])
+    return (name, qtype, qclass), wire, ttl_offsets, question_end, stored_at, expires, end
+
+
+class SnapshotStore:
+    """Хранение кэша на диске: снимок с индексом + журнал дописываемых записей.
+
+    Снимок отображается в память (mmap) и не разбирается при запуске: в начале
+    файла лежит отсортированный массив 64-битных хешей ключей и массив смещений,
+    запись ищется двоичным поиском при первом обращении к ключу и после этого
+    помечается забранной: дальше ключом распоряжается кэш в памяти, и вытесненная
+    или не допущенная политикой запись из снимка не возвращается. Новые записи
+    дописываются в журнал пачками из фонового потока; при разрастании журнала
+    снимок пересобирается во временный файл и атомарно подменяется через os.replace.
+    """
+
+    def __init__(self, path, compact_after=100_000):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.compact_after = compact_after
+        self.journal_records = 0
+        # (mmap, хеши, смещения, число записей) — заменяется целиком, чтобы читатели видели согласованный снимок
+        self.snapshot = (None, (), (), 0)
+        self.taken = bytearray()  # 1 — запись снимка уже забрана в кэш или вытеснена
+        self.lock = threading.Lock()
+
+    def open(self):
+        """Отображает снимок в память и возвращает записи журнала для загрузки в кэш"""
+        self._open_snapshot()
+        return self._read_journal()
+
+    def _open_snapshot(self):
+        try:
+            with open(self.path, 'rb') as f:
+                snapshot = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError, OSError):
+            return  # ValueError — пустой файл
+        if len(snapshot) < _SNAPSHOT_HEADER.size:
+            snapshot.close()
+            return
+        magic, count = _SNAPSHOT_HEADER.unpack_from(snapshot, 0)
+        if magic != SNAPSHOT_MAGIC:
+            print("Неизвестный формат снимка кэша, начнем с пустого")
+            snapshot.close()
+            return
+        start = _SNAPSHOT_HEADER.size
+        with memoryview(snapshot) as view:
+            hashes = view[start:start + count * 8].cast('Q')
+            offsets = view[start + count * 8:start + count * 16].cast('Q')
+        # Все читатели снимка (take, discard) держат self.lock: после подмены под замком
+        # старое отображение никем не используется и его можно закрыть
+        with self.lock:
+            old = self.snapshot
+            self.snapshot = (snapshot, hashes, offsets, count)
+            self.taken = bytearray(count)
+        self._close_snapshot(old)
+
+    @staticmethod
+    def _close_snapshot(snapshot):
+        mapped, hashes, offsets, _ = snapshot
+        if mapped is None:
+            return
+        hashes.release()  # mmap не закрывается, пока на него есть memoryview
+        offsets.release()
+        mapped.close()
+
+    def __len__(self):
+        return self.snapshot[3]
+
+    def _read_journal(self):
+        records = []
+        try:
+            with open(self.journal_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return records
+        if not data.startswith(JOURNAL_MAGIC):
+            return records
+        offset = len(JOURNAL_MAGIC)
+        while True:
+            record = decode_record(data, offset)
+            if record is None:
+                break
+            records.append(record[:6])
+            offset = record[6]
+        self.journal_records = len(records)
+        return records
+
+    def _find(self, key):
+        """Индекс и запись снимка по ключу или (None, None); вызывается под self.lock"""
+        snapshot, hashes, offsets, count = self.snapshot
+        if not count:
+            return None, None
+        h = key_hash(*key)
+        index = bisect.bisect_left(hashes, h)
+        while index < count and hashes[index] == h:
+            record = decode_record(snapshot, offsets[index])
+            if record is not None and record[0] == key:
+                return index, record
+            index += 1
+        return None, None
+
+    def take(self, key):
+        """Забирает запись снимка по ключу: (wire, ttl_offsets, question_end, stored_at, expires) или None.
+
+        Каждая запись отдаётся не больше одного раза.
+        """
+        with self.lock:
+            index, record = self._find(key)
+            if index is None or self.taken[index]:
+                return None
+            self.taken[index] = 1
+            return record[1:6]
+
+    def discard(self, key):
+        """Помечает запись снимка забранной, например, когда ключ вытеснен из кэша"""
+        with self.lock:
+            index, _ = self._find(key)
+            if index is not None:
+                self.taken[index] = 1
+
+    def iter_snapshot(self):
+        """Ещё не забранные записи текущего снимка в виде (key, закодированная запись, expires)"""
+        snapshot, _, offsets, count = self.snapshot
+        for index in range(count):
+            if self.taken[index]:
+                continue
+            offset = offsets[index]
+            record = decode_record(snapshot, offset)
+            if record is not None:
+                yield record[0], bytes(snapshot[offset:record[6]]), record[5]
+
+    def iter_records(self):
+        """Ещё не забранные записи текущего снимка: (key, wire, ttl_offsets, question_end, stored_at, expires)"""
+        snapshot, _, offsets, count = self.snapshot
+        for index in range(count):
+            if self.taken[index]:
+                continue
+            record = decode_record(snapshot, offsets[index])
+            if record is not None:
+                yield record[:6]
+
+    def write_journal(self, records):
+        """Дописывает записи (key, wire, ttl_offsets, question_end, stored_at, expires) в журнал"""
+        chunks = [encode_record(*record) for record in records]
+        if not chunks:
+            return
+        new_file = not os.path.exists(self.journal_path)
+        with open(self.journal_path, 'ab') as f:
+            if new_file or f.tell() == 0:
+                f.write(JOURNAL_MAGIC)
+            f.write(b''.join(chunks))
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_records += len(chunks)
+
+    def needs_compaction(self):
+        return self.journal_records >= self.compact_after
+
+    def compact(self, records, now, max_entries=None, max_bytes=None):
+        """Пересборка снимка из актуальных записей кэша.
+
+        records — итерируемое (key, wire, ttl_offsets, question_end, stored_at, expires)
+        с временами по настенным часам. Журнал к этому моменту должен быть дописан.
+        Снимок ограничен max_entries записями и max_bytes байтами: сначала в него
+        идут записи кэша (истекающие позже — первыми), оставшееся место занимают
+        ещё живые и не забранные кэшем записи старого снимка.
+        """
+        live = sorted((record for record in records if record[5] > now), key=lambda record: record[5], reverse=True)
+        candidates = ((record[0], encode_record(*record)) for record in live)
+        old = ((key, data) for key, data, expires in self.iter_snapshot() if expires > now)
+        encoded = {}
+        size = 0
+        for key, data in itertools.chain(candidates, old):
+            if max_entries is not None and len(encoded) >= max_entries:
+                break
+            if key in encoded or max_bytes is not None and size + len(data) > max_bytes:
+                continue
+            encoded[key] = data
+            size += len(data)
+
+        items = sorted((key_hash(*key), data) for key, data in encoded.items())
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(items)))
+            offset = _SNAPSHOT_HEADER.size + len(items) * 16
+            offsets = []
+            for _, data in items:
+                offsets.append(offset)
+                offset += len(data)
+            # Массивы индекса в родном порядке байт: при чтении они отображаются через memoryview.cast('Q')
+            f.write(array('Q', (h for h, _ in items)).tobytes())
+            f.write(array('Q', offsets).tobytes())
+            for _, data in items:
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        # Всё из журнала уже вошло в снимок
+        with open(self.journal_path, 'wb') as f:
+            f.write(JOURNAL_MAGIC)
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_records = 0
+        self._open_snapshot()
@@ -0,0 +1,116 @@
+import socket
+from array import array
+
+from DnsServer.main.const import (RATE_LIMIT_IPV4_PREFIX, RATE_LIMIT_IPV6_PREFIX, RATE_LIMIT_SLOTS,
+                                  RATE_LIMIT_WAYS, RRL_SLIP)
+from DnsServer.main.dns_packet import truncate
+
+
+def prefix_key(ip):
+    """Ключ подсети клиента: /24 для IPv4, /56 для IPv6"""
+    if ':' in ip:
+        address = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big')
+        return hash((6, address >> (128 - RATE_LIMIT_IPV6_PREFIX)))
+    return int.from_bytes(socket.inet_aton(ip), 'big') >> (32 - RATE_LIMIT_IPV4_PREFIX)
+
+
+class TokenBuckets:
+    """Токен-бакеты в таблице фиксированного размера, ассоциативной по наборам.
+
+    Слот хранит хеш ключа, число токенов и время последнего пополнения в
+    массивах array, поэтому память не зависит от числа клиентов (около 24 байт
+    на слот), а проверка — O(RATE_LIMIT_WAYS) без блокировок. Ключ ищется в
+    своём наборе из RATE_LIMIT_WAYS слотов; новый ключ занимает слот с самым
+    полным бакетом и наследует его токены, а не получает полный бакет. Так
+    бакет нарушителя не сбрасывается, пока в наборе есть менее активные
+    клиенты, а коллизия может лишь урезать всплеск легитимного клиента.
+    """
+
+    def __init__(self, rate, burst, slots=RATE_LIMIT_SLOTS):
+        self.rate = rate
+        self.burst = burst
+        self.sets = max(1, slots // RATE_LIMIT_WAYS)
+        self.slots = self.sets * RATE_LIMIT_WAYS
+        self.keys = array('q', bytes(8 * self.slots))
+        self.tokens = array('d', [burst]) * self.slots  # свободный слот — полный бакет
+        self.stamps = array('d', bytes(8 * self.slots))
+
+    def take(self, key, now):
+        """Списывает токен из бакета ключа (хеша); False, если бакет пуст"""
+        first = key % self.sets * RATE_LIMIT_WAYS
+        keys = self.keys
+        for i in range(first, first + RATE_LIMIT_WAYS):
+            if keys[i] == key:
+                break
+        else:
+            i = self.replace(first, now)
+            keys[i] = key
+        tokens = self.tokens[i] + (now - self.stamps[i]) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        self.stamps[i] = now
+        if tokens < 1:
+            self.tokens[i] = tokens
+            return False
+        self.tokens[i] = tokens - 1
+        return True
+
+    def replace(self, first, now):
+        """Слот набора с наибольшим числом токенов после пополнения"""
+        best, most = first, -1.0
+        for i in range(first, first + RATE_LIMIT_WAYS):
+            tokens = min(self.burst, self.tokens[i] + (now - self.stamps[i]) * self.rate)
+            if tokens > most:
+                best, most = i, tokens
+        return best
+
+
+class ClientRateLimiter:
+    """Ограничение числа запросов с одной подсети, проверяется до разбора пакета"""
+
+    def __init__(self, rate, burst=None, slots=RATE_LIMIT_SLOTS):
+        self.buckets = TokenBuckets(rate, burst or 2 * rate, slots)
+        self.dropped = 0
+
+    def allow(self, ip, now):
+        if self.buckets.take(prefix_key(ip), now):
+            return True
+        self.dropped += 1
+        return False
+
+
+class ResponseRateLimiter:
+    """Ограничение частоты одинаковых ответов одной подсети (RRL, как в BIND).
+
+    Одинаковыми считаются ответы NOERROR на одно имя и тип, а ошибки (NXDOMAIN,
+    SERVFAIL, ...) — по коду ответа, чтобы поток случайных несуществующих имён
+    тоже упирался в лимит. Сверх лимита каждый slip-й ответ уходит обрезанным
+    с флагом TC (настоящий клиент повторит запрос по TCP, где адрес не подделать),
+    остальные отбрасываются; slip=0 — отбрасывать все.
+    """
+
+    def __init__(self, rate, slip=RRL_SLIP, burst=None, slots=RATE_LIMIT_SLOTS):
+        self.buckets = TokenBuckets(rate, burst or rate, slots)
+        self.slip = slip
+        self.limited = array('H', bytes(2 * self.buckets.slots))  # ответов сверх лимита по слотам, по модулю slip
+        self.dropped = 0
+        self.slipped = 0
+
+    def limit(self, ip, request, wire, now):
+        """Ответ для отправки: wire, обрезанный ответ или None — ничего не отправлять"""
+        rcode = wire[3] & 0x0F
+        if rcode:
+            key = hash((prefix_key(ip), rcode))
+        else:
+            question = request.questions[0]
+            key = hash((prefix_key(ip), question.name.lower(), question.type))
+        if self.buckets.take(key, now):
+            return wire
+        if self.slip:
+            i = key % self.buckets.slots
+            self.limited[i] = (self.limited[i] + 1) % self.slip
+            if self.limited[i] == 0:
+                self.slipped += 1
+                return truncate(wire)
+        self.dropped += 1
+        return None
@@ -0,0 +1,147 @@
+from DnsServer.main.const import ROOT_SERVERS, SOCKET_TIMEOUT
+from DnsServer.main.dns_packet import RCODE_REFUSED, RCODE_SERVFAIL, DNSClass, DNSPacket, DNSQuestion, DNSType
+from DnsServer.main.upstream import UpstreamClient
+
+MAX_REFERRALS = 16   # переходов по делегированиям на одно имя
+MAX_CNAME_CHAIN = 8  # звеньев CNAME-цепочки
+MAX_DEPTH = 4        # вложенных разрешений имён NS-серверов без glue
+
+FLAG_AA = 0x0400
+
+
+def is_subdomain(name, zone):
+    """Лежит ли имя в зоне (корневая зона — пустая строка)"""
+    return not zone or name == zone or name.endswith('.' + zone)
+
+
+class IterativeResolver:
+    """Итеративное разрешение имён начиная с корневых серверов.
+
+    Резолвер спрашивает авторитетные серверы без флага RD и идёт по
+    делегированиям. NS-записи из секции authority и glue из секции additional
+    сохраняет DNSCache.update — только те, за которые отвечает спрошенный
+    сервер (см. _in_bailiwick), поэтому следующий запрос начинается с ближайшего
+    закэшированного разреза зоны, а не с корня.
+    """
+
+    def __init__(self, cache, root_hints=None, port=53, timeout=SOCKET_TIMEOUT):
+        self.cache = cache
+        self.root_hints = root_hints or [(ip, port) for ip in ROOT_SERVERS]
+        self.port = port  # порт авторитетных серверов, найденных по делегированиям
+        self.client = UpstreamClient([], timeout=timeout)
+        self.queries = 0
+
+    def resolve(self, request):
+        """Ответ на вопрос запроса или None, если ни один сервер не ответил"""
+        question = request.questions[0]
+        answers, response = self._resolve_chain(question.name.lower(), question.type, question.cls, 0)
+        if response is None:
+            return None
+        # Для NXDOMAIN и пустого ответа оставляем SOA из authority
+        authorities = [record for record in response.authorities if record.type == DNSType.SOA]
+        result = DNSPacket(request.id, 0x8180 | response.rcode, request.questions, answers, authorities, [])
+        result.raw_data = result.to_wire()
+        return result
+
+    def close(self):
+        self.client.close()
+
+    def _resolve_chain(self, name, qtype, qclass, depth):
+        """Разрешение с переходами по CNAME; возвращает записи цепочки и последний ответ"""
+        answers = []
+        response = None
+        for _ in range(MAX_CNAME_CHAIN):
+            response = self._resolve_name(name, qtype, qclass, depth)
+            if response is None or response.rcode != 0:
+                return answers, response
+            answers += response.answers
+            # CNAME-цепочка могла прийти целиком: идём по ней внутри ответа
+            final = {record.name.lower() for record in response.answers if record.type == qtype}
+            aliases = {record.name.lower(): record.value.lower()
+                       for record in response.answers if record.type == DNSType.CNAME}
+            target, seen = name, set()
+            while target not in final and target in aliases and target not in seen:
+                seen.add(target)
+                target = aliases[target]
+            if target == name or target in final:
+                return answers, response
+            name = target
+        return answers, response
+
+    def _resolve_name(self, name, qtype, qclass, depth):
+        """Проход по делегированиям от ближайшего известного разреза зоны до ответа"""
+        zone, servers = self._closest_servers(name)
+        query = DNSPacket(0, 0x0000, [DNSQuestion(name, qtype, qclass)], [], [], [])
+        query.raw_data = query.to_wire()
+        for _ in range(MAX_REFERRALS):
+            self.queries += 1
+            response = self.client.resolve(query, servers)
+            if response is None or response.rcode in (RCODE_SERVFAIL, RCODE_REFUSED):
+                return None
+            authoritative = bool(response.flags & FLAG_AA)
+            # В кэше ответ должен выглядеть как рекурсивный: QR, RD, RA без AA
+            response.flags = 0x8180 | response.rcode
+            if response.answers or response.rcode != 0 or authoritative:
+                response = self._in_bailiwick(response, name, zone)
+                self.cache.update(response)
+                return response
+            referral = [record for record in response.authorities if record.type == DNSType.NS]
+            if referral:
+                cut = referral[0].name.lower()
+                if cut == zone or not is_subdomain(cut, zone) or not is_subdomain(name, cut):
+                    print(f"Некорректное делегирование {cut or '.'} от сервера зоны {zone or '.'}")
+                    return None
+                referral = [record for record in referral if record.name.lower() == cut]
+            response = self._in_bailiwick(response, name, zone)
+            self.cache.update(response)
+            if not referral:
+                return response
+            zone = cut
+            servers = self._addresses([record.value.lower() for record in referral], depth)
+            if not servers:
+                print(f"Не удалось получить адреса NS-серверов зоны {zone}")
+                return None
+        return None
+
+    @staticmethod
+    def _in_bailiwick(response, name, zone):
+        """Ответ сервера зоны zone только с записями, которым можно верить (защита от
+        отравления кэша): ответы — об именах внутри zone, authority — о зонах между
+        zone и запрошенным именем, additional — только glue для NS-серверов, лежащих
+        внутри делегируемой ими зоны"""
+        answers = [record for record in response.answers if is_subdomain(record.name.lower(), zone)]
+        authorities = [record for record in response.authorities
+                       if is_subdomain(record.name.lower(), zone) and is_subdomain(name, record.name.lower())]
+        glue = {record.value.lower() for record in authorities
+                if record.type == DNSType.NS and is_subdomain(record.value.lower(), record.name.lower())}
+        additionals = [record for record in response.additionals
+                       if record.type in (DNSType.A, DNSType.AAAA) and record.name.lower() in glue]
+        return DNSPacket(response.id, response.flags, response.questions, answers, authorities, additionals)
+
+    def _closest_servers(self, name):
+        """Самая глубокая зона из кэша, для которой известны адреса NS-серверов"""
+        labels = name.split('.')
+        for i in range(len(labels)):
+            zone = '.'.join(labels[i:])
+            ns_names = [record.value.lower() for record in self.cache.get_records(zone, DNSType.NS)]
+            if ns_names:
+                servers = self._cached_addresses(ns_names)
+                if servers:
+                    return zone, servers
+        return '', self.root_hints
+
+    def _cached_addresses(self, ns_names):
+        return [(record.value, self.port)
+                for ns in ns_names for record in self.cache.get_records(ns, DNSType.A)]
+
+    def _addresses(self, ns_names, depth):
+        """Адреса NS-серверов: glue из кэша, иначе разрешение имени сервера"""
+        servers = self._cached_addresses(ns_names)
+        if servers or depth >= MAX_DEPTH:
+            return servers
+        for ns in ns_names:
+            answers, _ = self._resolve_chain(ns, DNSType.A, DNSClass.IN, depth + 1)
+            servers = [(record.value, self.port) for record in answers if record.type == DNSType.A]
+            if servers:
+                return servers
+        return []
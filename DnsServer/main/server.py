@@ -1,30 +1,105 @@
 import socket
 import threading
 import time
-from DnsServer.main.dns_packet import DNSPacket
-from DnsServer.main.cache import DNSCache
+from concurrent.futures import Future, ThreadPoolExecutor
+from DnsServer.main.dns_packet import (MAX_UDP_PAYLOAD, RCODE_SERVFAIL, DNSPacket, DNSType, add_opt, patch_id,
+                                       truncate)
+from DnsServer.main.blocklist import Blocklist
+from DnsServer.main.cache import DNSCache, question_key
+from DnsServer.main.local_zones import LocalZones
+from DnsServer.main.const import (CACHE_CLEANUP_INTERVAL, CACHE_MAX_BYTES, CACHE_MAX_ENTRIES, DEFAULT_DNS_SERVERS,
+                                  EDNS_UDP_PAYLOAD, STALE_CLIENT_TIMEOUT, STALE_MAX_AGE, TCP_IDLE_TIMEOUT,
+                                  TCP_PIPELINE_LIMIT)
+from DnsServer.main.metrics import Metrics, format_histogram, format_metric, serve_metrics
+from DnsServer.main.resolver import IterativeResolver
+from DnsServer.main.singleflight import SingleFlight
+from DnsServer.main.upstream import UpstreamClient
+
+CACHE_COUNTERS = {
+    'hits': 'Попаданий в кэш',
+    'misses': 'Промахов кэша',
+    'expired': 'Записей, удалённых по истечении TTL',
+    'evictions': 'Записей, вытесненных при переполнении',
+    'rejected': 'Новых записей, не допущенных в переполненный кэш',
+    'stale_hits': 'Просроченных ответов при недоступности upstream',
+    'negative_hits': 'Ответов NXDOMAIN, выведенных из закэшированного NXDOMAIN родителя',
+}
 
 
 class DNSServer:
-    def __init__(self, cache_file='data/cache.pickle'):
-        self.cache = DNSCache(cache_file)
+    def __init__(self, cache_file='data/cache.snapshot', cache_max_entries=CACHE_MAX_ENTRIES,
+                 cache_max_bytes=CACHE_MAX_BYTES, stale_max_age=STALE_MAX_AGE, prefetch=True):
+        self.cache = DNSCache(cache_file, cache_max_entries, cache_max_bytes, stale_max_age=stale_max_age)
+        if prefetch:
+            self.cache.prefetch = self.prefetch
+        self.prefetching = set()  # ключи, обновляемые в фоне
+        self._prefetch_lock = threading.Lock()
+        self.prefetches = 0
+        self.upstreams = [(ip, 53) for ip in DEFAULT_DNS_SERVERS]
+        self._upstream_client = None
+        self._upstream_lock = threading.Lock()
+        self.iterative = False   # разрешение от корневых серверов вместо пересылки upstream
+        self.root_hints = None   # адреса корневых серверов; по умолчанию ROOT_SERVERS
+        self._resolver = None
+        self.reuse_port = False  # SO_REUSEPORT для нескольких процессов на одном порту
+        self.edns_payload = EDNS_UDP_PAYLOAD  # наибольший UDP-ответ клиенту с EDNS(0)
+        self.inflight = SingleFlight()
+        self.zone_files = []   # зон-файлы с авторитетными локальными данными
+        self.hosts_files = []  # hosts-файлы: имя -> A/AAAA
+        self.local = None      # LocalZones; подменяется целиком при перезагрузке
+        self.local_answers = 0
+        self.blocklist_files = []  # списки блокируемых доменов
+        self.sinkholes = []        # адреса-заглушки для заблокированных имён; пусто — NXDOMAIN
+        self.blocklist = None      # Blocklist; подменяется целиком при перезагрузке
+        self.blocked = 0
+        self.metrics = Metrics()
+        self.limiter = None  # ClientRateLimiter: запросов в секунду с подсети, до разбора пакета
+        self.rrl = None      # ResponseRateLimiter: одинаковых UDP-ответов в секунду подсети
+        self.metrics_port = None  # порт HTTP-сервера с /metrics; None — не запускать
+        self._metrics_http = None
         self.running = False
         self.cleanup_thread = threading.Thread(target=self.cleanup_cache)
         self.cleanup_thread.daemon = True
 
+    @property
+    def upstream_client(self):
+        """Клиент к вышестоящим серверам; создаётся при первом промахе (в т.ч. после fork)"""
+        if self._upstream_client is None:
+            with self._upstream_lock:
+                if self._upstream_client is None:
+                    self._upstream_client = UpstreamClient(self.upstreams, payload=self.edns_payload)
+        return self._upstream_client
+
+    @property
+    def resolver(self):
+        """Итеративный резолвер; создаётся при первом промахе"""
+        if self._resolver is None:
+            with self._upstream_lock:
+                if self._resolver is None:
+                    self._resolver = IterativeResolver(self.cache, self.root_hints)
+        return self._resolver
+
     def start(self, port=53):
         """Запуск DNS сервера на указанном порту"""
         try:
             self.running = True
             self.cleanup_thread.start()
+            self.cache.start_persistence()
+            self.start_metrics()
+            tcp_listener = self._bind_tcp(port)
+            threading.Thread(target=self.serve_tcp, args=(tcp_listener,), daemon=True).start()
 
             with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                if self.reuse_port:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
                 sock.bind(('0.0.0.0', port))
                 print(f"DNS сервер запущен на порту {port}")
 
                 while self.running:
                     try:
-                        data, addr = sock.recvfrom(512)
+                        data, addr = sock.recvfrom(65535)
+                        if not self.allow(addr):
+                            continue
                         threading.Thread(target=self.handle_request, args=(sock, data, addr)).start()
                     except socket.error as e:
                         print(f"Ошибка сокета: {e}")
@@ -38,57 +113,365 @@ class DNSServer:
 
     def handle_request(self, sock, data, addr):
         """Обработка DNS запроса"""
+        metrics = self.metrics
         try:
             # Парсим запрос
+            started = metrics.start()
             request = DNSPacket.parse(data)
+            started = metrics.lap('parse', started)
+            metrics.queries['udp'][request.questions[0].type] += 1
 
-            # Проверяем кэш
-            response = self.cache.get_response(request)
-
-            if not response:
+            # Локальные данные, затем кэш: при попадании получаем готовые байты ответа
+            wire = self.lookup(request)
+            started = metrics.lap('cache', started)
+            if wire is None:
                 # Если нет в кэше, выполняем рекурсивный запрос
-                response = self.recursive_resolve(request)
-                if response:
-                    # Добавляем все записи в кэш
-                    self.cache.update(response)
-
-            if response:
-                sock.sendto(response.raw_data, addr)
-            else:
-                # Отправляем ошибку, если не удалось разрешить
-                error_response = request.create_error_response()
-                sock.sendto(error_response.raw_data, addr)
+                response = self.resolve_or_stale(request)
+                started = metrics.lap('resolve', started)
+                wire = self.build_reply(request, response)
+            reply = self.limit_reply(request, self.udp_reply(request, wire), addr)
+            started = metrics.lap('encode', started)
+            if reply is None:
+                return
+            sock.sendto(reply, addr)
+            metrics.lap('send', started)
 
         except Exception as e:
             print(f"Ошибка обработки запроса: {e}")
 
-    def recursive_resolve(self, request):
-        """Рекурсивное разрешение DNS запроса"""
-        # Здесь должна быть логика рекурсивного запроса к корневым серверам
-        # Это упрощенная версия - в реальности нужно реализовать полный алгоритм
+    def answer(self, request):
+        """Байты ответа на запрос без учёта транспорта"""
+        # Локальные данные, затем кэш: при попадании получаем готовые байты ответа
+        wire = self.lookup(request)
+        if wire is None:
+            # Если нет в кэше, выполняем рекурсивный запрос
+            wire = self.build_reply(request, self.resolve_or_stale(request))
+        return wire
+
+    def lookup(self, request):
+        """Готовый ответ из локальных зон, списка блокировки или кэша; None — нужен запрос к upstream"""
+        local = self.local
+        if local is not None:
+            wire = local.answer(request)
+            if wire is not None:
+                self.local_answers += 1
+                return wire
+        blocklist = self.blocklist
+        if blocklist is not None:
+            wire = blocklist.answer(request)
+            if wire is not None:
+                self.blocked += 1
+                return wire
+        return self.cache.get_wire(request)
+
+    def load_local(self):
+        """Загрузка зон- и hosts-файлов. Новый индекс собирается целиком и подменяет
+        старый одним присваиванием; при ошибке в файлах остаётся прежний"""
+        if not self.zone_files and not self.hosts_files:
+            self.local = None
+            return True
+        try:
+            local = LocalZones.load(self.zone_files, self.hosts_files)
+        except (OSError, ValueError) as e:
+            print(f"Ошибка загрузки локальных зон: {e}")
+            return False
+        self.local = local
+        print(f"Локальные зоны загружены: {local.names} имён")
+        return True
+
+    def load_blocklist(self):
+        """Загрузка списков блокировки; как и зоны, подменяются целиком, при ошибке остаётся прежний.
+        Пока строится новый индекс, в памяти находятся оба"""
+        if not self.blocklist_files:
+            self.blocklist = None
+            return True
+        started = time.monotonic()
+        try:
+            blocklist = Blocklist.load(self.blocklist_files, self.sinkholes)
+        except (OSError, ValueError) as e:
+            print(f"Ошибка загрузки списка блокировки: {e}")
+            return False
+        self.blocklist = blocklist
+        print(f"Список блокировки загружен: {len(blocklist)} имён, {blocklist.nbytes / 2**20:.1f} МБ, "
+              f"{time.monotonic() - started:.1f} с")
+        return True
+
+    def reload(self):
+        """Перезагрузка локальных зон и списков блокировки в фоне (по SIGHUP),
+        не задерживая обработку запросов"""
+        def run():
+            self.load_local()
+            self.load_blocklist()
+        threading.Thread(target=run, daemon=True).start()
+
+    def udp_reply(self, request, wire):
+        """Ответ для отправки по UDP: с OPT, если клиент прислал EDNS(0), и с флагом TC,
+        если ответ не помещается в объявленный клиентом размер (или 512 байт без EDNS)"""
+        payload = request.edns_payload()
+        if payload is None:
+            return truncate(wire) if len(wire) > MAX_UDP_PAYLOAD else wire
+        if len(wire) + 11 > min(payload, self.edns_payload):  # 11 байт — сама OPT-запись
+            wire = truncate(wire)
+        return add_opt(wire, self.edns_payload)
+
+    def limit_reply(self, request, reply, addr):
+        """UDP-ответ после RRL: как есть, обрезанный или None — не отправлять"""
+        if self.rrl is None:
+            return reply
+        return self.rrl.limit(addr[0], request, reply, time.monotonic())
+
+    def tcp_reply(self, request, wire):
+        """Ответ для отправки по TCP: без ограничения размера, с 2-байтовой длиной впереди"""
+        if request.edns_payload() is not None:
+            wire = add_opt(wire, self.edns_payload)
+        return len(wire).to_bytes(2, 'big') + wire
+
+    def _bind_tcp(self, port):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        listener.bind(('0.0.0.0', port))
+        listener.listen(128)
+        return listener
+
+    def serve_tcp(self, listener):
+        """Приём TCP-соединений: ответы, не поместившиеся в UDP, клиенты запрашивают по TCP"""
+        with listener:
+            while self.running:
+                try:
+                    conn, addr = listener.accept()
+                except OSError as e:
+                    print(f"Ошибка TCP сокета: {e}")
+                    continue
+                if not self.allow(addr):
+                    conn.close()
+                    continue
+                threading.Thread(target=self.handle_tcp, args=(conn, addr), daemon=True).start()
+
+    def allow(self, addr):
+        """Проверка ограничения частоты запросов с подсети клиента (если оно включено)"""
+        return self.limiter is None or self.limiter.allow(addr[0], time.monotonic())
+
+    def handle_tcp(self, conn, addr):
+        """TCP-соединение клиента (RFC 7766): запросы могут идти конвейером и обрабатываются
+        пулом до TCP_PIPELINE_LIMIT потоков, ответы пишутся по мере готовности. Пока заняты
+        все потоки, соединение дальше не читается — клиента сдерживает окно TCP. Каждое
+        сообщение проверяется ограничением частоты, как датаграмма; сверх лимита соединение
+        закрывается после ответов на уже принятые запросы"""
+        write_lock = threading.Lock()
+        slots = threading.BoundedSemaphore(TCP_PIPELINE_LIMIT)
+        conn.settimeout(TCP_IDLE_TIMEOUT)
+        # Пул закрывается первым: клиент мог закрыть свою сторону сразу после запросов — дожидаемся ответов
+        with conn, ThreadPoolExecutor(max_workers=TCP_PIPELINE_LIMIT) as pool:
+            try:
+                while self.running:
+                    length = _recv_exactly(conn, 2)
+                    data = _recv_exactly(conn, int.from_bytes(length, 'big')) if length else None
+                    if not data or not self.allow(addr):
+                        break
+                    slots.acquire()
+                    pool.submit(self.handle_tcp_request, conn, write_lock, data).add_done_callback(
+                        lambda _: slots.release())
+            except OSError:
+                pass  # таймаут простоя или разрыв соединения
+
+    def handle_tcp_request(self, conn, write_lock, data):
+        try:
+            request = DNSPacket.parse(data)
+            self.metrics.queries['tcp'][request.questions[0].type] += 1
+            reply = self.tcp_reply(request, self.answer(request))
+            with write_lock:
+                conn.sendall(reply)
+        except Exception as e:
+            print(f"Ошибка обработки TCP запроса: {e}")
 
+    def resolve(self, request):
+        """Разрешение промаха кэша: одновременные одинаковые вопросы ждут один запрос к upstream"""
+        return self.inflight.do(question_key(request.questions[0]), lambda: self._resolve_and_cache(request))
+
+    def resolve_or_stale(self, request):
+        """Разрешение промаха; если есть просроченный ответ, клиент ждёт upstream
+        не дольше STALE_CLIENT_TIMEOUT, а разрешение продолжается в фоне (RFC 8767)"""
+        if not self.cache.has_stale(request):
+            return self.resolve(request)
+        result = Future()
+
+        def run():
+            try:
+                result.set_result(self.resolve(request))
+            except Exception as e:
+                result.set_exception(e)
+
+        threading.Thread(target=run, daemon=True).start()
         try:
-            # Запрос к Google DNS (как пример)
-            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-                s.settimeout(5)  # Таймаут 5 секунд
-                s.sendto(request.raw_data, ('8.8.8.8', 53))
-                data, _ = s.recvfrom(512)
-                return DNSPacket.parse(data)
-        except socket.timeout:
-            print("Таймаут при запросе к вышестоящему DNS серверу")
+            return result.result(STALE_CLIENT_TIMEOUT)
+        except TimeoutError:
             return None
+
+    def _resolve_and_cache(self, request):
+        response = self.recursive_resolve(request)
+        if response:
+            # Добавляем все записи в кэш
+            self.cache.update(response)
+        return response
+
+    def build_reply(self, request, response):
+        """Байты ответа клиенту по результату вышестоящего запроса"""
+        if response:
+            if any(record.type == DNSType.OPT for record in response.additionals):
+                # OPT upstream-а клиенту не пересылаем: свой добавляется при отправке
+                return DNSPacket(request.id, response.flags, response.questions, response.answers,
+                                 response.authorities,
+                                 [record for record in response.additionals if record.type != DNSType.OPT]).to_wire()
+            return patch_id(response.raw_data, request.id)
+        # Upstream не ответил: лучше просроченный ответ с коротким TTL, чем ошибка (RFC 8767)
+        stale = self.cache.get_stale_wire(request)
+        if stale is not None:
+            return stale
+        # Upstream недоступен — это не отсутствие имени: SERVFAIL, а не NXDOMAIN
+        return request.create_error_response(RCODE_SERVFAIL).to_wire()
+
+    def _claim_prefetch(self, request):
+        """Ключ для фонового обновления или None, если запись уже обновляется"""
+        key = question_key(request.questions[0])
+        with self._prefetch_lock:
+            if key in self.prefetching:
+                return None
+            self.prefetching.add(key)
+            self.prefetches += 1
+        return key
+
+    def _release_prefetch(self, key):
+        with self._prefetch_lock:
+            self.prefetching.discard(key)
+
+    def prefetch(self, request):
+        """Фоновое обновление записи, к которой обратились незадолго до истечения TTL"""
+        key = self._claim_prefetch(request)
+        if key is not None:
+            threading.Thread(target=self._prefetch, args=(key, request), daemon=True).start()
+
+    def _prefetch(self, key, request):
+        try:
+            self.resolve(request)
+        except Exception as e:
+            print(f"Ошибка фонового обновления записи: {e}")
+        finally:
+            self._release_prefetch(key)
+
+    def recursive_resolve(self, request):
+        """Рекурсивное разрешение DNS запроса: от корневых серверов или пересылкой upstream"""
+        try:
+            if self.iterative:
+                response = self.resolver.resolve(request)
+            else:
+                response = self.upstream_client.resolve(request)
+            if response is None:
+                print("Таймаут при запросе к вышестоящему DNS серверу")
+            return response
         except Exception as e:
             print(f"Ошибка рекурсивного разрешения: {e}")
             return None
 
+    def start_metrics(self):
+        if self.metrics_port is not None:
+            self._metrics_http = serve_metrics(self.metrics_text, self.metrics_port)
+            print(f"Метрики доступны на http://127.0.0.1:{self._metrics_http.server_address[1]}/metrics")
+
+    def _upstream_clients(self):
+        clients = [self._upstream_client, self._resolver and self._resolver.client]
+        return [client for client in clients if client is not None]
+
+    def metrics_text(self):
+        """Метрики в текстовом формате Prometheus"""
+        cache = self.cache.stats()
+        inflight = self.inflight.stats()
+        clients = self._upstream_clients()
+        # Все серверы, к которым обращались (в итеративном режиме — и авторитетные)
+        upstreams = [server for client in clients for server in list(client.known.values())]
+        queries = [(transport, qtype, count) for transport, counter in self.metrics.queries.items()
+                   for qtype, count in sorted(counter.items())]
+        lines = []
+        lines += format_metric('dns_queries_total', 'counter', 'Запросы клиентов по транспорту и типу',
+                               [((('transport', transport), ('qtype', _type_name(qtype))), count)
+                                for transport, qtype, count in queries])
+        for name, help_text in CACHE_COUNTERS.items():
+            lines += format_metric(f'dns_cache_{name}_total', 'counter', help_text, [((), cache[name])])
+        lines += format_metric('dns_cache_entries', 'gauge', 'Записей в кэше', [((), cache['entries'])])
+        lines += format_metric('dns_cache_bytes', 'gauge', 'Оценка памяти кэша, байты', [((), cache['bytes'])])
+        lines += format_metric('dns_local_answers_total', 'counter', 'Ответов из локальных зон и hosts-файлов',
+                               [((), self.local_answers)])
+        lines += format_metric('dns_blocked_total', 'counter', 'Запросов к заблокированным именам',
+                               [((), self.blocked)])
+        lines += format_metric('dns_blocklist_entries', 'gauge', 'Имён в списке блокировки',
+                               [((), len(self.blocklist) if self.blocklist else 0)])
+        lines += format_metric('dns_prefetches_total', 'counter', 'Фоновых обновлений записей',
+                               [((), self.prefetches)])
+        lines += format_metric('dns_coalesced_total', 'counter', 'Промахов, объединённых с уже идущим запросом',
+                               [((), inflight['coalesced'])])
+        lines += format_metric('dns_upstream_inflight', 'gauge', 'Запросов к upstream в ожидании ответа',
+                               [((), sum(client.in_flight() for client in clients))])
+        lines += format_metric('dns_upstream_timeouts_total', 'counter', 'Запросов без ответа за RTO по серверам',
+                               [((('server', _address(server.address)),), server.missed) for server in upstreams])
+        lines += format_metric('dns_ratelimit_dropped_total', 'counter', 'Запросов, отброшенных лимитом подсети',
+                               [((), self.limiter.dropped if self.limiter else 0)])
+        lines += format_metric('dns_rrl_responses_total', 'counter', 'Ответов сверх лимита RRL по действию',
+                               [((('action', 'drop'),), self.rrl.dropped if self.rrl else 0),
+                                ((('action', 'slip'),), self.rrl.slipped if self.rrl else 0)])
+        lines += format_histogram('dns_stage_seconds',
+                                  f'Время этапов обработки UDP-запроса (выборка 1 из {self.metrics.sample_every})',
+                                  [((('stage', stage),), histogram)
+                                   for stage, histogram in self.metrics.stages.items()])
+        lines += format_histogram('dns_upstream_rtt_seconds', 'RTT вышестоящих серверов',
+                                  [((('server', _address(server.address)),), server.rtt) for server in upstreams])
+        return '\n'.join(lines) + '\n'
+
     def cleanup_cache(self):
         """Периодическая очистка кэша от просроченных записей"""
         while self.running:
-            time.sleep(60)  # Проверка каждую минуту
+            time.sleep(CACHE_CLEANUP_INTERVAL)
             self.cache.cleanup()
 
     def stop(self):
         """Остановка сервера"""
         self.running = False
+        if self._metrics_http is not None:
+            self._metrics_http.shutdown()
+            self._metrics_http.server_close()
+            self._metrics_http = None
+        if self._upstream_client is not None:
+            self._upstream_client.close()
+            self._upstream_client = None
+        if self._resolver is not None:
+            self._resolver.close()
+            self._resolver = None
         self.cache.save()
-        print("DNS сервер остановлен")
\ No newline at end of file
+        stats = self.inflight.stats()
+        print(f"Запросов к upstream: {stats['leaders']}, объединено с уже идущими: {stats['coalesced']}")
+        stats = self.cache.stats()
+        print(f"Кэш: {stats['entries']} записей, попаданий {stats['hit_rate']:.1%}, вытеснено {stats['evictions']}, "
+              f"фоновых обновлений {self.prefetches}, просроченных ответов {stats['stale_hits']}")
+        print("DNS сервер остановлен")
+
+
+def _type_name(qtype):
+    try:
+        return DNSType(qtype).name
+    except ValueError:
+        return str(int(qtype))
+
+
+def _address(address):
+    return f"{address[0]}:{address[1]}"
+
+
+def _recv_exactly(conn, size):
+    """Чтение ровно size байт; b'' при закрытии соединения"""
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            return b''
+        data += chunk
+    return data
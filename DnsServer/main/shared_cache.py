@@ -0,0 +1,141 @@
+import hashlib
+import mmap
+import multiprocessing
+import struct
+from array import array
+
+from DnsServer.main.dns_packet import encode_name
+
+# Заголовок слота: версия (seqlock), длина ключа, длина ответа, конец вопроса,
+# число TTL, время сохранения, время истечения
+_SLOT_HEADER = struct.Struct('=IHHHHdd')
+_TTL_ENTRY_SIZE = 6  # упакованная пара (смещение, TTL), см. cache.pack_ttl_offsets
+_VERSION = struct.Struct('=I')
+
+MAX_KEY = 260
+MAX_TTLS = 32
+MAX_WIRE = 512
+SLOT_SIZE = _SLOT_HEADER.size + MAX_KEY + MAX_TTLS * _TTL_ENTRY_SIZE + MAX_WIRE
+BUCKET_WAYS = 4
+LOCK_STRIPES = 64
+
+
+def encode_key(key):
+    """Ключ (имя, тип, класс) в байтах, одинаковых во всех процессах"""
+    name, qtype, qclass = key
+    return encode_name(name) + struct.pack('!HH', qtype, qclass)
+
+
+class SharedAnswerTable:
+    """Таблица готовых ответов в разделяемой памяти (mmap), общая для процессов-воркеров.
+
+    Создаётся до fork(). Таблица — открытая адресация с корзинами по BUCKET_WAYS слотов;
+    запись идёт под одним из LOCK_STRIPES межпроцессных замков, чтение — без замков
+    по протоколу seqlock (нечётная версия слота означает, что его сейчас переписывают).
+    """
+
+    def __init__(self, slots=16384):
+        self.buckets = max(slots // BUCKET_WAYS, 1)
+        self.slots = self.buckets * BUCKET_WAYS
+        self.memory = mmap.mmap(-1, self.slots * SLOT_SIZE)
+        self.locks = [multiprocessing.Lock() for _ in range(LOCK_STRIPES)]
+
+    def _bucket(self, key_bytes):
+        digest = hashlib.blake2b(key_bytes, digest_size=8).digest()
+        return int.from_bytes(digest, 'little') % self.buckets
+
+    def get(self, key, now):
+        """Возвращает (wire, ttl_offsets, question_end, stored_at) или None"""
+        key_bytes = encode_key(key)
+        base = self._bucket(key_bytes) * BUCKET_WAYS
+        for way in range(BUCKET_WAYS):
+            entry = self._read(base + way, key_bytes, now)
+            if entry is not None:
+                return entry
+        return None
+
+    def _read(self, slot, key_bytes, now):
+        offset = slot * SLOT_SIZE
+        memory = self.memory
+        version, key_len, wire_len, question_end, ttl_count, stored_at, expires = \
+            _SLOT_HEADER.unpack_from(memory, offset)
+        if version & 1 or key_len != len(key_bytes) or expires <= now:
+            return None
+        position = offset + _SLOT_HEADER.size
+        if memory[position:position + key_len] != key_bytes:
+            return None
+        position += MAX_KEY
+        ttl_offsets = memory[position:position + ttl_count * _TTL_ENTRY_SIZE]
+        position += MAX_TTLS * _TTL_ENTRY_SIZE
+        wire = memory[position:position + wire_len]
+        if _VERSION.unpack_from(memory, offset)[0] != version:
+            return None  # слот переписали во время чтения
+        return wire, ttl_offsets, question_end, stored_at
+
+    def put(self, key, wire, ttl_offsets, question_end, stored_at, expires):
+        """Сохраняет ответ; слишком большие ответы в таблицу не попадают"""
+        key_bytes = encode_key(key)
+        ttl_count = len(ttl_offsets) // _TTL_ENTRY_SIZE
+        if len(wire) > MAX_WIRE or ttl_count > MAX_TTLS or len(key_bytes) > MAX_KEY:
+            return False
+        bucket = self._bucket(key_bytes)
+        base = bucket * BUCKET_WAYS
+        with self.locks[bucket % LOCK_STRIPES]:
+            slot = self._choose_slot(base, key_bytes)
+            offset = slot * SLOT_SIZE
+            version = _VERSION.unpack_from(self.memory, offset)[0]
+            _VERSION.pack_into(self.memory, offset, version + 1)
+            position = offset + _SLOT_HEADER.size
+            self.memory[position:position + len(key_bytes)] = key_bytes
+            position += MAX_KEY
+            self.memory[position:position + len(ttl_offsets)] = ttl_offsets
+            position += MAX_TTLS * _TTL_ENTRY_SIZE
+            self.memory[position:position + len(wire)] = wire
+            _SLOT_HEADER.pack_into(self.memory, offset, version + 2, len(key_bytes), len(wire),
+                                   question_end, ttl_count, stored_at, expires)
+        return True
+
+    def _choose_slot(self, base, key_bytes):
+        """Слот с тем же ключом, иначе пустой или истекающий раньше всех"""
+        victim, victim_expires = base, None
+        for slot in range(base, base + BUCKET_WAYS):
+            offset = slot * SLOT_SIZE
+            _, key_len, _, _, _, _, expires = _SLOT_HEADER.unpack_from(self.memory, offset)
+            position = offset + _SLOT_HEADER.size
+            if key_len == len(key_bytes) and self.memory[position:position + key_len] == key_bytes:
+                return slot
+            if victim_expires is None or expires < victim_expires:
+                victim, victim_expires = slot, expires
+        return victim
+
+    def versions(self):
+        """Текущие версии всех слотов — отметка для entries(now, seen)"""
+        return array('I', (_VERSION.unpack_from(self.memory, slot * SLOT_SIZE)[0] for slot in range(self.slots)))
+
+    def entries(self, now, seen=None):
+        """Непросроченные записи: (wire, ttl_offsets, question_end, stored_at).
+
+        seen — массив версий слотов (versions() или нули): отдаются только слоты,
+        переписанные после прошлого вызова, а seen обновляется. Сравниваются версии,
+        а не время сохранения: воркеры пишут в таблицу не в порядке stored_at.
+        """
+        memory = self.memory
+        for slot in range(self.slots):
+            offset = slot * SLOT_SIZE
+            version, key_len, wire_len, question_end, ttl_count, stored_at, expires = \
+                _SLOT_HEADER.unpack_from(memory, offset)
+            if version & 1 or seen is not None and seen[slot] == version:
+                continue
+            if key_len == 0 or expires <= now:
+                if seen is not None:
+                    seen[slot] = version
+                continue
+            position = offset + _SLOT_HEADER.size + MAX_KEY
+            ttl_offsets = memory[position:position + ttl_count * _TTL_ENTRY_SIZE]
+            position += MAX_TTLS * _TTL_ENTRY_SIZE
+            wire = memory[position:position + wire_len]
+            if _VERSION.unpack_from(memory, offset)[0] != version:
+                continue  # слот переписали во время чтения: заберём в следующий раз
+            if seen is not None:
+                seen[slot] = version
+            yield wire, ttl_offsets, question_end, stored_at
@@ -0,0 +1,92 @@
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Объединение одновременных одинаковых запросов к upstream (для потоков).
+
+    Первый вызов с ключом выполняет функцию, остальные вызовы с тем же ключом
+    ждут его результата вместо отправки собственного запроса.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.leaders = 0     # запросов, реально ушедших в upstream
+        self.coalesced = 0   # запросов, дождавшихся чужого результата
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self.calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+
+    def stats(self):
+        return {'leaders': self.leaders, 'coalesced': self.coalesced, 'in_flight': len(self.calls)}
+
+
+class AsyncSingleFlight:
+    """Объединение одновременных одинаковых запросов к upstream (для asyncio)"""
+
+    def __init__(self):
+        self.calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, coro_fn):
+        future = self.calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self.calls[key] = future
+        self.leaders += 1
+        try:
+            result = await coro_fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение получат ожидающие; помечаем его полученным, чтобы не было предупреждения
+            future.exception()
+            raise
+        finally:
+            del self.calls[key]
+
+    def stats(self):
+        return {'leaders': self.leaders, 'coalesced': self.coalesced, 'in_flight': len(self.calls)}
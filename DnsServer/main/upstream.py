@@ -0,0 +1,357 @@
+import errno
+import heapq
+import os
+import secrets
+import selectors
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future
+
+from DnsServer.main.const import EDNS_UDP_PAYLOAD, SOCKET_TIMEOUT
+from DnsServer.main.dns_packet import FLAG_TC, DNSPacket, opt_record
+from DnsServer.main.metrics import Histogram
+
+_QUERY_HEADER = struct.Struct('!HHHxxxxH')  # ID, флаги, QDCOUNT, ANCOUNT=NSCOUNT=0, ARCOUNT
+
+MIN_RTO = 0.05      # нижняя граница адаптивного таймаута, секунды
+RTT_ALPHA = 1 / 8   # коэффициенты сглаживания RTT как в TCP (RFC 6298)
+RTT_BETA = 1 / 4
+TCP_ATTEMPTS = 2    # попыток отправить запрос по TCP (повтор — если сервер закрыл соединение)
+
+
+class UpstreamServer:
+    """Вышестоящий сервер и сглаженная оценка его RTT"""
+
+    def __init__(self, address, max_rto=SOCKET_TIMEOUT):
+        self.address = address
+        self.max_rto = max_rto
+        self.srtt = None
+        self.rttvar = None
+        self.timeouts = 0
+        self.missed = 0  # всего запросов, не дождавшихся ответа за RTO
+        self.rtt = Histogram()  # распределение замеров для метрик
+
+    @property
+    def rto(self):
+        """Время ожидания ответа, после которого запрос дублируется другому серверу"""
+        if self.srtt is None:
+            return min(1.0, self.max_rto)
+        return min(max(self.srtt + 4 * self.rttvar, MIN_RTO), self.max_rto)
+
+    def observe(self, rtt):
+        self.rtt.record(rtt)
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - RTT_BETA) * self.rttvar + RTT_BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - RTT_ALPHA) * self.srtt + RTT_ALPHA * rtt
+        self.timeouts = 0
+
+    def penalize(self):
+        """Сервер не ответил вовремя: увеличиваем оценку RTT, чтобы выбирать его реже"""
+        self.timeouts += 1
+        self.missed += 1
+        self.srtt = min((self.srtt or self.rto) * 2, self.max_rto)
+        self.rttvar = self.rttvar or self.srtt / 2
+
+    def sort_key(self):
+        # Неопробованные серверы идут после быстрых, но раньше медленных
+        return self.srtt if self.srtt is not None else self.rto / 2
+
+
+class _Pending:
+    __slots__ = ('future', 'query', 'question', 'candidates', 'sent', 'tried', 'deadline', 'tcp')
+
+    def __init__(self, future, query, question, candidates, deadline):
+        self.future = future
+        self.query = query
+        self.question = question
+        self.candidates = candidates
+        self.tcp = 0  # попыток по TCP после ответа с флагом TC
+        self.sent = {}     # адрес сервера -> время отправки
+        self.tried = []
+        self.deadline = deadline
+
+
+class _TCPConnection:
+    """Постоянное TCP-соединение с сервером; запросы идут конвейером, ответы — в любом порядке"""
+    __slots__ = ('address', 'sock', 'connected', 'outgoing', 'incoming', 'txids')
+
+    def __init__(self, address, sock):
+        self.address = address
+        self.sock = sock
+        self.connected = False
+        self.outgoing = bytearray()
+        self.incoming = bytearray()
+        self.txids = set()
+
+
+class UpstreamClient:
+    """Клиент к вышестоящим серверам: несколько долгоживущих UDP-сокетов на все запросы.
+
+    Ответы сопоставляются с запросами по случайному ID транзакции. Запрос уходит
+    серверу с наименьшим сглаженным RTT; если за его адаптивный таймаут ответа нет,
+    запрос дублируется следующему серверу, и используется первый пришедший ответ.
+    Ввод-вывод и таймеры обслуживает один фоновый поток.
+
+    Вместо настроенного списка серверов запросу можно передать свой набор адресов
+    (например, NS-серверы зоны); оценки RTT запоминаются для всех адресов.
+
+    Запросы уходят с OPT-записью EDNS(0) на payload байт. Если ответ всё же
+    обрезан (флаг TC), запрос повторяется тому же серверу по постоянному
+    TCP-соединению, общему для всех запросов к этому серверу.
+    """
+
+    def __init__(self, servers, sockets=2, timeout=SOCKET_TIMEOUT, payload=EDNS_UDP_PAYLOAD):
+        self.servers = [UpstreamServer(address, timeout) for address in servers]
+        self.known = {server.address: server for server in self.servers}
+        self.timeout = timeout
+        self.payload = payload
+        self.tcp = {}  # адрес -> _TCPConnection
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.timers = []
+        self.selector = selectors.DefaultSelector()
+        self.sockets = []
+        for _ in range(sockets):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ)
+            self.sockets.append(sock)
+        self._next_socket = 0
+        self._wakeup_read, self._wakeup_write = socket.socketpair()
+        self._wakeup_read.setblocking(False)
+        self.selector.register(self._wakeup_read, selectors.EVENT_READ)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def query(self, request, servers=None):
+        """Отправка запроса; Future завершается разобранным ответом или None по таймауту"""
+        future = Future()
+        raw = request.raw_data
+        question_end = DNSPacket.parse_name(raw, 12)[1] + 4
+        now = time.monotonic()
+        with self.lock:
+            txid = secrets.randbits(16)
+            while txid in self.pending:
+                txid = secrets.randbits(16)
+            candidates = self.servers if servers is None else [self._server(address) for address in servers]
+            pending = _Pending(future, self._build_query(raw, question_end, txid), raw[12:question_end].lower(),
+                               candidates, now + self.timeout)
+            self.pending[txid] = pending
+            heapq.heappush(self.timers, (pending.deadline, txid, 0))
+            self._send(txid, pending, now)
+        self._wakeup_write.send(b'\0')
+        return future
+
+    def resolve(self, request, servers=None):
+        """Блокирующий вариант query()"""
+        return self.query(request, servers).result()
+
+    def _build_query(self, raw, question_end, txid):
+        """Запрос к upstream: флаги и вопрос клиента, своя OPT-запись вместо клиентской"""
+        flags = int.from_bytes(raw[2:4], 'big')
+        if not self.payload:
+            return _QUERY_HEADER.pack(txid, flags, 1, 0) + raw[12:question_end]
+        return _QUERY_HEADER.pack(txid, flags, 1, 1) + raw[12:question_end] + opt_record(self.payload)
+
+    def _server(self, address):
+        """Сервер по адресу вместе с накопленной оценкой RTT (под self.lock)"""
+        server = self.known.get(address)
+        if server is None:
+            server = self.known[address] = UpstreamServer(address, self.timeout)
+        return server
+
+    def in_flight(self):
+        return len(self.pending)
+
+    def _send(self, txid, pending, now):
+        """Отправка самому быстрому из ещё не опрошенных серверов (под self.lock)"""
+        candidates = [server for server in pending.candidates if server.address not in pending.sent]
+        if not candidates:
+            return
+        server = min(candidates, key=UpstreamServer.sort_key)
+        sock = self.sockets[self._next_socket]
+        self._next_socket = (self._next_socket + 1) % len(self.sockets)
+        try:
+            sock.sendto(pending.query, server.address)
+        except OSError as e:
+            print(f"Ошибка отправки запроса к {server.address[0]}: {e}")
+        pending.sent[server.address] = now
+        pending.tried.append(server)
+        heapq.heappush(self.timers, (now + server.rto, txid, len(pending.tried)))
+
+    def _run(self):
+        while self.running:
+            with self.lock:
+                timeout = self.timers[0][0] - time.monotonic() if self.timers else None
+            for key, mask in self.selector.select(None if timeout is None else max(timeout, 0)):
+                if key.fileobj is self._wakeup_read:
+                    try:
+                        self._wakeup_read.recv(4096)
+                    except BlockingIOError:
+                        pass
+                elif key.data is not None:
+                    self._tcp_event(key.data, mask)
+                else:
+                    self._receive(key.fileobj)
+            self._expire(time.monotonic())
+
+    def _receive(self, sock):
+        while True:
+            try:
+                data, addr = sock.recvfrom(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # ICMP port unreachable и т.п. — запрос досрочно не завершаем, сработает таймаут
+                continue
+            self._complete(data, addr, tcp=False)
+
+    def _complete(self, data, addr, tcp):
+        """Сопоставление ответа с запросом и завершение его Future"""
+        if len(data) < 12:
+            return
+        txid = int.from_bytes(data[:2], 'big')
+        now = time.monotonic()
+        with self.lock:
+            pending = self.pending.get(txid)
+            # Принимаем ответ только от опрошенного сервера и на тот же вопрос
+            if pending is None or addr not in pending.sent \
+                    or data[12:12 + len(pending.question)].lower() != pending.question:
+                return
+            if not tcp:
+                for server in pending.tried:
+                    if server.address == addr:
+                        server.observe(now - pending.sent[addr])
+                if int.from_bytes(data[2:4], 'big') & FLAG_TC:
+                    # Ответ не поместился в UDP: повторяем тому же серверу по TCP
+                    self._send_tcp(txid, pending, addr)
+                    return
+            del self.pending[txid]
+        try:
+            pending.future.set_result(DNSPacket.parse(data))
+        except Exception as e:
+            pending.future.set_exception(e)
+
+    def _send_tcp(self, txid, pending, address):
+        """Отправка запроса по TCP-соединению с сервером (под self.lock, в потоке ввода-вывода)"""
+        pending.tcp += 1
+        conn = self.tcp.get(address)
+        if conn is None:
+            conn = self._connect(address)
+            if conn is None:
+                return
+        conn.outgoing += len(pending.query).to_bytes(2, 'big') + pending.query
+        conn.txids.add(txid)
+        self._flush(conn)
+
+    def _connect(self, address):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        error = sock.connect_ex(address)
+        if error not in (0, errno.EINPROGRESS):
+            print(f"Ошибка TCP-соединения с {address[0]}: {os.strerror(error)}")
+            sock.close()
+            return None
+        conn = self.tcp[address] = _TCPConnection(address, sock)
+        self.selector.register(sock, selectors.EVENT_READ | selectors.EVENT_WRITE, conn)
+        return conn
+
+    def _flush(self, conn):
+        if conn.connected and conn.outgoing:
+            try:
+                sent = conn.sock.send(conn.outgoing)
+                del conn.outgoing[:sent]
+            except BlockingIOError:
+                pass
+            except OSError as e:
+                self._close_tcp(conn, e)
+                return
+        events = selectors.EVENT_READ
+        if conn.outgoing or not conn.connected:
+            events |= selectors.EVENT_WRITE
+        self.selector.modify(conn.sock, events, conn)
+
+    def _tcp_event(self, conn, mask):
+        with self.lock:
+            if mask & selectors.EVENT_WRITE:
+                if not conn.connected:
+                    error = conn.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if error:
+                        self._close_tcp(conn, os.strerror(error))
+                        return
+                    conn.connected = True
+                self._flush(conn)
+            if not mask & selectors.EVENT_READ:
+                return
+            try:
+                chunk = conn.sock.recv(65535)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                self._close_tcp(conn, e)
+                return
+            if not chunk:
+                self._close_tcp(conn, None)
+                return
+            conn.incoming += chunk
+            messages = []
+            while len(conn.incoming) >= 2:
+                length = int.from_bytes(conn.incoming[:2], 'big')
+                if len(conn.incoming) < 2 + length:
+                    break
+                message = bytes(conn.incoming[2:2 + length])
+                del conn.incoming[:2 + length]
+                conn.txids.discard(int.from_bytes(message[:2], 'big'))
+                messages.append(message)
+        for message in messages:
+            self._complete(message, conn.address, tcp=True)
+
+    def _close_tcp(self, conn, error):
+        """Закрытие соединения (под self.lock); неотвеченные запросы повторяются по новому соединению"""
+        if error is not None:
+            print(f"TCP-соединение с {conn.address[0]} закрыто: {error}")
+        self.selector.unregister(conn.sock)
+        conn.sock.close()
+        if self.tcp.get(conn.address) is conn:
+            del self.tcp[conn.address]
+        for txid in conn.txids:
+            pending = self.pending.get(txid)
+            if pending is not None and pending.tcp < TCP_ATTEMPTS:
+                self._send_tcp(txid, pending, conn.address)
+
+    def _expire(self, now):
+        """Обработка таймеров: дублирование запроса другому серверу или окончательный таймаут"""
+        expired = []
+        with self.lock:
+            while self.timers and self.timers[0][0] <= now:
+                _, txid, attempt = heapq.heappop(self.timers)
+                pending = self.pending.get(txid)
+                if pending is None:
+                    continue
+                if now >= pending.deadline:
+                    del self.pending[txid]
+                    expired.append(pending)
+                elif attempt == len(pending.tried) and not pending.tcp:
+                    # Последний опрошенный сервер не ответил за свой адаптивный таймаут
+                    pending.tried[-1].penalize()
+                    self._send(txid, pending, now)
+        for pending in expired:
+            pending.future.set_result(None)
+
+    def close(self):
+        self.running = False
+        self._wakeup_write.send(b'\0')
+        self.thread.join(1)
+        for sock in self.sockets:
+            sock.close()
+        for conn in list(self.tcp.values()):
+            conn.sock.close()
+        self._wakeup_read.close()
+        self._wakeup_write.close()
+        self.selector.close()
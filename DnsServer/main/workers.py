@@ -0,0 +1,96 @@
+import os
+import signal
+
+from DnsServer.main.blocklist import Blocklist
+from DnsServer.main.cache import DNSCache
+from DnsServer.main.const import CACHE_MAX_BYTES, CACHE_MAX_ENTRIES, EDNS_UDP_PAYLOAD, STALE_MAX_AGE
+from DnsServer.main.local_zones import LocalZones
+from DnsServer.main.shared_cache import SharedAnswerTable
+
+
+def run_workers(server_class, port, workers, cache_file, upstreams, cache_max_entries=CACHE_MAX_ENTRIES,
+                cache_max_bytes=CACHE_MAX_BYTES, shared_slots=65536, iterative=False, root_hints=None,
+                stale_max_age=STALE_MAX_AGE, prefetch=True, edns_payload=EDNS_UDP_PAYLOAD,
+                metrics_port=None, limiter=None, rrl=None, zone_files=(), hosts_files=(),
+                blocklist_files=(), sinkholes=()):
+    """Запуск нескольких процессов-воркеров на одном порту (SO_REUSEPORT).
+
+    Ядро распределяет датаграммы между сокетами воркеров, а готовые ответы
+    хранятся в общей таблице в разделяемой памяти, поэтому ответ, полученный
+    одним воркером, сразу становится попаданием для остальных. Кэш на диске
+    загружает и сохраняет только родительский процесс: он периодически
+    переносит новые ответы из общей таблицы в журнал.
+
+    Метрики у каждого воркера свои: при заданном metrics_port воркер i
+    отдаёт /metrics на порту metrics_port + i. Таблицы ограничения частоты
+    (limiter, rrl) после fork у каждого воркера тоже свои.
+
+    Локальные зоны и списки блокировки загружаются до fork и достаются
+    воркерам готовыми: страницы индекса только читаются и остаются общими.
+    SIGHUP родителю пересылается воркерам, и каждый перечитывает файлы сам.
+    """
+    local = blocklist = None
+    try:
+        if zone_files or hosts_files:
+            local = LocalZones.load(zone_files, hosts_files)
+        if blocklist_files:
+            blocklist = Blocklist.load(blocklist_files, sinkholes)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка загрузки локальных зон или списка блокировки: {e}")
+        return
+
+    cache = DNSCache(cache_file, cache_max_entries, cache_max_bytes)
+    cache.attach_shared(SharedAnswerTable(shared_slots))
+
+    children = []
+    for i in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            server = server_class(None, cache_max_entries, cache_max_bytes, stale_max_age, prefetch)
+            server.cache.attach_shared(cache.shared)
+            if upstreams:
+                server.upstreams = upstreams
+            server.iterative = iterative
+            server.root_hints = root_hints
+            server.edns_payload = edns_payload
+            server.metrics_port = None if metrics_port is None else metrics_port + i
+            server.limiter = limiter
+            server.rrl = rrl
+            server.zone_files, server.hosts_files = list(zone_files), list(hosts_files)
+            server.local = local
+            server.blocklist_files, server.sinkholes = list(blocklist_files), list(sinkholes)
+            server.blocklist = blocklist
+            signal.signal(signal.SIGHUP, lambda signum, frame: server.reload())
+            server.reuse_port = True
+            try:
+                server.start(port)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os._exit(0)
+        children.append(pid)
+    print(f"Запущено воркеров: {workers}")
+    signal.signal(signal.SIGHUP, lambda signum, frame: _forward(children, signal.SIGHUP))
+    cache.start_persistence()
+
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        _forward(children, signal.SIGINT)
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+    finally:
+        cache.absorb_shared()
+        cache.save()
+
+
+def _forward(children, signum):
+    for pid in children:
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
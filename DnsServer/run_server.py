@@ -1,13 +1,112 @@
 import argparse
+import signal
+from DnsServer.main.const import CACHE_MAX_BYTES, CACHE_MAX_ENTRIES, EDNS_UDP_PAYLOAD, RRL_SLIP, STALE_MAX_AGE
+from DnsServer.main.ratelimit import ClientRateLimiter, ResponseRateLimiter
 from DnsServer.main.server import DNSServer
+from DnsServer.main.aio_server import AsyncDNSServer
+from DnsServer.main.workers import run_workers
+
+SERVER_MODES = {
+    'threaded': DNSServer,
+    'asyncio': AsyncDNSServer,
+}
+
+
+def parse_address(value, default_port=53):
+    """Разбор адреса вида host[:port]"""
+    host, _, port = value.partition(':')
+    return host, int(port) if port else default_port
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"нужно целое число больше нуля, а не {value}")
+    return number
+
 
 def main():
     parser = argparse.ArgumentParser(description='Кэширующий DNS сервер')
     parser.add_argument('--port', type=int, default=53535, help='Порт для прослушивания (по умолчанию: 53535)')
-    parser.add_argument('--cache-file', default='data/cache.pickle', help='Файл для хранения кэша')
+    parser.add_argument('--cache-file', default='data/cache.snapshot', help='Файл для хранения кэша')
+    parser.add_argument('--mode', choices=SERVER_MODES, default='threaded',
+                        help='Режим обработки запросов: поток на пакет или asyncio (по умолчанию: threaded)')
+    parser.add_argument('--upstream', type=parse_address, action='append', dest='upstreams',
+                        help='Вышестоящий DNS сервер host[:port], можно указать несколько раз '
+                             '(по умолчанию: DEFAULT_DNS_SERVERS)')
+    parser.add_argument('--iterative', action='store_true',
+                        help='Разрешать имена самостоятельно от корневых серверов, а не через upstream')
+    parser.add_argument('--root-hint', type=parse_address, action='append', dest='root_hints',
+                        help='Корневой сервер host[:port] для --iterative, можно указать несколько раз '
+                             '(по умолчанию: ROOT_SERVERS)')
+    parser.add_argument('--cache-max-entries', type=positive_int, default=CACHE_MAX_ENTRIES,
+                        help=f'Максимум записей в кэше (по умолчанию: {CACHE_MAX_ENTRIES})')
+    parser.add_argument('--cache-max-bytes', type=int, default=CACHE_MAX_BYTES,
+                        help=f'Оценка максимального объёма кэша в байтах (по умолчанию: {CACHE_MAX_BYTES})')
+    parser.add_argument('--stale-max-age', type=int, default=STALE_MAX_AGE,
+                        help='Сколько секунд после истечения TTL отдавать ответ, если upstream недоступен; '
+                             f'0 — отключить (по умолчанию: {STALE_MAX_AGE})')
+    parser.add_argument('--no-prefetch', action='store_false', dest='prefetch',
+                        help='Не обновлять популярные записи в фоне перед истечением TTL')
+    parser.add_argument('--edns-payload', type=int, default=EDNS_UDP_PAYLOAD,
+                        help='Наибольший размер UDP-ответа с EDNS(0); длиннее — с флагом TC и повтором по TCP '
+                             f'(по умолчанию: {EDNS_UDP_PAYLOAD})')
+    parser.add_argument('--metrics-port', type=int,
+                        help='Порт HTTP-сервера с метриками /metrics в формате Prometheus '
+                             '(с --workers N — порты с metrics-port по metrics-port+N-1)')
+    parser.add_argument('--rate-limit', type=float,
+                        help='Запросов в секунду с одной подсети (/24, IPv6 — /56); лишние отбрасываются до разбора')
+    parser.add_argument('--rate-burst', type=float,
+                        help='Допустимый всплеск запросов с подсети (по умолчанию: 2 × --rate-limit)')
+    parser.add_argument('--rrl', type=float,
+                        help='Одинаковых UDP-ответов в секунду одной подсети (response rate limiting)')
+    parser.add_argument('--rrl-slip', type=int, default=RRL_SLIP,
+                        help='Каждый N-й ответ сверх --rrl отправляется обрезанным с флагом TC, '
+                             f'остальные отбрасываются; 0 — отбрасывать все (по умолчанию: {RRL_SLIP})')
+    parser.add_argument('--zone', action='append', dest='zone_files', default=[], metavar='FILE',
+                        help='Зон-файл с локальными авторитетными данными, можно указать несколько раз')
+    parser.add_argument('--hosts', action='append', dest='hosts_files', default=[], metavar='FILE',
+                        help='hosts-файл (адрес и имена в строке), можно указать несколько раз; '
+                             'зоны и hosts-файлы перечитываются по SIGHUP')
+    parser.add_argument('--blocklist', action='append', dest='blocklist_files', default=[], metavar='FILE',
+                        help='Список блокируемых доменов (имя в строке, hosts-файл или ||имя^), блокируются '
+                             'и поддомены; можно указать несколько раз, перечитывается по SIGHUP')
+    parser.add_argument('--sinkhole', action='append', dest='sinkholes', default=[], metavar='ADDRESS',
+                        help='Адрес (IPv4 или IPv6), которым отвечать на заблокированные имена, можно '
+                             'указать несколько раз (по умолчанию: NXDOMAIN)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Количество процессов-воркеров с общим кэшем (по умолчанию: 1)')
     args = parser.parse_args()
+    limiter = ClientRateLimiter(args.rate_limit, args.rate_burst) if args.rate_limit else None
+    rrl = ResponseRateLimiter(args.rrl, args.rrl_slip) if args.rrl else None
+
+    if args.workers > 1:
+        run_workers(SERVER_MODES[args.mode], args.port, args.workers, args.cache_file, args.upstreams,
+                    args.cache_max_entries, args.cache_max_bytes,
+                    iterative=args.iterative, root_hints=args.root_hints,
+                    stale_max_age=args.stale_max_age, prefetch=args.prefetch,
+                    edns_payload=args.edns_payload, metrics_port=args.metrics_port,
+                    limiter=limiter, rrl=rrl, zone_files=args.zone_files, hosts_files=args.hosts_files,
+                    blocklist_files=args.blocklist_files, sinkholes=args.sinkholes)
+        return
 
-    server = DNSServer(args.cache_file)
+    server = SERVER_MODES[args.mode](args.cache_file, args.cache_max_entries, args.cache_max_bytes,
+                                     args.stale_max_age, args.prefetch)
+    if args.upstreams:
+        server.upstreams = args.upstreams
+    server.iterative = args.iterative
+    server.root_hints = args.root_hints
+    server.edns_payload = args.edns_payload
+    server.metrics_port = args.metrics_port
+    server.limiter = limiter
+    server.rrl = rrl
+    server.zone_files = args.zone_files
+    server.hosts_files = args.hosts_files
+    server.blocklist_files = args.blocklist_files
+    server.sinkholes = args.sinkholes
+    if not server.load_local() or not server.load_blocklist():
+        return
+    signal.signal(signal.SIGHUP, lambda signum, frame: server.reload())
     try:
         server.start(args.port)
     except KeyboardInterrupt:
@@ -15,4 +114,4 @@ def main():
         server.stop()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from DnsServer.main import blocklist as blocklist_module
+from DnsServer.main.blocklist import Blocklist, parse_blocklist
+from DnsServer.main.dns_packet import RCODE_NXDOMAIN, DNSPacket, DNSQuestion, DNSType
+from DnsServer.main.server import DNSServer
+
+LIST = """
+# обычный список
+ads.example.com
+Tracker.NET.
+||metrics.example.org^
+||popup.example.net^$third-party
+0.0.0.0
+:: # адрес без имён
+! комментарий в формате adblock
+0.0.0.0 spy.example.io telemetry.example.io  # hosts
+127.0.0.1 localhost
+banner.example.com # в конце строки
+"""
+
+
+def make_request(name, qtype=DNSType.A):
+    request = DNSPacket(0x4321, 0x0100, [DNSQuestion(name, qtype, 1)], [], [], [])
+    return DNSPacket.parse(request.to_wire())
+
+
+class TestBlocklist(unittest.TestCase):
+    def test_parse_formats(self):
+        self.assertEqual(list(parse_blocklist(LIST.splitlines())),
+                         ['ads.example.com', 'tracker.net', 'metrics.example.org', 'popup.example.net',
+                          'spy.example.io', 'telemetry.example.io', 'banner.example.com'])
+
+    def test_blocks_name_and_subdomains_only(self):
+        blocklist = Blocklist(parse_blocklist(LIST.splitlines()))
+        self.assertEqual(len(blocklist), 7)
+        for name in ('ads.example.com', 'x.y.ADS.example.com', 'tracker.net', 'cdn.spy.example.io'):
+            self.assertTrue(blocklist.blocked(name), name)
+        # Родители и имена с тем же окончанием не блокируются
+        for name in ('example.com', 'com', 'badads.example.com', 'example.io', 'tracker.net.example', 'localhost'):
+            self.assertFalse(blocklist.blocked(name), name)
+
+    def test_merges_sorted_chunks(self):
+        """Список больше куска сортировки: хеши сливаются в один отсортированный массив"""
+        names = [f'host{i}.example.com' for i in range(1000)]
+        with mock.patch.object(blocklist_module, 'SORT_CHUNK', 64):
+            blocklist = Blocklist(names)
+        self.assertEqual(list(blocklist.hashes), sorted(blocklist.hashes))
+        self.assertTrue(all(blocklist.blocked(name) for name in names))
+        self.assertFalse(blocklist.blocked('host1000.example.com'))
+
+    def test_nxdomain_and_sinkhole_answers(self):
+        nxdomain = DNSPacket.parse(Blocklist(['ads.example.com']).answer(make_request('ads.example.com')))
+        self.assertEqual((nxdomain.id, nxdomain.flags & 0x000F, nxdomain.answers), (0x4321, RCODE_NXDOMAIN, []))
+
+        sinkhole = Blocklist(['ads.example.com'], ['0.0.0.0', '::'])
+        a = DNSPacket.parse(sinkhole.answer(make_request('www.ads.example.com')))
+        self.assertEqual([(r.name, r.value) for r in a.answers], [('www.ads.example.com', '0.0.0.0')])
+        aaaa = DNSPacket.parse(sinkhole.answer(make_request('ads.example.com', DNSType.AAAA)))
+        self.assertEqual([r.value for r in aaaa.answers], ['::'])
+        mx = DNSPacket.parse(sinkhole.answer(make_request('ads.example.com', DNSType.MX)))
+        self.assertEqual((mx.flags & 0x000F, mx.answers), (0, []))
+        self.assertIsNone(sinkhole.answer(make_request('example.com')))
+
+
+class TestBlocklistReload(unittest.TestCase):
+    def test_reload_swaps_list_and_keeps_old_on_error(self):
+        fd, path = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+        server = DNSServer(':memory:')
+        server.blocklist_files = [path]
+
+        with open(path, 'w') as f:
+            f.write('ads.example.com\n')
+        self.assertTrue(server.load_blocklist())
+        self.assertIsNotNone(server.lookup(make_request('ads.example.com')))
+
+        with open(path, 'w') as f:
+            f.write('other.example.com\n')
+        self.assertTrue(server.load_blocklist())
+        self.assertIsNone(server.lookup(make_request('ads.example.com')))
+        self.assertIsNotNone(server.lookup(make_request('other.example.com')))
+
+        server.blocklist_files = [path + '.missing']
+        self.assertFalse(server.load_blocklist())
+        self.assertIsNotNone(server.lookup(make_request('other.example.com')))
+        self.assertEqual(server.blocked, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import socket
+import struct
+import unittest
+
+from DnsServer.main.cache import DNSCache
+from DnsServer.main.dns_packet import DNSPacket, DNSQuestion, DNSRecord, DNSType, encode_name
+
+
+def make_response(name="www.example.com", ttl=300):
+    """Ответ с CNAME-цепочкой, NS и glue-записью"""
+    return DNSPacket(
+        id=0x1234,
+        flags=0x8180,
+        questions=[DNSQuestion(name, DNSType.A, 1)],
+        answers=[
+            DNSRecord(name, DNSType.CNAME, 1, ttl, encode_name("edge.example.com")),
+            DNSRecord("edge.example.com", DNSType.A, 1, ttl, socket.inet_aton("93.184.216.34")),
+        ],
+        authorities=[DNSRecord("example.com", DNSType.NS, 1, ttl, encode_name("ns1.example.com"))],
+        additionals=[DNSRecord("ns1.example.com", DNSType.A, 1, ttl, socket.inet_aton("192.0.2.53"))],
+    )
+
+
+class TestDNSPacketWire(unittest.TestCase):
+    def test_roundtrip_with_compression(self):
+        """Сериализованный пакет разбирается обратно в те же записи"""
+        packet = make_response()
+        wire = packet.to_wire()
+        parsed = DNSPacket.parse(wire)
+
+        self.assertEqual(parsed.id, 0x1234)
+        self.assertEqual(parsed.questions, packet.questions)
+        self.assertEqual(parsed.answers, packet.answers)
+        self.assertEqual(parsed.authorities, packet.authorities)
+        self.assertEqual(parsed.additionals, packet.additionals)
+        self.assertEqual(parsed.answers[0].value, "edge.example.com")
+        # Имя example.com встречается многократно и должно сжиматься указателями
+        self.assertEqual(wire.count(b'\x07example\x03com\x00'), 1)
+
+    def test_record_is_compact(self):
+        """Запись без __dict__, имя интернировано, значение декодируется один раз"""
+        parsed = DNSPacket.parse(make_response().to_wire())
+        record = parsed.answers[1]
+
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertIs(record.name, DNSPacket.parse(make_response().to_wire()).answers[1].name)
+        self.assertIs(record.value, record.value)
+
+    def test_cached_wire_patches_id_and_ttl(self):
+        """Попадание в кэш отдаёт байты с ID запроса и уменьшенным TTL"""
+        cache = DNSCache(":memory:")
+        cache.update(make_response())
+        request = DNSPacket(0xBEEF, 0x0100, [DNSQuestion("www.example.com", DNSType.A, 1)], [], [], [])
+        request.raw_data = request.to_wire()
+
+        answer = cache.entries[("www.example.com", 1, 1)]
+        answer.stored_at -= 10
+        wire = cache.get_wire(request)
+        parsed = DNSPacket.parse(wire)
+
+        self.assertEqual(struct.unpack('!H', wire[:2])[0], 0xBEEF)
+        self.assertEqual([r.ttl for r in parsed.answers], [290, 290])
+        self.assertEqual(parsed.answers[1].value, "93.184.216.34")
+
+    def test_sections_parsed_lazily(self):
+        """Для попадания в кэш достаточно заголовка и вопроса: битые записи ответа не мешают"""
+        cache = DNSCache(":memory:")
+        cache.update(make_response())
+        request_wire = bytearray(make_response().to_wire())
+        request_wire[12 + len(encode_name("www.example.com")) + 4:] = b'\xff' * 8
+        request = DNSPacket.parse(bytes(request_wire))
+
+        self.assertEqual(request.questions[0].name, "www.example.com")
+        self.assertIsNotNone(cache.get_wire(request))
+        with self.assertRaises(ValueError):
+            request.answers
+
+    def test_compression_loop_rejected(self):
+        """Указатель сжатия на себя или вперёд — ошибка, а не бесконечная рекурсия"""
+        wire = struct.pack('!HHHHHH', 1, 0x0100, 1, 0, 0, 0) + b'\xc0\x0c' + struct.pack('!HH', 1, 1)
+        with self.assertRaises(ValueError):
+            DNSPacket.parse(wire)
+
+    def test_cache_miss_for_other_type(self):
+        """Ответ на A не отдаётся на запрос AAAA"""
+        cache = DNSCache(":memory:")
+        cache.update(make_response())
+        request = DNSPacket(1, 0x0100, [DNSQuestion("www.example.com", DNSType.AAAA, 1)], [], [], [])
+        self.assertIsNone(cache.get_wire(request))
+
+
+if __name__ == '__main__':
+    unittest.main()
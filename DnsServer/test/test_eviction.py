@@ -0,0 +1,60 @@
+import unittest
+
+from DnsServer.main.cache import DNSCache
+from DnsServer.main.dns_packet import DNSPacket, DNSQuestion, DNSRecord, DNSType
+from DnsServer.main.eviction import TinyLFUPolicy
+
+
+def request_for(name):
+    return DNSPacket(1, 0x0100, [DNSQuestion(name, DNSType.A, 1)], [], [], [])
+
+
+def answer_for(name):
+    response = request_for(name).create_response()
+    response.add_answer(DNSRecord(name, DNSType.A, 1, 300, b'\x7f\x00\x00\x01'))
+    return response
+
+
+class TestBoundedCache(unittest.TestCase):
+    def test_max_entries_enforced(self):
+        """Число записей не превышает max_entries"""
+        cache = DNSCache(None, max_entries=100)
+        for i in range(1000):
+            cache.update(answer_for(f"name{i}.test"))
+
+        self.assertLessEqual(len(cache.entries), 100)
+        self.assertEqual(len(cache.entries), len(cache.policy))
+        self.assertGreater(cache.stats()['evictions'], 0)
+
+    def test_tiny_capacity(self):
+        """Кэш на одну-две записи не ломается: основная область может быть пустой"""
+        for max_entries in (1, 2):
+            cache = DNSCache(None, max_entries=max_entries)
+            for i in range(10):
+                cache.update(answer_for(f"name{i}.test"))
+            self.assertLessEqual(len(cache.entries), max_entries)
+            self.assertEqual(len(cache.entries), len(cache.policy))
+            self.assertIsNotNone(cache.get_wire(request_for("name9.test")))
+
+    def test_max_bytes_enforced(self):
+        """Оценка объёма не превышает max_bytes"""
+        cache = DNSCache(None, max_entries=10_000, max_bytes=20_000)
+        for i in range(1000):
+            cache.update(answer_for(f"name{i}.test"))
+
+        self.assertLessEqual(cache.policy.bytes, 20_000)
+
+    def test_hot_name_survives_flood(self):
+        """Популярное имя остаётся в кэше при потоке одноразовых имён"""
+        cache = DNSCache(None, max_entries=200, policy=TinyLFUPolicy)
+        cache.update(answer_for("hot.test"))
+        for i in range(5000):
+            cache.get_wire(request_for("hot.test"))
+            cache.update(answer_for(f"junk{i}.flood.test"))
+
+        self.assertIsNotNone(cache.get_wire(request_for("hot.test")))
+        self.assertGreater(cache.stats()['hit_rate'], 0.99)
+
+
+if __name__ == '__main__':
+    unittest.main()
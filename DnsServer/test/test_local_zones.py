@@ -0,0 +1,119 @@
+import os
+import tempfile
+import unittest
+
+from DnsServer.main.dns_packet import RCODE_NXDOMAIN, DNSPacket, DNSQuestion, DNSType, encode_name
+from DnsServer.main.local_zones import LocalZones, parse_hosts, parse_zone
+from DnsServer.main.server import DNSServer
+
+ZONE = """
+$ORIGIN lab.lan.
+$TTL 1h
+@       IN SOA ns1 admin (
+            2024010101 ; serial
+            3600 900 604800
+            300 )      ; minimum
+        IN NS  ns1
+ns1     IN A   10.0.0.1
+www  60 IN A   10.0.0.10
+        IN A   10.0.0.11
+mail    IN MX  10 ns1
+alias   IN CNAME www
+*.apps  IN A   10.0.0.20
+txt     IN TXT "v=spf1 -all"
+"""
+
+HOSTS = """
+# локальные имена
+192.168.1.5   nas nas.home   # с комментарием
+fe80::1%eth0  router.home
+"""
+
+
+def make_request(name, qtype=DNSType.A):
+    request = DNSPacket(0x1234, 0x0100, [DNSQuestion(name, qtype, 1)], [], [], [])
+    return DNSPacket.parse(request.to_wire())
+
+
+class TestLocalZones(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.zones = LocalZones(parse_zone(ZONE) + parse_hosts(HOSTS))
+
+    def ask(self, name, qtype=DNSType.A):
+        wire = self.zones.answer(make_request(name, qtype))
+        return wire and DNSPacket.parse(wire)
+
+    def test_parse_zone(self):
+        """Относительные имена, пропущенный владелец, скобки, единицы времени"""
+        records = parse_zone(ZONE)
+        self.assertEqual(len(records), 9)
+        soa, ns, _, www, www2, mail = records[:6]
+        self.assertEqual((soa.name, soa.type, soa.data[-4:]), ('lab.lan', DNSType.SOA, (300).to_bytes(4, 'big')))
+        self.assertEqual((ns.name, ns.ttl, ns.value), ('lab.lan', 3600, 'ns1.lab.lan'))
+        self.assertEqual([(r.name, r.ttl) for r in (www, www2)], [('www.lab.lan', 60), ('www.lab.lan', 3600)])
+        self.assertEqual(mail.data, b'\x00\x0a' + encode_name('ns1.lab.lan'))
+        with self.assertRaises(ValueError):
+            parse_zone('bad IN A 10.0.0')
+
+    def test_exact_answer(self):
+        response = self.ask('WWW.lab.lan')
+        self.assertEqual(response.id, 0x1234)
+        self.assertTrue(response.flags & 0x0400)  # AA
+        self.assertEqual([r.value for r in response.answers], ['10.0.0.10', '10.0.0.11'])
+        self.assertEqual(response.answers[0].name, 'WWW.lab.lan')  # имя из вопроса
+
+    def test_wildcard_and_cname(self):
+        self.assertEqual(self.ask('api.apps.lab.lan').answers[0].value, '10.0.0.20')
+        response = self.ask('alias.lab.lan')
+        self.assertEqual([(r.type, r.value) for r in response.answers],
+                         [(DNSType.CNAME, 'www.lab.lan'), (DNSType.A, '10.0.0.10'), (DNSType.A, '10.0.0.11')])
+
+    def test_negative_answers_carry_soa(self):
+        """Нет имени — NXDOMAIN, нет типа — NODATA; в authority SOA с TTL = minimum"""
+        missing = self.ask('missing.lab.lan')
+        self.assertEqual(missing.flags & 0x000F, RCODE_NXDOMAIN)
+        self.assertEqual([(r.type, r.ttl) for r in missing.authorities], [(DNSType.SOA, 300)])
+        nodata = self.ask('ns1.lab.lan', DNSType.AAAA)
+        self.assertEqual((nodata.flags & 0x000F, nodata.answers), (0, []))
+        self.assertEqual(nodata.authorities[0].type, DNSType.SOA)
+
+    def test_hosts_names(self):
+        self.assertEqual(self.ask('nas').answers[0].value, '192.168.1.5')
+        self.assertEqual(self.ask('router.home', DNSType.AAAA).answers[0].value, 'fe80::1')
+        nodata = self.ask('nas.home', DNSType.AAAA)
+        self.assertEqual((nodata.answers, nodata.authorities), ([], []))
+        # Вне зон отвечаются только сами имена из hosts-файла
+        self.assertIsNone(self.ask('home'))
+        self.assertIsNone(self.ask('sub.nas.home'))
+        self.assertIsNone(self.ask('example.com'))
+
+
+class TestLocalReload(unittest.TestCase):
+    def test_reload_swaps_index_and_keeps_old_on_error(self):
+        fd, path = tempfile.mkstemp(suffix='.hosts')
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+        server = DNSServer(':memory:')
+        server.hosts_files = [path]
+        request = make_request('printer.office')
+
+        with open(path, 'w') as f:
+            f.write('10.1.1.1 printer.office\n')
+        self.assertTrue(server.load_local())
+        self.assertEqual(DNSPacket.parse(server.lookup(request)).answers[0].value, '10.1.1.1')
+
+        with open(path, 'w') as f:
+            f.write('10.1.1.2 printer.office\n')
+        self.assertTrue(server.load_local())
+        self.assertEqual(DNSPacket.parse(server.lookup(request)).answers[0].value, '10.1.1.2')
+
+        with open(path, 'w') as f:
+            f.write('not-an-address printer.office\n')
+        self.assertFalse(server.load_local())
+        self.assertEqual(DNSPacket.parse(server.lookup(request)).answers[0].value, '10.1.1.2')
+        self.assertEqual(server.local_answers, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import socket
+import unittest
+import urllib.request
+
+from DnsServer.bench.fake_upstream import FakeUpstream
+from DnsServer.main.dns_packet import DNSPacket, DNSQuestion, DNSType
+from DnsServer.main.metrics import Histogram
+from DnsServer.main.server import DNSServer
+
+
+class TestHistogram(unittest.TestCase):
+    def test_percentiles_within_bucket_precision(self):
+        """Процентили совпадают с точными с погрешностью не больше ширины бакета (12.5%)"""
+        histogram = Histogram()
+        for i in range(1, 10001):
+            histogram.record(i / 100_000)  # 10 мкс .. 100 мс
+        for q, exact in ((50, 0.05), (99, 0.099), (99.9, 0.0999)):
+            self.assertGreaterEqual(histogram.percentile(q), exact)
+            self.assertLessEqual(histogram.percentile(q), exact * 1.125)
+
+    def test_cumulative_buckets(self):
+        """Экспортируемые бакеты накопительные и последний содержит все значения"""
+        histogram = Histogram()
+        for seconds in (0.00001, 0.001, 0.001, 2.0, 500.0):
+            histogram.record(seconds)
+        counts = [count for _, count in histogram.cumulative()]
+        self.assertEqual(counts, sorted(counts))
+        self.assertEqual(counts[-1], 5)
+        self.assertEqual(dict(histogram.cumulative())[0.001024], 3)
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.upstream = FakeUpstream().start()
+        self.server = DNSServer(":memory:")
+        self.server.upstreams = [self.upstream.address]
+        self.server.metrics.sample_every = 1  # замеряем каждый запрос
+        self.server.metrics_port = 0
+        self.server.start_metrics()
+        self.port = self.server._metrics_http.server_address[1]
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(2)
+
+    def tearDown(self):
+        self.sock.close()
+        self.server.stop()
+        self.upstream.stop()
+
+    def query(self, name, qtype=DNSType.A):
+        """Запрос через handle_request, как его вызывает цикл приёма датаграмм"""
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as server_sock:
+            wire = DNSPacket(1, 0x0100, [DNSQuestion(name, qtype, 1)], [], [], []).to_wire()
+            self.server.handle_request(server_sock, wire, self.sock.getsockname())
+        return DNSPacket.parse(self.sock.recvfrom(4096)[0])
+
+    def scrape(self):
+        with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/metrics", timeout=2) as response:
+            return response.read().decode()
+
+    def test_counters_and_histograms(self):
+        """/metrics отдаёт счётчики по типам, статистику кэша и гистограммы этапов и upstream"""
+        self.query("metrics.example.com")
+        self.query("metrics.example.com")
+        self.query("metrics.example.com", DNSType.AAAA)
+
+        lines = self.scrape().splitlines()
+        self.assertIn('dns_queries_total{transport="udp",qtype="A"} 2', lines)
+        self.assertIn('dns_queries_total{transport="udp",qtype="AAAA"} 1', lines)
+        self.assertIn('dns_cache_hits_total 1', lines)
+        self.assertIn('dns_cache_misses_total 2', lines)
+        self.assertIn('dns_upstream_inflight 0', lines)
+        self.assertIn('dns_stage_seconds_count{stage="cache"} 3', lines)
+        self.assertIn('dns_stage_seconds_count{stage="resolve"} 2', lines)
+        server = f'{self.upstream.address[0]}:{self.upstream.address[1]}'
+        self.assertIn(f'dns_upstream_rtt_seconds_count{{server="{server}"}} 2', lines)
+        self.assertIn(f'dns_upstream_rtt_seconds_bucket{{server="{server}",le="+Inf"}} 2', lines)
+
+    def test_unknown_path(self):
+        with self.assertRaises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"http://127.0.0.1:{self.port}/other", timeout=2)
+        self.assertEqual(error.exception.code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
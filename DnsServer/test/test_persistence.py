@@ -0,0 +1,130 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+from DnsServer.main.cache import DNSCache
+from DnsServer.main.dns_packet import DNSPacket, DNSQuestion, DNSType
+from DnsServer.main.persistence import SnapshotStore
+from DnsServer.main.shared_cache import SharedAnswerTable
+from DnsServer.test.test_dns_packet import make_response
+
+
+def request_for(name, qtype=DNSType.A):
+    return DNSPacket(1, 0x0100, [DNSQuestion(name, qtype, 1)], [], [], [])
+
+
+def _worker_hit(shared):
+    """Воркер, как в run_workers: без файла кэша, только с общей таблицей"""
+    cache = DNSCache(None)
+    cache.attach_shared(shared)
+    os._exit(0 if cache.get_wire(request_for("www.example.com")) is not None else 1)
+
+
+class TestSnapshotPersistence(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'cache.snapshot')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_snapshot_loaded_lazily(self):
+        """После save() снимок не разбирается при запуске, записи читаются по требованию"""
+        cache = DNSCache(self.path)
+        cache.update(make_response())
+        cache.save()
+
+        restored = DNSCache(self.path)
+        self.assertEqual(len(restored.entries), 0)
+        self.assertEqual(len(restored.store), 5)
+        wire = restored.get_wire(request_for("www.example.com"))
+        self.assertEqual(DNSPacket.parse(wire).answers[1].value, "93.184.216.34")
+        # RRset из authority сохраняется в виде готового ответа на свой вопрос
+        self.assertIsNotNone(restored.get_wire(request_for("example.com", DNSType.NS)))
+
+    def test_evicted_snapshot_entry_not_resurrected(self):
+        """Запись снимка отдаётся один раз; вытесненный из кэша ключ из снимка не возвращается"""
+        cache = DNSCache(self.path)
+        cache.update(make_response())
+        cache.save()
+
+        restored = DNSCache(self.path)
+        key = ("www.example.com", 1, 1)
+        self.assertIsNotNone(restored.get_wire(request_for("www.example.com")))
+        with restored.lock:
+            restored._remove(key)  # как при вытеснении политикой
+        self.assertIsNone(restored.get_wire(request_for("www.example.com")))
+
+        restored.store.discard(("example.com", int(DNSType.NS), 1))
+        self.assertIsNone(restored.get_wire(request_for("example.com", DNSType.NS)))
+
+    def test_workers_see_restored_snapshot(self):
+        """После перезапуска с --workers ответы снимка доступны воркерам через общую таблицу"""
+        cache = DNSCache(self.path)
+        cache.update(make_response())
+        cache.save()
+
+        parent = DNSCache(self.path)
+        parent.attach_shared(SharedAnswerTable(slots=64))
+        worker = multiprocessing.get_context('fork').Process(target=_worker_hit, args=(parent.shared,))
+        worker.start()
+        worker.join(5)
+        self.assertEqual(worker.exitcode, 0)
+
+    def test_journal_survives_crash(self):
+        """Записи из журнала восстанавливаются без save(); оборванный хвост игнорируется"""
+        cache = DNSCache(self.path)
+        cache.update(make_response())
+        cache.persist()
+        with open(self.path + '.journal', 'ab') as f:
+            f.write(b'\x01\x02\x03')  # запись, оборванная при аварийном завершении
+
+        restored = DNSCache(self.path)
+        self.assertIn(("www.example.com", 1, 1), restored.entries)
+
+    def test_compaction_truncates_journal(self):
+        """Пересборка снимка переносит журнал в снимок и очищает журнал"""
+        cache = DNSCache(self.path)
+        cache.update(make_response("a.example.com"))
+        cache.persist()
+        cache.update(make_response("b.example.com"))
+        cache.save()
+
+        self.assertEqual(cache.store.journal_records, 0)
+        restored = DNSCache(self.path)
+        self.assertIsNotNone(restored.get_wire(request_for("a.example.com")))
+        self.assertIsNotNone(restored.get_wire(request_for("b.example.com")))
+
+    def test_compaction_capped_by_cache_limits(self):
+        """Снимок не растёт сверх max_entries: записи кэша вытесняют старые записи снимка"""
+        now = 1000.0
+        records = [((f"h{i}.example.com", 1, 1), b'\x00' * 32, b'', 0, now, now + 100 + i) for i in range(10)]
+        store = SnapshotStore(self.path)
+        store.compact(records[:6], now, max_entries=4)
+        self.assertEqual(len(store), 4)
+        self.assertIsNone(store.take(records[0][0]))  # истекает раньше всех
+        self.assertIsNotNone(store.take(records[5][0]))
+
+        store.compact(records[6:9], now, max_entries=4)
+        self.assertEqual(len(store), 4)
+        self.assertIsNotNone(store.take(records[8][0]))
+        store.compact(records[9:], now, max_entries=4, max_bytes=200)
+        self.assertEqual(len(store), 2)
+
+    def test_compaction_closes_old_mapping(self):
+        """После пересборки прежнее отображение снимка закрывается"""
+        cache = DNSCache(self.path)
+        cache.update(make_response("a.example.com"))
+        cache.save()
+        old = cache.store.snapshot[0]
+        cache.update(make_response("b.example.com"))
+        cache.save()
+
+        self.assertTrue(old.closed)
+        self.assertFalse(cache.store.snapshot[0].closed)
+        self.assertIsNotNone(cache.store.take(("b.example.com", 1, 1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+
+from DnsServer.main.dns_packet import FLAG_TC, RCODE_NXDOMAIN, DNSPacket, DNSQuestion, DNSRecord, DNSType
+from DnsServer.main.ratelimit import ClientRateLimiter, ResponseRateLimiter, TokenBuckets
+
+
+def make_request(name):
+    request = DNSPacket(1, 0x0100, [DNSQuestion(name, DNSType.A, 1)], [], [], [])
+    request.raw_data = request.to_wire()
+    return request
+
+
+def answer_wire(request):
+    response = request.create_response()
+    response.add_answer(DNSRecord(request.questions[0].name, DNSType.A, 1, 300, b'\xc0\x00\x02\x01'))
+    return response.to_wire()
+
+
+class TestTokenBuckets(unittest.TestCase):
+    def test_burst_then_refill(self):
+        """После всплеска бакет пополняется со скоростью rate"""
+        buckets = TokenBuckets(rate=10, burst=3, slots=16)
+        self.assertEqual([buckets.take(5, 100.0) for _ in range(4)], [True, True, True, False])
+        self.assertFalse(buckets.take(5, 100.05))  # полтокена
+        self.assertTrue(buckets.take(5, 100.15))
+        self.assertFalse(buckets.take(5, 100.15))
+
+    def test_colliding_keys_share_set(self):
+        """Ключи одного набора не вытесняют друг друга, пока в наборе есть место"""
+        buckets = TokenBuckets(rate=1, burst=1, slots=16)  # 4 набора по 4 слота
+        for key in (1, 5, 9, 13):
+            self.assertTrue(buckets.take(key, 0.0))
+        for key in (1, 5, 9, 13):
+            self.assertFalse(buckets.take(key, 0.0))
+
+    def test_collision_does_not_refill_bucket(self):
+        """Новый ключ в заполненном наборе наследует токены вытесненного, а не полный бакет"""
+        buckets = TokenBuckets(rate=1, burst=2, slots=4)  # один набор
+        for key in (1, 2, 3, 4):
+            buckets.take(key, 0.0)
+            buckets.take(key, 0.0)
+        self.assertFalse(buckets.take(5, 0.0))
+        self.assertFalse(buckets.take(1, 0.0) or buckets.take(5, 0.0))
+        self.assertTrue(buckets.take(6, 1.0))  # вытеснен бакет, пополнившийся за секунду
+
+
+class TestClientRateLimiter(unittest.TestCase):
+    def test_limits_by_prefix(self):
+        """Адреса одной /24 делят бакет, соседняя подсеть считается отдельно"""
+        limiter = ClientRateLimiter(rate=1, burst=2)
+        self.assertTrue(limiter.allow('192.0.2.1', 0.0))
+        self.assertTrue(limiter.allow('192.0.2.200', 0.0))
+        self.assertFalse(limiter.allow('192.0.2.7', 0.0))
+        self.assertTrue(limiter.allow('192.0.3.1', 0.0))
+        self.assertTrue(limiter.allow('2001:db8::1', 0.0))
+        self.assertEqual(limiter.dropped, 1)
+
+
+class TestResponseRateLimiter(unittest.TestCase):
+    def test_slip_truncates_every_second_excess_response(self):
+        """Сверх лимита ответы чередуются: отброшен, обрезан с TC, отброшен, ..."""
+        rrl = ResponseRateLimiter(rate=2, slip=2)
+        request = make_request('flood.example.com')
+        wire = answer_wire(request)
+
+        replies = [rrl.limit('198.51.100.9', request, wire, 0.0) for _ in range(6)]
+        self.assertEqual(replies[:2], [wire, wire])
+        self.assertEqual([reply is None for reply in replies[2:]], [True, False, True, False])
+        truncated = DNSPacket.parse(replies[3])
+        self.assertTrue(truncated.flags & FLAG_TC)
+        self.assertEqual(truncated.answers, [])
+        self.assertEqual((rrl.dropped, rrl.slipped), (2, 2))
+        # Другое имя — другой ответ со своим лимитом
+        other = make_request('other.example.com')
+        self.assertIsNotNone(rrl.limit('198.51.100.9', other, answer_wire(other), 0.0))
+
+    def test_errors_share_bucket_across_names(self):
+        """NXDOMAIN на разные имена считаются одним ответом (атака случайными поддоменами)"""
+        rrl = ResponseRateLimiter(rate=1, slip=0)
+        replies = []
+        for i in range(3):
+            request = make_request(f'{i}.random.example.com')
+            replies.append(rrl.limit('203.0.113.5', request,
+                                     request.create_error_response(RCODE_NXDOMAIN).to_wire(), 0.0))
+        self.assertIsNotNone(replies[0])
+        self.assertEqual(replies[1:], [None, None])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import socket
+import unittest
+
+from DnsServer.bench.fake_upstream import FakeAuthority
+from DnsServer.main.cache import DNSCache
+from DnsServer.main.dns_packet import DNSPacket, DNSQuestion, DNSRecord, DNSType, encode_name
+from DnsServer.main.resolver import IterativeResolver
+
+
+def ns(zone, server):
+    return DNSRecord(zone, DNSType.NS, 1, 3600, encode_name(server))
+
+
+def a(name, address):
+    return DNSRecord(name, DNSType.A, 1, 3600, socket.inet_aton(address))
+
+
+class PoisoningAuthority(FakeAuthority):
+    """Сервер evil.com, который дописывает к ответам записи о чужих зонах"""
+
+    def answer(self, data):
+        response = DNSPacket.parse(super().answer(data))
+        response.answers += [a('www.example.com', '203.0.113.66')]
+        response.authorities += [ns('com', 'ns.evil.com'), ns('example.com', 'ns.evil.com')]
+        response.additionals += [a('ns.evil.com', '203.0.113.66'), a('a.nic.com', '203.0.113.66'),
+                                 a('ns1.example.com', '203.0.113.66')]
+        return response.to_wire()
+
+
+def make_request(name, qtype=DNSType.A):
+    request = DNSPacket(7, 0x0100, [DNSQuestion(name, qtype, 1)], [], [], [])
+    request.raw_data = request.to_wire()
+    return request
+
+
+class TestIterativeResolver(unittest.TestCase):
+    """Иерархия корень → com → example.com / other.com на 127.0.0.2–5 с общим портом"""
+
+    def setUp(self):
+        self.root = FakeAuthority('', [ns('com', 'a.nic.com'), a('a.nic.com', '127.0.0.3')], '127.0.0.2')
+        port = self.root.address[1]
+        self.com = FakeAuthority('com', [
+            ns('example.com', 'ns1.example.com'), a('ns1.example.com', '127.0.0.4'),
+            ns('other.com', 'ns2.example.com'),  # без glue: адрес сервера нужно разрешить отдельно
+            ns('evil.com', 'ns1.evil.com'), a('ns1.evil.com', '127.0.0.6'),
+        ], '127.0.0.3', port)
+        self.example = FakeAuthority('example.com', [
+            ns('example.com', 'ns1.example.com'),
+            a('www.example.com', '192.0.2.10'),
+            a('ns2.example.com', '127.0.0.5'),
+            DNSRecord('alias.example.com', DNSType.CNAME, 1, 3600, encode_name('www.other.com')),
+        ], '127.0.0.4', port)
+        self.other = FakeAuthority('other.com', [a('www.other.com', '192.0.2.20')], '127.0.0.5', port)
+        self.evil = PoisoningAuthority('evil.com', [ns('evil.com', 'ns1.evil.com'), a('www.evil.com', '192.0.2.30')],
+                                       '127.0.0.6', port)
+        self.servers = [self.root, self.com, self.example, self.other, self.evil]
+        for server in self.servers:
+            server.start()
+        self.cache = DNSCache(':memory:')
+        self.resolver = IterativeResolver(self.cache, [self.root.address], port=port, timeout=2.0)
+
+    def tearDown(self):
+        self.resolver.close()
+        for server in self.servers:
+            server.stop()
+
+    def test_walks_from_root_and_reuses_zone_cut(self):
+        """Первый запрос идёт от корня, следующий в той же зоне — сразу к её серверу"""
+        response = self.resolver.resolve(make_request('www.example.com'))
+
+        self.assertEqual([record.value for record in response.answers], ['192.0.2.10'])
+        self.assertEqual((self.root.queries, self.com.queries, self.example.queries), (1, 1, 1))
+        self.assertEqual(response.flags, 0x8180)
+
+        missing = self.resolver.resolve(make_request('ftp.example.com'))
+        self.assertEqual(missing.rcode, 3)
+        self.assertEqual(missing.authorities[0].type, DNSType.SOA)
+        self.assertEqual((self.root.queries, self.com.queries, self.example.queries), (1, 1, 2))
+
+    def test_cname_into_zone_without_glue(self):
+        """CNAME в другую зону, чей NS-сервер приходится разрешать без glue"""
+        response = self.resolver.resolve(make_request('alias.example.com'))
+
+        self.assertEqual([(record.type, record.value) for record in response.answers],
+                         [(DNSType.CNAME, 'www.other.com'), (DNSType.A, '192.0.2.20')])
+        self.assertEqual(self.other.queries, 1)
+        # Делегирование other.com закэшировано: корень и com больше не нужны
+        before = (self.root.queries, self.com.queries)
+        self.resolver.resolve(make_request('www.other.com'))
+        self.assertEqual((self.root.queries, self.com.queries), before)
+        self.assertEqual(self.other.queries, 2)
+
+    def test_out_of_zone_records_are_not_cached(self):
+        """Сервер evil.com не может подменить записи com и example.com ни ответом, ни NS, ни glue"""
+        response = self.resolver.resolve(make_request('www.evil.com'))
+        self.assertEqual([(record.name, record.value) for record in response.answers],
+                         [('www.evil.com', '192.0.2.30')])
+
+        def cached(name, qtype):
+            return sorted(record.value for record in self.cache.get_records(name, qtype))
+
+        self.assertEqual(cached('www.example.com', DNSType.A), [])
+        self.assertEqual(cached('com', DNSType.NS), ['a.nic.com'])
+        self.assertEqual(cached('example.com', DNSType.NS), [])
+        self.assertEqual(cached('a.nic.com', DNSType.A), ['127.0.0.3'])
+        self.assertEqual(cached('ns.evil.com', DNSType.A), [])
+        self.assertEqual(cached('ns1.example.com', DNSType.A), [])
+
+        # Ответ для www.example.com по-прежнему приходит от настоящего сервера
+        response = self.resolver.resolve(make_request('www.example.com'))
+        self.assertEqual([record.value for record in response.answers], ['192.0.2.10'])
+
+    def test_resolver_reads_not_counted_as_hits(self):
+        """Служебные чтения резолвера не меняют статистику попаданий кэша"""
+        self.resolver.resolve(make_request('www.example.com'))
+        self.resolver.resolve(make_request('www.example.com', DNSType.AAAA))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,18 @@
+import asyncio
+import gc
 import unittest
 import threading
 import time
 import socket
+import struct
 
+from DnsServer.bench.fake_upstream import FakeUpstream
+from DnsServer.main.aio_server import AsyncDNSServer, DNSStreamProtocol
 from DnsServer.main.cache import DNSCache
+from DnsServer.main.const import TCP_PIPELINE_LIMIT
+from DnsServer.main.ratelimit import ClientRateLimiter
 from DnsServer.main.server import DNSServer
-from DnsServer.main.dns_packet import DNSPacket, DNSQuestion, DNSRecord
+from DnsServer.main.dns_packet import DNSPacket, DNSQuestion, DNSRecord, DNSType, add_opt, encode_name
 
 
 class TestDNSServer(unittest.TestCase):
@@ -83,10 +90,232 @@ class TestDNSServer(unittest.TestCase):
         self.assertEqual(len(cached_response.answers), 1, "Неверное количество записей в кэше")
 
 
+class TestAsyncDNSServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.upstream = FakeUpstream().start()
+        cls.server = AsyncDNSServer(":memory:")
+        cls.server.upstreams = [cls.upstream.address]
+        cls.test_port = 53536
+        cls.server_thread = threading.Thread(target=cls.server.start, kwargs={'port': cls.test_port})
+        cls.server_thread.daemon = True
+        cls.server_thread.start()
+        time.sleep(0.5)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        cls.server_thread.join(5)
+        cls.upstream.stop()
+
+    def query(self, query_id, name):
+        packet = DNSPacket(query_id, 0x0100, [DNSQuestion(name, 1, 1)], [], [], [])
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.settimeout(2)
+            s.sendto(packet.to_wire(), ('127.0.0.1', self.test_port))
+            data, _ = s.recvfrom(512)
+        return DNSPacket.parse(data)
+
+    def test_miss_then_hit(self):
+        """Промах уходит в upstream, повторный запрос отвечается из кэша"""
+        first = self.query(0x1111, "async.example.com")
+        second = self.query(0x2222, "async.example.com")
+
+        self.assertEqual(first.id, 0x1111)
+        self.assertEqual(second.id, 0x2222)
+        self.assertEqual(second.answers[0].value, "192.0.2.1")
+        self.assertEqual(self.upstream.queries, 1)
+
+    def test_pipelined_tcp_queries(self):
+        """Несколько запросов подряд в одном TCP-соединении, ответы сопоставляются по ID"""
+        names = {0x3000 + i: f"tcp{i}.example.com" for i in range(3)}
+        with socket.create_connection(('127.0.0.1', self.test_port), timeout=2) as s:
+            for query_id, name in names.items():
+                wire = DNSPacket(query_id, 0x0100, [DNSQuestion(name, 1, 1)], [], [], []).to_wire()
+                s.sendall(len(wire).to_bytes(2, 'big') + wire)
+            stream = s.makefile('rb')
+            replies = {}
+            for _ in names:
+                reply = DNSPacket.parse(stream.read(int.from_bytes(stream.read(2), 'big')))
+                replies[reply.id] = reply.questions[0].name
+        self.assertEqual(replies, names)
+
+
+class TestTCPPipeline(unittest.TestCase):
+    """Конвейер запросов в одном TCP-соединении потокового сервера"""
+
+    def setUp(self):
+        self.server = DNSServer(":memory:")
+        self.server.running = True
+        self.active = self.max_active = 0
+        self.lock = threading.Lock()
+        self.server.answer = self.slow_answer
+
+    def slow_answer(self, request):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+        return DNSPacket(request.id, 0x8180, request.questions, [], [], []).to_wire()
+
+    def pipeline(self, count):
+        """Отправляет count запросов одним куском и возвращает ID полученных ответов"""
+        client, conn = socket.socketpair()
+        handler = threading.Thread(target=self.server.handle_tcp, args=(conn, ('127.0.0.1', 0)))
+        handler.start()
+        with client:
+            client.settimeout(5)
+            for query_id in range(count):
+                wire = DNSPacket(query_id, 0x0100, [DNSQuestion(f"q{query_id}.example.com", 1, 1)], [], [], []).to_wire()
+                client.sendall(len(wire).to_bytes(2, 'big') + wire)
+            client.shutdown(socket.SHUT_WR)
+            stream = client.makefile('rb')
+            ids = []
+            try:
+                while True:
+                    length = stream.read(2)
+                    if not length:
+                        break
+                    ids.append(DNSPacket.parse(stream.read(int.from_bytes(length, 'big'))).id)
+            except ConnectionResetError:
+                pass  # сервер закрыл соединение с непрочитанными запросами
+        handler.join(5)
+        return ids
+
+    def test_pipelined_requests_use_bounded_pool(self):
+        ids = self.pipeline(50)
+        self.assertEqual(sorted(ids), list(range(50)))
+        self.assertEqual(self.max_active, TCP_PIPELINE_LIMIT)
+
+    def test_rate_limit_applies_to_pipelined_messages_and_connections(self):
+        self.server.limiter = ClientRateLimiter(rate=1, burst=10)
+        self.assertLessEqual(len(self.pipeline(50)), 10)  # сверх лимита соединение закрыто
+        self.assertEqual(self.server.limiter.dropped, 1)
+        self.assertLessEqual(self.max_active, 10)
+
+        # Новое соединение с той же подсети закрывается сразу при приёме
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(4)
+        threading.Thread(target=self.server.serve_tcp, args=(listener,), daemon=True).start()
+        with socket.create_connection(listener.getsockname(), timeout=2) as client:
+            self.assertEqual(client.recv(2), b'')
+        self.assertEqual(self.server.limiter.dropped, 2)
+
+
+class FakeTransport:
+    def __init__(self):
+        self.written = []
+        self.reading = True
+        self.closed = False
+
+    def get_extra_info(self, name):
+        return ('127.0.0.1', 40000)
+
+    def write(self, data):
+        self.written.append(data)
+
+    def pause_reading(self):
+        self.reading = False
+
+    def resume_reading(self):
+        self.reading = True
+
+    def close(self):
+        self.closed = True
+
+    def is_closing(self):
+        return self.closed
+
+
+class TestAsyncTCPPipeline(unittest.TestCase):
+    """Промахи конвейера в одном TCP-соединении asyncio-сервера"""
+
+    def run_pipeline(self, count, limiter=None):
+        async def main():
+            server = AsyncDNSServer(":memory:")
+            server.loop = asyncio.get_running_loop()
+            server.limiter = limiter
+            gate = asyncio.Event()
+            started = []
+
+            async def resolve(request):
+                started.append(request.id)
+                await gate.wait()
+                return None
+
+            server.resolve_or_stale_async = resolve
+            protocol = DNSStreamProtocol(server)
+            transport = FakeTransport()
+            protocol.connection_made(transport)
+            protocol.data_received(b''.join(
+                len(wire).to_bytes(2, 'big') + wire for wire in (
+                    DNSPacket(i, 0x0100, [DNSQuestion(f"q{i}.example.com", 1, 1)], [], [], []).to_wire()
+                    for i in range(count))))
+            await asyncio.sleep(0.01)
+            blocked = (len(started), protocol.inflight, transport.reading)
+            gate.set()
+            for _ in range(100):
+                await asyncio.sleep(0.005)
+                if not protocol.inflight:
+                    break
+            return blocked, len(started), len(transport.written), transport
+        return asyncio.run(main())
+
+    def test_inflight_misses_are_bounded(self):
+        blocked, started, written, transport = self.run_pipeline(40)
+        self.assertEqual(blocked, (TCP_PIPELINE_LIMIT, TCP_PIPELINE_LIMIT, False))
+        self.assertEqual((started, written, transport.reading), (40, 40, True))
+
+    def test_spawned_tasks_kept_until_done(self):
+        """Сервер держит ссылки на свои задачи: цикл событий хранит лишь слабые"""
+        async def main():
+            server = AsyncDNSServer(":memory:")
+            server.loop = asyncio.get_running_loop()
+            gate = asyncio.Event()
+            done = []
+
+            async def job():
+                await gate.wait()
+                done.append(True)
+
+            server.spawn(job())
+            gc.collect()
+            pending = len(server.tasks)
+            gate.set()
+            await asyncio.sleep(0.01)
+            return pending, done, len(server.tasks)
+        self.assertEqual(asyncio.run(main()), (1, [True], 0))
+
+    def test_rate_limit_closes_connection(self):
+        limiter = ClientRateLimiter(rate=1, burst=5)
+        _, started, _, transport = self.run_pipeline(40, limiter)
+        self.assertEqual(started, 4)  # один токен ушёл на приём соединения
+        self.assertTrue(transport.closed)
+
+
 class TestDNSCache(unittest.TestCase):
     def setUp(self):
         self.cache = DNSCache(":memory:")
 
+    def test_expired_counts_removals_not_reads(self):
+        """Счётчик expired растёт при удалении записи, а не при каждом чтении просроченной"""
+        key = ("expire.com", 1, 1)
+        packet = DNSPacket(1, 0x8180, [DNSQuestion("expire.com", 1, 1)],
+                           [DNSRecord("expire.com", 1, 1, 1, socket.inet_aton("127.0.0.1"))], [], [])
+        stale = DNSCache(":memory:", stale_max_age=3600)
+        stale.update(packet)
+        for _ in range(5):
+            self.assertIsNone(stale.lookup(key, time.monotonic() + 2))
+        self.assertEqual(stale.expired, 0)  # хранится для serve-stale
+
+        self.cache.update(packet)
+        for _ in range(5):
+            self.cache.lookup(key, time.monotonic() + 2)
+        self.assertEqual(self.cache.expired, 1)
+
     def test_cache_expiration(self):
         """Тестирование очистки кэша по TTL"""
         record = DNSRecord("expire.com", 1, 1, 1, socket.inet_aton("127.0.0.1"))  # TTL=1 секунда
@@ -100,11 +329,149 @@ class TestDNSCache(unittest.TestCase):
         )
 
         self.cache.update(packet)
-        self.assertTrue("expire.com" in self.cache.name_to_records, "Запись не добавлена в кэш")
+        self.assertTrue(("expire.com", 1, 1) in self.cache.entries, "Запись не добавлена в кэш")
 
         time.sleep(1.1)  # Ждем истечения TTL
         self.cache.cleanup()
-        self.assertFalse("expire.com" in self.cache.name_to_records, "Просроченная запись не удалена")
+        self.assertFalse(("expire.com", 1, 1) in self.cache.entries, "Просроченная запись не удалена")
+
+    def test_lazy_expiration_on_read(self):
+        """Просроченная запись удаляется при чтении, не дожидаясь cleanup"""
+        record = DNSRecord("lazy.com", 1, 1, 300, socket.inet_aton("127.0.0.1"))
+        packet = DNSPacket(1, 0x8180, [DNSQuestion("lazy.com", 1, 1)], [record], [], [])
+        self.cache.update(packet)
+        self.cache.entries[("lazy.com", 1, 1)].expires = time.monotonic() - 1
+
+        self.assertIsNone(self.cache.get_response(packet))
+        self.assertNotIn(("lazy.com", 1, 1), self.cache.entries)
+
+    def test_authority_rrset_cached_by_type(self):
+        """NS из секции authority отдаётся на NS-запрос, но не на A-запрос"""
+        ns = DNSRecord("zone.com", 2, 1, 300, b'\x03ns1\x04zone\x03com\x00')
+        answer = DNSRecord("www.zone.com", 1, 1, 300, socket.inet_aton("127.0.0.2"))
+        self.cache.update(DNSPacket(1, 0x8180, [DNSQuestion("www.zone.com", 1, 1)], [answer], [ns], []))
+
+        ns_query = DNSPacket(2, 0x0100, [DNSQuestion("zone.com", 2, 1)], [], [], [])
+        a_query = DNSPacket(3, 0x0100, [DNSQuestion("zone.com", 1, 1)], [], [], [])
+        self.assertEqual(self.cache.get_response(ns_query).answers, [ns])
+        self.assertIsNone(self.cache.get_response(a_query))
+
+    def test_serve_stale_when_upstream_fails(self):
+        """Без ответа upstream отдаётся просроченная запись с TTL 30 (RFC 8767)"""
+        server = DNSServer(":memory:", stale_max_age=3600)
+        record = DNSRecord("stale.com", 1, 1, 300, socket.inet_aton("127.0.0.3"))
+        request = DNSPacket(77, 0x0100, [DNSQuestion("stale.com", 1, 1)], [], [], [])
+        request.raw_data = request.to_wire()
+        server.cache.update(DNSPacket(1, 0x8180, request.questions, [record], [], []))
+        server.cache.entries[("stale.com", 1, 1)].expires = time.monotonic() - 10
+
+        self.assertIsNone(server.cache.get_wire(request))
+        server.cache.cleanup()
+        reply = DNSPacket.parse(server.build_reply(request, None))
+
+        self.assertEqual(reply.id, 77)
+        self.assertEqual(reply.rcode, 0)
+        self.assertEqual([(r.value, r.ttl) for r in reply.answers], [("127.0.0.3", 30)])
+        # После неудачи просроченный ответ отдаётся сразу, без ожидания upstream
+        self.assertIsNotNone(server.cache.get_wire(request))
+        # Без serve-stale — прежнее поведение: ошибка
+        self.assertIsNone(self.cache.get_stale_wire(request))
+
+    def test_prefetch_near_expiry(self):
+        """Попадание в последние 10% TTL запускает фоновое обновление, более раннее — нет"""
+        refreshed = []
+        self.cache.prefetch = refreshed.append
+        record = DNSRecord("hot.com", 1, 1, 100, socket.inet_aton("127.0.0.4"))
+        request = DNSPacket(1, 0x0100, [DNSQuestion("hot.com", 1, 1)], [], [], [])
+        self.cache.update(DNSPacket(1, 0x8180, request.questions, [record], [], []))
+
+        self.assertIsNotNone(self.cache.get_wire(request))
+        self.assertEqual(refreshed, [])
+        self.cache.entries[("hot.com", 1, 1)].stored_at -= 95
+        self.cache.entries[("hot.com", 1, 1)].expires -= 95
+        self.assertIsNotNone(self.cache.get_wire(request))
+        self.assertEqual(refreshed, [request])
+
+
+class TestNegativeCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = DNSCache(":memory:")
+        # SOA: mname, rname, serial, refresh, retry, expire, minimum=60
+        soa_data = encode_name("ns.missing.com") + encode_name("admin.missing.com") + \
+            struct.pack('!IIIII', 1, 7200, 3600, 1209600, 60)
+        self.soa = DNSRecord("missing.com", DNSType.SOA, 1, 3600, soa_data)
+
+    def query(self, name, qtype=DNSType.A):
+        request = DNSPacket(9, 0x0100, [DNSQuestion(name, qtype, 1)], [], [], [])
+        request.raw_data = request.to_wire()
+        return request
+
+    def test_nxdomain_cached_with_soa_minimum(self):
+        """NXDOMAIN кэшируется на min(TTL SOA, MINIMUM) и отдаётся с тем же rcode"""
+        request = self.query("typo.missing.com")
+        self.cache.update(DNSPacket(1, 0x8183, request.questions, [], [self.soa], []))
+
+        reply = DNSPacket.parse(self.cache.get_wire(request))
+        self.assertEqual(reply.rcode, 3)
+        self.assertEqual(reply.id, 9)
+        self.assertEqual([(r.type, r.ttl) for r in reply.authorities], [(DNSType.SOA, 60)])
+
+    def test_nxdomain_cut_covers_subdomains(self):
+        """Под несуществующим именем нет и поддоменов, и других типов (RFC 8020)"""
+        self.cache.update(DNSPacket(1, 0x8183, self.query("typo.missing.com").questions, [], [self.soa], []))
+
+        for request in (self.query("a.b.typo.missing.com"), self.query("typo.missing.com", DNSType.AAAA)):
+            reply = DNSPacket.parse(self.cache.get_wire(request))
+            self.assertEqual(reply.rcode, 3)
+            self.assertEqual(reply.questions, request.questions)
+            self.assertLessEqual(reply.authorities[0].ttl, 60)
+        self.assertIsNone(self.cache.get_wire(self.query("other.missing.com")))
+
+    def test_nodata_cached_per_type(self):
+        """NODATA кэшируется только для запрошенного типа"""
+        request = self.query("www.missing.com", DNSType.AAAA)
+        self.cache.update(DNSPacket(1, 0x8180, request.questions, [], [self.soa], []))
+
+        reply = DNSPacket.parse(self.cache.get_wire(request))
+        self.assertEqual((reply.rcode, reply.answers), (0, []))
+        self.assertIsNone(self.cache.get_wire(self.query("www.missing.com")))
+
+    def test_failure_is_servfail_and_not_cached(self):
+        """Недоступность upstream — SERVFAIL, а не NXDOMAIN, и в кэш не попадает"""
+        server = DNSServer(":memory:")
+        request = self.query("down.missing.com")
+        reply = DNSPacket.parse(server.build_reply(request, None))
+        self.assertEqual(reply.rcode, 2)
+        self.assertIsNone(server.cache.get_wire(request))
+
+
+class TestUDPReply(unittest.TestCase):
+    def setUp(self):
+        self.server = DNSServer(":memory:")
+        self.upstream = FakeUpstream(records=60)
+        self.upstream.stop()
+
+    def request(self, payload=None):
+        request = DNSPacket(5, 0x0100, [DNSQuestion("big.example.com", 1, 1)], [], [], [])
+        wire = request.to_wire() if payload is None else add_opt(request.to_wire(), payload)
+        return DNSPacket.parse(wire)
+
+    def test_truncated_without_edns(self):
+        """Без EDNS ответ длиннее 512 байт уходит обрезанным до вопроса с флагом TC"""
+        request = self.request()
+        reply = DNSPacket.parse(self.server.udp_reply(request, self.upstream.answer(request.raw_data)))
+        self.assertTrue(reply.flags & 0x0200)
+        self.assertEqual((reply.questions, reply.answers), (request.questions, []))
+
+    def test_edns_payload_fits(self):
+        """С EDNS ответ до объявленного размера отдаётся целиком, с OPT нашего размера"""
+        request = self.request(4096)
+        wire = self.server.udp_reply(request, self.upstream.answer(request.raw_data))
+        reply = DNSPacket.parse(wire)
+        self.assertFalse(reply.flags & 0x0200)
+        self.assertEqual(len(reply.answers), 60)
+        self.assertEqual(reply.edns_payload(), 1232)
+        self.assertLessEqual(len(wire), 1232)
 
 
 if __name__ == '__main__':
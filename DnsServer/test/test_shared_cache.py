@@ -0,0 +1,69 @@
+import multiprocessing
+import time
+import unittest
+
+from DnsServer.main.cache import DNSCache
+from DnsServer.main.dns_packet import DNSPacket, DNSQuestion, DNSType
+from DnsServer.main.shared_cache import SharedAnswerTable
+from DnsServer.test.test_dns_packet import make_response
+
+
+def _learn_in_child(shared):
+    cache = DNSCache(None)
+    cache.attach_shared(shared)
+    cache.update(make_response())
+
+
+class TestSharedAnswerTable(unittest.TestCase):
+    def test_answer_learned_by_other_process(self):
+        """Ответ, сохранённый в другом процессе, становится попаданием"""
+        shared = SharedAnswerTable(slots=64)
+        child = multiprocessing.get_context('fork').Process(target=_learn_in_child, args=(shared,))
+        child.start()
+        child.join(5)
+
+        cache = DNSCache(None)
+        cache.attach_shared(shared)
+        request = DNSPacket(7, 0x0100, [DNSQuestion("www.example.com", DNSType.A, 1)], [], [], [])
+        wire = cache.get_wire(request)
+
+        self.assertIsNotNone(wire)
+        self.assertEqual(DNSPacket.parse(wire).answers[1].value, "93.184.216.34")
+
+    def test_absorb_restores_keys(self):
+        """Записи общей таблицы переносятся в локальный кэш под своими ключами"""
+        shared = SharedAnswerTable(slots=64)
+        writer = DNSCache(None)
+        writer.attach_shared(shared)
+        writer.update(make_response())
+
+        reader = DNSCache(None)
+        reader.shared = shared
+        reader.absorb_shared()
+        self.assertIn(("www.example.com", 1, 1), reader.entries)
+
+    def test_absorb_picks_up_older_answers_written_later(self):
+        """Ответ, записанный позже, но с более ранним stored_at, тоже переносится"""
+        shared = SharedAnswerTable(slots=64)
+        writer = DNSCache(None)
+        writer.attach_shared(shared)
+        writer.update(make_response("new.example.com"))
+        parent = DNSCache(None)
+        parent.shared = shared
+        parent.absorb_shared()
+
+        late = DNSCache(None)  # ответ, полученный раньше, но записанный в таблицу позже
+        late.update(make_response("old.example.com"))
+        entry = late.entries[("old.example.com", 1, 1)]
+        now = time.monotonic()
+        shared.put(("old.example.com", 1, 1), entry.wire, entry.ttl_offsets, entry.question_end, now - 60, now + 300)
+        parent.absorb_shared()
+        self.assertIn(("old.example.com", 1, 1), parent.entries)
+
+        parent.entries.clear()
+        parent.absorb_shared()  # неизменённые слоты повторно не переносятся
+        self.assertEqual(parent.entries, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
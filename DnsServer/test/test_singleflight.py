@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import unittest
+
+from DnsServer.bench.fake_upstream import FakeUpstream
+from DnsServer.main.aio_server import AsyncDNSServer
+from DnsServer.main.dns_packet import DNSPacket, DNSQuestion, DNSType
+from DnsServer.main.server import DNSServer
+
+
+def make_request(query_id, name="popular.example.com"):
+    request = DNSPacket(query_id, 0x0100, [DNSQuestion(name, DNSType.A, 1)], [], [], [])
+    request.raw_data = request.to_wire()
+    return request
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.upstream = FakeUpstream(latency=0.2).start()
+
+    def tearDown(self):
+        self.upstream.stop()
+
+    def test_threaded_misses_share_one_upstream_query(self):
+        """Одновременные промахи по одному имени дают один запрос к upstream"""
+        server = DNSServer(None)
+        server.upstreams = [self.upstream.address]
+        replies = {}
+
+        def ask(query_id):
+            request = make_request(query_id)
+            replies[query_id] = server.build_reply(request, server.resolve(request))
+
+        threads = [threading.Thread(target=ask, args=(query_id,)) for query_id in range(1, 6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(self.upstream.queries, 1)
+        self.assertEqual(server.inflight.stats()['coalesced'], 4)
+        self.assertEqual(sorted(DNSPacket.parse(wire).id for wire in replies.values()), [1, 2, 3, 4, 5])
+
+    def test_async_misses_share_one_upstream_query(self):
+        """То же для asyncio-режима"""
+        server = AsyncDNSServer(None)
+        server.upstreams = [self.upstream.address]
+
+        async def run():
+            server.loop = asyncio.get_running_loop()
+            return await asyncio.gather(*(server.resolve_async(make_request(i)) for i in range(5)))
+
+        responses = asyncio.run(run())
+        self.assertEqual(self.upstream.queries, 1)
+        self.assertEqual(server.inflight.stats()['coalesced'], 4)
+        self.assertTrue(all(response.answers for response in responses))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import socket
+import time
+import unittest
+
+from DnsServer.bench.fake_upstream import FakeUpstream
+from DnsServer.main.dns_packet import DNSPacket, DNSQuestion, DNSType
+from DnsServer.main.upstream import UpstreamClient
+
+
+def make_request(name, query_id=1):
+    request = DNSPacket(query_id, 0x0100, [DNSQuestion(name, DNSType.A, 1)], [], [], [])
+    request.raw_data = request.to_wire()
+    return request
+
+
+class TestUpstreamClient(unittest.TestCase):
+    def setUp(self):
+        self.resources = []
+
+    def tearDown(self):
+        for resource in self.resources:
+            if isinstance(resource, FakeUpstream):
+                resource.stop()
+            else:
+                resource.close()
+
+    def make_client(self, servers, **kwargs):
+        client = UpstreamClient(servers, **kwargs)
+        self.resources.append(client)
+        return client
+
+    def test_multiplexed_queries_matched_by_id(self):
+        """Много одновременных запросов через два сокета получают свои ответы"""
+        upstream = FakeUpstream(latency=0.05).start()
+        self.resources.append(upstream)
+        client = self.make_client([upstream.address], sockets=2)
+
+        futures = {f"host{i}.example.com": client.query(make_request(f"host{i}.example.com", i)) for i in range(50)}
+        for name, future in futures.items():
+            response = future.result(timeout=5)
+            self.assertEqual(response.questions[0].name, name)
+        self.assertEqual(client.in_flight(), 0)
+
+    def test_hedges_to_second_upstream(self):
+        """Если первый сервер молчит, запрос дублируется второму до общего таймаута"""
+        silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        silent.bind(('127.0.0.1', 0))
+        self.resources.append(silent)
+        upstream = FakeUpstream().start()
+        self.resources.append(upstream)
+        client = self.make_client([silent.getsockname(), upstream.address], timeout=2.0)
+
+        started = time.monotonic()
+        response = client.resolve(make_request("hedge.example.com"))
+
+        self.assertIsNotNone(response)
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual(client.servers[0].timeouts, 1)
+
+    def test_prefers_fastest_upstream(self):
+        """После замеров RTT запросы уходят самому быстрому серверу"""
+        slow = FakeUpstream(latency=0.05).start()
+        fast = FakeUpstream().start()
+        self.resources += [slow, fast]
+        client = self.make_client([slow.address, fast.address], timeout=1.0)
+
+        for i in range(5):
+            client.resolve(make_request(f"warm{i}.example.com"))
+        client.servers[1].observe(0.001)  # fast ещё не опрашивался — даём ему один замер
+        before = slow.queries
+        for i in range(10):
+            client.resolve(make_request(f"q{i}.example.com"))
+
+        self.assertEqual(slow.queries, before)
+        self.assertEqual(fast.queries, 10)
+
+    def test_timeout_returns_none(self):
+        """Без ответов future завершается None по общему таймауту"""
+        silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        silent.bind(('127.0.0.1', 0))
+        self.resources.append(silent)
+        client = self.make_client([silent.getsockname()], timeout=0.3)
+        self.assertIsNone(client.resolve(make_request("nowhere.example.com")))
+
+    def test_truncated_answer_retried_over_tcp(self):
+        """Ответ с TC повторяется по TCP, несколько таких запросов идут по одному соединению"""
+        upstream = FakeUpstream(records=200, tcp=True).start()
+        self.resources.append(upstream)
+        client = self.make_client([upstream.address], timeout=2.0)
+
+        futures = [client.query(make_request(f"big{i}.example.com", i)) for i in range(5)]
+        for future in futures:
+            response = future.result(timeout=5)
+            self.assertEqual(len(response.answers), 200)
+            self.assertFalse(response.flags & 0x0200)
+        self.assertEqual(upstream.tcp_queries, 5)
+        self.assertEqual(len(client.tcp), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,36 +1,40 @@
 import argparse
-import socket
 
-from Tracer import Tracer
+from Tracer import Tracer, RIPE_URL, ASN_LOOKUP_WORKERS, DEFAULT_ENGINE
+from asn_index import AsnIndex, DEFAULT_INDEX_PATH
+from batch import BATCH_PARALLEL, BatchTracer, read_targets
+from probe import MAX_HOPS, PROBE_TIMEOUT
 from typing import List, Dict, Optional
 
 
 def print_results_table(results: List[Dict]):
     """Выводит результаты в виде таблицы"""
+    print_table_header()
+    for res in results:
+        print_table_row(res)
+
+
+def print_table_header():
     print("\nРезультаты трассировки автономных систем:")
     print("{:<5} {:<15} {:<10} {:<10} {:<20}".format(
         "№", "IP", "AS", "Страна", "Провайдер"
     ))
     print("-" * 60)
 
-    for res in results:
-        print("{:<5} {:<15} {:<10} {:<10} {:<20}".format(
-            res['hop'],
-            res['ip'],
-            res['asn'] if res['asn'] else "N/A",
-            res['country'] if res['country'] else "N/A",
-            res['provider'] if res['provider'] else "N/A"
-        ))
+
+def print_table_row(res: Dict):
+    print("{:<5} {:<15} {:<10} {:<10} {:<20}".format(
+        res['hop'],
+        res['ip'],
+        res['asn'] if res['asn'] else "N/A",
+        res['country'] if res['country'] else "N/A",
+        res['provider'] if res['provider'] else "N/A"
+    ), flush=True)
 
 
 def resolve_target(target: str) -> Optional[str]:
     """Преобразует домен в IP, если нужно"""
-    try:
-        if not Tracer.is_public_ip(target):
-            return socket.gethostbyname(target)
-        return target
-    except (socket.gaierror, ValueError):
-        return None
+    return Tracer.resolve_target(target)
 
 
 def main():
@@ -40,11 +44,89 @@ def main():
     parser.add_argument(
         'target',
         type=str,
+        nargs='?',
         help='Целевой домен или IP-адрес'
     )
+    parser.add_argument(
+        '--targets-file',
+        help='Файл целей (по одной в строке) для пакетной трассировки с результатами в --output'
+    )
+    parser.add_argument(
+        '--output',
+        default='traces.jsonl',
+        help='JSONL с результатами пакетной трассировки; повторный запуск с тем же файлом целей '
+             'продолжает с места остановки (по умолчанию: traces.jsonl)'
+    )
+    parser.add_argument(
+        '--parallel',
+        type=int,
+        default=BATCH_PARALLEL,
+        help=f'Одновременных трассировок в пакетном режиме (по умолчанию: {BATCH_PARALLEL})'
+    )
+    parser.add_argument(
+        '--ripe-url',
+        default=RIPE_URL,
+        help=f'Адрес RIPEstat (по умолчанию: {RIPE_URL})'
+    )
+    parser.add_argument(
+        '--asn-workers',
+        type=int,
+        default=ASN_LOOKUP_WORKERS,
+        help=f'Одновременных запросов к RIPEstat (по умолчанию: {ASN_LOOKUP_WORKERS})'
+    )
+    parser.add_argument(
+        '--asn-db',
+        default=DEFAULT_INDEX_PATH,
+        help='Локальный индекс префикс -> AS (заполняется: python asn_index.py import ip2asn-v4.tsv.gz); '
+             f'пустая строка — только RIPEstat (по умолчанию: {DEFAULT_INDEX_PATH})'
+    )
+    parser.add_argument(
+        '--engine',
+        choices=['probe', 'traceroute'],
+        default=DEFAULT_ENGINE,
+        help='probe — встроенная трассировка со всеми TTL сразу (Linux), '
+             f'traceroute — внешняя утилита (по умолчанию: {DEFAULT_ENGINE})'
+    )
+    parser.add_argument(
+        '--method',
+        choices=['auto', 'udp', 'icmp'],
+        default='auto',
+        help='Пробы для --engine probe: udp (без root), icmp (raw-сокет) или auto (по умолчанию)'
+    )
+    parser.add_argument(
+        '--max-hops',
+        type=int,
+        default=MAX_HOPS,
+        help=f'Наибольший TTL (по умолчанию: {MAX_HOPS})'
+    )
+    parser.add_argument(
+        '--probe-timeout',
+        type=float,
+        default=PROBE_TIMEOUT,
+        help=f'Секунд ожидания ответов на пробы (по умолчанию: {PROBE_TIMEOUT})'
+    )
+    parser.add_argument(
+        '--no-stream',
+        action='store_true',
+        help='Сначала вывести всю трассировку, затем таблицу (по умолчанию строки таблицы '
+             'выводятся по мере ответов узлов и RIPEstat)'
+    )
     args = parser.parse_args()
+    if not args.target and not args.targets_file:
+        parser.error('нужна цель или --targets-file')
+
+    asn_index = AsnIndex(args.asn_db).open() if args.asn_db else None
+    tracer = Tracer(args.ripe_url, args.asn_workers, engine=args.engine, asn_index=asn_index)
+    tracer.probe_method = args.method
+    tracer.max_hops = args.max_hops
+    tracer.probe_timeout = args.probe_timeout
+
+    if args.targets_file:
+        stats = BatchTracer(tracer, args.parallel).run(read_targets(args.targets_file), args.output)
+        print(f"Готово: трассировок {stats['traced']}, ошибок {stats['failed']}, "
+              f"пропущено {stats['skipped']}; результаты в {args.output}")
+        return
 
-    tracer = Tracer()
     resolved_target = resolve_target(args.target)
 
     if not resolved_target:
@@ -52,6 +134,16 @@ def main():
         return
 
     print(f"\nНачало трассировки к {args.target} ({resolved_target})...")
+    if not args.no_stream:
+        print_table_header()
+        rows = 0
+        for res in tracer.trace_stream(resolved_target):
+            print_table_row(res)
+            rows += 1
+        if not rows:
+            print("\nНе удалось определить IP-адреса маршрутизаторов")
+        return
+
     trace_output = tracer.trace_route(resolved_target)
 
     if not trace_output:
@@ -67,9 +159,10 @@ def main():
         print("\nНе удалось определить IP-адреса маршрутизаторов")
         return
 
+    infos = tracer.get_asn_info_many(hops)
     results = []
     for i, ip in enumerate(hops, 1):
-        asn, country, provider = tracer.get_asn_info(ip)
+        asn, country, provider = infos[ip]
         results.append({
             'hop': i,
             'ip': ip,
@@ -1,20 +1,59 @@
 import logging
 import os
 import re
+import socket
 import subprocess
-from ipaddress import ip_address, IPv4Address
-from typing import Tuple, Optional, List
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from ipaddress import ip_address, ip_network, IPv4Address
+from typing import Dict, Iterable, Iterator, Tuple, Optional, List
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from asn_index import AsnIndex, AsnInfo
+from probe import MAX_HOPS, PROBE_TIMEOUT, Hop, PathProber
+
+RIPE_URL = 'https://stat.ripe.net'
+ASN_LOOKUP_WORKERS = 8  # одновременных запросов к RIPE
+# Префиксы длиннее /24 в BGP не анонсируются, поэтому у адресов одной /24 общая AS:
+# такие адреса запрашиваются один раз
+ASN_PREFIX_LENGTH = 24
+
+TRACE_IP_PATTERN = r'\b(?:\d{1,3}\.){3}\d{1,3}\b'
+
+# probe — встроенная трассировка с параллельными TTL (только Linux), traceroute — внешняя утилита
+DEFAULT_ENGINE = 'probe' if sys.platform.startswith('linux') else 'traceroute'
 
 
 class Tracer:
-    def __init__(self):
+    def __init__(self, ripe_url: str = RIPE_URL, max_workers: int = ASN_LOOKUP_WORKERS, timeout: float = 10,
+                 engine: str = DEFAULT_ENGINE, asn_index: Optional[AsnIndex] = None):
         logging.basicConfig(
             level=logging.INFO,
             format='%(asctime)s - %(levelname)s - %(message)s'
         )
         self.logger = logging.getLogger('AS_Tracer')
+        self.ripe_url = ripe_url.rstrip('/')  # можно подставить локальную заглушку вместо RIPE
+        self.max_workers = max_workers
+        self.timeout = timeout
+        # Общая сессия держит keep-alive соединения: без неё каждый запрос заново
+        # открывает TCP и TLS. Пул рассчитан на max_workers одновременных запросов
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # Локальный индекс префикс -> AS: RIPE запрашивается только для адресов вне индекса,
+        # и его ответы дописываются в индекс
+        self.asn_index = asn_index
+        # Кэш AS по префиксам, общий для всех трассировок этого Tracer (см. cached_asn_info)
+        self._asn_cache: Dict[str, Future] = {}
+        self._asn_cache_lock = threading.Lock()
+        self.engine = engine
+        self.probe_method = 'auto'   # udp, icmp или auto (см. PathProber)
+        self.max_hops = MAX_HOPS
+        self.probe_timeout = PROBE_TIMEOUT
 
     @staticmethod
     def is_public_ip(ip: str) -> bool:
@@ -26,17 +65,46 @@ class Tracer:
         except ValueError:
             return False
 
-    def get_asn_info(self, ip: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    @classmethod
+    def resolve_target(cls, target: str) -> Optional[str]:
+        """Преобразует домен в IP, если нужно"""
+        try:
+            if not cls.is_public_ip(target):
+                return socket.gethostbyname(target)
+            return target
+        except (socket.gaierror, ValueError):
+            return None
+
+    @staticmethod
+    def asn_prefix(ip: str) -> str:
+        """Префикс, общий для адресов с одной и той же AS"""
+        return str(ip_network(f"{ip}/{ASN_PREFIX_LENGTH}", strict=False))
+
+    def get_asn_info(self, ip: str) -> AsnInfo:
         if not self.is_public_ip(ip):
             return None, None, None
+        if self.asn_index is not None:
+            info = self.asn_index.lookup(ip)
+            if info is not None:
+                return info
+        info, network = self.query_ripe(ip)
+        if network is not None and self.asn_index is not None and any(info):
+            self.asn_index.add(*network, info)
+        return info
+
+    def query_ripe(self, ip: str) -> Tuple[AsnInfo, Optional[Tuple[int, int]]]:
+        """Ответ RIPE whois и диапазон адресов, к которому он относится: route с найденной AS,
+        иначе inetnum, иначе префикс ASN_PREFIX_LENGTH вокруг адреса"""
         try:
-            response = requests.get(
-                f"https://stat.ripe.net/data/whois/data.json?resource={ip}",
-                timeout=10
+            response = self.session.get(
+                f"{self.ripe_url}/data/whois/data.json",
+                params={'resource': ip},
+                timeout=self.timeout
             )
             response.raise_for_status()
             data = response.json()
             asn = country = provider = None
+            route = inetnum = None
 
             for record_group in data.get('data', {}).get('records', []):
                 for record in record_group:
@@ -49,46 +117,99 @@ class Tracer:
                         country = value
                     elif key == 'netname' and not provider:
                         provider = value
+                    elif key == 'route' and not route:
+                        route = value
+                    elif key == 'inetnum' and not inetnum:
+                        inetnum = value
 
-            return asn, country, provider
+            return (asn, country, provider), self.covering_range(ip, route, inetnum)
         except (requests.RequestException, ValueError) as e:
             self.logger.error(f"Ошибка запроса WHOIS для {ip}: {str(e)}")
+            return (None, None, None), None
+
+    @classmethod
+    def covering_range(cls, ip: str, route: Optional[str], inetnum: Optional[str]) -> Tuple[int, int]:
+        """Первый и последний адрес (числами) route или inetnum, если они содержат ip"""
+        candidates = []
+        try:
+            if route:
+                network = ip_network(route.strip(), strict=False)
+                candidates.append((int(network.network_address), int(network.broadcast_address)))
+        except ValueError:
+            pass
+        try:
+            if inetnum:
+                first, last = inetnum.split('-', 1)
+                candidates.append((int(ip_address(first.strip())), int(ip_address(last.strip()))))
+        except ValueError:
+            pass
+        address = int(ip_address(ip))
+        for first, last in candidates:
+            if first <= address <= last:
+                return first, last
+        network = ip_network(cls.asn_prefix(ip))
+        return int(network.network_address), int(network.broadcast_address)
+
+    def cached_asn_info(self, ip: str) -> AsnInfo:
+        """get_asn_info через кэш по префиксам ASN_PREFIX_LENGTH, общий для всех вызовов:
+        одновременные запросы одного префикса ждут первый. Пустые ответы (в том
+        числе ошибки RIPE) не кэшируются, чтобы их можно было повторить"""
+        if not self.is_public_ip(ip):
             return None, None, None
+        prefix = self.asn_prefix(ip)
+        with self._asn_cache_lock:
+            future = self._asn_cache.get(prefix)
+            owner = future is None
+            if owner:
+                future = self._asn_cache[prefix] = Future()
+        if owner:
+            try:
+                info = self.get_asn_info(ip)
+            except BaseException as e:
+                self._forget_asn(prefix)
+                future.set_exception(e)
+                raise
+            if not any(info):
+                self._forget_asn(prefix)
+            future.set_result(info)
+        return future.result()
+
+    def _forget_asn(self, prefix: str):
+        with self._asn_cache_lock:
+            self._asn_cache.pop(prefix, None)
+
+    def get_asn_info_many(self, ips: Iterable[str]) -> Dict[str, AsnInfo]:
+        """AS, страна и провайдер для нескольких адресов: до max_workers запросов
+        одновременно, по одному запросу на префикс ASN_PREFIX_LENGTH; адреса,
+        найденные в asn_index, к RIPE не запрашиваются"""
+        ips = list(ips)
+        lookups: Dict[str, str] = {}  # префикс -> адрес, по которому он запрашивается
+        for ip in ips:
+            if self.is_public_ip(ip):
+                lookups.setdefault(self.asn_prefix(ip), ip)
+
+        infos: Dict[str, AsnInfo] = {}
+        if self.asn_index is not None:
+            for prefix, ip in lookups.items():
+                info = self.asn_index.lookup(ip)
+                if info is not None:
+                    infos[prefix] = info
+            lookups = {prefix: ip for prefix, ip in lookups.items() if prefix not in infos}
+
+        if lookups:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                infos.update(zip(lookups, executor.map(self.cached_asn_info, lookups.values())))
+
+        return {
+            ip: infos[self.asn_prefix(ip)] if self.is_public_ip(ip) else (None, None, None)
+            for ip in ips
+        }
 
     def trace_route(self, target: str) -> Optional[List[str]]:
+        if self.engine == 'probe':
+            return self.probe_route(target)
         try:
-            if os.name == 'nt':
-                cmd = ['tracert', '-d', target]
-                process = subprocess.Popen(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    universal_newlines=True,
-                    encoding='utf-8',
-                    errors='ignore'
-                )
-            else:
-                cmd = ['traceroute', '-n', target]
-                env = os.environ.copy()
-                env['LANG'] = 'C.UTF-8'
-                process = subprocess.Popen(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    universal_newlines=True,
-                    env=env
-                )
-
-            output = []
-            while True:
-                line = process.stdout.readline()
-                if not line:
-                    break
-                clean_line = line.strip()
-                output.append(clean_line)
-                if '***' in clean_line:
-                    break
-
+            output = list(self.traceroute_lines(target))
             return output if output else None
 
         except subprocess.SubprocessError as e:
@@ -96,20 +217,157 @@ class Tracer:
             return None
 
     @staticmethod
-    def parse_trace_output(output: List[str]) -> List[str]:
-        ip_pattern = r'\b(?:\d{1,3}\.){3}\d{1,3}\b'
+    def traceroute_lines(target: str) -> Iterator[str]:
+        """Строки вывода traceroute (tracert на Windows) по мере появления, до строки с ***"""
+        if os.name == 'nt':
+            cmd = ['tracert', '-d', target]
+            process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+                encoding='utf-8',
+                errors='ignore'
+            )
+        else:
+            cmd = ['traceroute', '-n', target]
+            env = os.environ.copy()
+            env['LANG'] = 'C.UTF-8'
+            process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+                env=env
+            )
+
+        while True:
+            line = process.stdout.readline()
+            if not line:
+                break
+            clean_line = line.strip()
+            yield clean_line
+            if '***' in clean_line:
+                break
+
+    def probe_route(self, target: str) -> Optional[List[str]]:
+        """Трассировка встроенным PathProber; строки в формате вывода traceroute -n"""
+        try:
+            hops = PathProber(target, self.max_hops, self.probe_timeout, self.probe_method).probe()
+        except OSError as e:
+            self.logger.error(f"Ошибка трассировки: {str(e)}")
+            return None
+        return [self.format_hop(hop) for hop in hops] or None
+
+    @staticmethod
+    def format_hop(hop: Hop) -> str:
+        if hop.ip is None:
+            return f"{hop.ttl:>2}  *"
+        return f"{hop.ttl:>2}  {hop.ip}  {hop.rtt * 1000:.3f} ms"
+
+    def discover_hops(self, target: str) -> Iterator[Tuple[int, str, bool]]:
+        """(TTL, адрес, ответил ли адресат) в порядке прихода ответов узлов. У внешнего
+        traceroute вместо TTL — номер строки с адресом, а адресат не отмечается"""
+        if self.engine == 'probe':
+            try:
+                for hop in PathProber(target, self.max_hops, self.probe_timeout, self.probe_method).replies():
+                    yield hop.ttl, hop.ip, hop.reached
+            except OSError as e:
+                self.logger.error(f"Ошибка трассировки: {str(e)}")
+            return
+        try:
+            number = 0
+            for line in self.traceroute_lines(target):
+                if '***' in line:
+                    break
+                hop_ip = self.parse_trace_line(line)
+                if hop_ip:
+                    number += 1
+                    yield number, hop_ip, False
+        except subprocess.SubprocessError as e:
+            self.logger.error(f"Ошибка трассировки: {str(e)}")
+
+    def trace_stream(self, target: str) -> Iterator[Dict]:
+        """Строки таблицы результатов (hop, ip, asn, country, provider) по мере готовности.
+
+        Узлы обнаруживаются в отдельном потоке, и AS каждого запрашивается сразу
+        по приходу его ответа, параллельно с ожиданием следующих. Строки выдаются
+        в порядке TTL: строка узла готова, когда известны он, все узлы перед ним
+        и его AS. Молчащий узел задерживает следующие строки до конца трассировки,
+        повторные адреса пропускаются, как в parse_trace_output.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        ready = threading.Condition()
+        arrived: Dict[int, Tuple[str, Optional[Future]]] = {}
+        lookups: Dict[str, Future] = {}  # префикс -> запрос AS, общий для адресов одной /24
+        last = None   # TTL адресата
+        finished = stopped = False
+
+        def discover():
+            nonlocal last, finished
+            try:
+                for ttl, ip, reached in self.discover_hops(target):
+                    with ready:
+                        if stopped:
+                            return
+                        future = None
+                        if self.is_public_ip(ip):
+                            prefix = self.asn_prefix(ip)
+                            if prefix not in lookups:
+                                lookups[prefix] = executor.submit(self.cached_asn_info, ip)
+                            future = lookups[prefix]
+                        arrived[ttl] = (ip, future)
+                        if reached and (last is None or ttl < last):
+                            last = ttl
+                        ready.notify()
+            finally:
+                with ready:
+                    finished = True
+                    ready.notify()
+
+        threading.Thread(target=discover, daemon=True).start()
+        try:
+            seen = set()
+            ttl = 0
+            while True:
+                ttl += 1
+                with ready:
+                    ready.wait_for(lambda: ttl in arrived or finished or (last is not None and ttl > last))
+                    if last is not None and ttl > last:
+                        break
+                    if ttl not in arrived:
+                        if any(later > ttl for later in arrived):
+                            continue  # узел не ответил
+                        break
+                    ip, future = arrived.pop(ttl)
+                info = future.result() if future is not None else (None, None, None)
+                if ip in seen:
+                    continue
+                seen.add(ip)
+                asn, country, provider = info
+                yield {'hop': len(seen), 'ip': ip, 'asn': asn, 'country': country, 'provider': provider}
+        finally:
+            with ready:
+                stopped = True
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @classmethod
+    def parse_trace_output(cls, output: List[str]) -> List[str]:
         hops = []
 
         for line in output:
             if '***' in line:
                 break
 
-            ips = re.findall(ip_pattern, line)
-            if not ips:
-                continue
-
-            hop_ip = ips[-1] if len(ips) > 1 else ips[0]
-            if hop_ip not in hops:  # Исключаем дубликаты
+            hop_ip = cls.parse_trace_line(line)
+            if hop_ip and hop_ip not in hops:  # Исключаем дубликаты
                 hops.append(hop_ip)
 
         return hops
+
+    @staticmethod
+    def parse_trace_line(line: str) -> Optional[str]:
+        ips = re.findall(TRACE_IP_PATTERN, line)
+        if not ips:
+            return None
+        return ips[-1] if len(ips) > 1 else ips[0]
@@ -0,0 +1,421 @@
+import argparse
+import gzip
+import heapq
+import logging
+import mmap
+import os
+import socket
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from ipaddress import ip_network
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+INDEX_MAGIC = b'ASNIDX01'
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'asn.idx')
+JOURNAL_COMPACT_AFTER = 10_000  # записей журнала, после которых он вливается в индекс при открытии
+
+# Заголовок: магия, число интервалов, число записей (AS, страна, провайдер)
+_HEADER = struct.Struct('<8sII')
+# Запись: номер AS (0 — неизвестен), смещение и длина названия в таблице строк, код страны
+_INFO = struct.Struct('<IIH2s')
+
+logger = logging.getLogger('AS_Tracer')
+
+AsnInfo = Tuple[Optional[str], Optional[str], Optional[str]]
+# (первый адрес, последний адрес, ширина исходного префикса, (AS, страна, провайдер))
+Entry = Tuple[int, int, int, Tuple[int, str, str]]
+
+
+def ip_to_int(ip: str) -> int:
+    return int.from_bytes(socket.inet_aton(ip), 'big')
+
+
+def int_to_ip(value: int) -> str:
+    return socket.inet_ntoa(value.to_bytes(4, 'big'))
+
+
+class AsnIndex:
+    """Локальный индекс префикс IPv4 -> (AS, страна, провайдер) на диске.
+
+    Файл индекса — отсортированные непересекающиеся интервалы адресов: массивы
+    начал, концов, ширин исходных префиксов и номеров записей, за ними таблица
+    записей и строк. Файл отображается в память (mmap) и не разбирается при
+    открытии, поиск — двоичный по массиву начал, то есть единицы микросекунд.
+    Вложенные префиксы раскладываются на интервалы при сборке так, что каждому
+    адресу достаётся самый узкий покрывающий его префикс (longest prefix match).
+
+    Индекс заполняется импортом ip2asn или дампа RIB (import_file), ответы
+    RIPE дописываются в журнал рядом с индексом (add) и при открытии, когда
+    журнал разрастётся, вливаются в индекс: файл пересобирается во временный
+    и атомарно подменяется через os.replace.
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH, compact_after: int = JOURNAL_COMPACT_AFTER):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.compact_after = compact_after
+        # (mmap, начала, концы, ширины, номера записей, таблица записей) — заменяется целиком
+        self._main = (None, (), (), (), (), None)
+        self._journal: List[Entry] = []
+        self._overlay: Optional[Tuple[list, list, list, list]] = None  # интервалы журнала, собираются лениво
+        self._lock = threading.Lock()
+
+    def open(self) -> 'AsnIndex':
+        self._open_main()
+        self._journal = list(_read_entries(self.journal_path, skip_unrouted=False))
+        self._overlay = None
+        if len(self._journal) >= self.compact_after:
+            self.compact()
+        return self
+
+    def _open_main(self):
+        try:
+            with open(self.path, 'rb') as f:
+                index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError, OSError):
+            return  # ValueError — пустой файл
+        if len(index) < _HEADER.size or index[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            logger.error(f"Неизвестный формат индекса AS {self.path}, начнем с пустого")
+            index.close()
+            return
+        _, count, infos = _HEADER.unpack_from(index, 0)
+        view = memoryview(index)
+        offset = _HEADER.size
+        arrays = []
+        for _ in range(4):
+            arrays.append(_uint32s(view[offset:offset + count * 4]))
+            offset += count * 4
+        self._main = (index, *arrays, (view, offset, offset + infos * _INFO.size))
+
+    def __len__(self):
+        return len(self._main[1]) + len(self._journal)
+
+    def lookup(self, ip: str) -> Optional[AsnInfo]:
+        """AS, страна и провайдер самого узкого префикса с адресом ip или None, если адрес не покрыт"""
+        value = ip_to_int(ip)
+        found = None
+        with self._lock:  # под замком _rebuild закрывает старое отображение
+            _, starts, ends, widths, info_ids, table = self._main
+            i = bisect_right(starts, value) - 1
+            if i >= 0 and value <= ends[i]:
+                found = widths[i], _read_info(table, info_ids[i])
+        overlay = self._overlay
+        if overlay is None and self._journal:
+            overlay = self._build_overlay()
+        if overlay is not None:
+            starts, ends, widths, infos = overlay
+            i = bisect_right(starts, value) - 1
+            # Из журнала — если префикс не шире найденного в индексе: при равных ответ RIPE свежее
+            if i >= 0 and value <= ends[i] and (found is None or widths[i] <= found[0]):
+                found = widths[i], infos[i]
+        if found is None:
+            return None
+        asn, country, provider = found[1]
+        return f"AS{asn}" if asn else None, country or None, provider or None
+
+    def _build_overlay(self):
+        with self._lock:
+            if self._overlay is None:
+                starts, ends, widths, infos = [], [], [], []
+                for start, end, width, info in _flatten(self._journal):
+                    starts.append(start)
+                    ends.append(end)
+                    widths.append(width)
+                    infos.append(info)
+                self._overlay = starts, ends, widths, infos
+            return self._overlay
+
+    def add(self, start: int, end: int, info: AsnInfo):
+        """Дописывает ответ RIPE для адресов start..end в журнал"""
+        asn, country, provider = info
+        entry = (start, end, end - start, (_asn_number(asn), country or '', _clean(provider or '')))
+        line = _format_entry(entry)
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.journal_path)), exist_ok=True)
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+            self._journal.append(entry)
+            if self._overlay is not None:
+                # Полная пересборка сортирует весь журнал; новый интервал затрагивает лишь соседей
+                self._overlay = _overlay_insert(self._overlay, entry)
+
+    def import_file(self, path: str) -> int:
+        """Импорт ip2asn (TSV: начало, конец, AS, страна, описание) или RIB (префикс и AS
+        через пробел либо вывод bgpdump -m); файл может быть сжат gzip. Данные файла
+        накладываются на индекс: при одинаковых префиксах побеждает файл, более узкие
+        ответы RIPE из индекса и журнала сохраняются.
+        Возвращает число интервалов индекса; ValueError, если в файле нет записей"""
+        with _open_text(path) as f:
+            lines = iter(f)
+            first = next((line for line in lines if line.strip() and line[0] not in '#;'), '')
+            if not first:
+                raise ValueError(f"В файле {path} нет записей")
+            parse = parse_rib if '|' in first or '/' in first.split()[0] else parse_ip2asn
+            imported = parse(_chain(first, lines))
+            # Индекс и журнал первыми: при одинаковых интервалах побеждает свежий дамп
+            return self._rebuild(_chain_entries(self._main_entries(), self._journal, imported))
+
+    def compact(self) -> int:
+        """Вливает журнал в индекс; возвращает число интервалов"""
+        return self._rebuild(_chain_entries(self._main_entries(), self._journal))
+
+    def _main_entries(self) -> Iterator[Entry]:
+        _, starts, ends, widths, info_ids, table = self._main
+        for i in range(len(starts)):
+            yield starts[i], ends[i], widths[i], _read_info(table, info_ids[i])
+
+    def _rebuild(self, entries: Iterable[Entry]) -> int:
+        segments = _flatten(entries)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            _write_index(f, segments)
+            f.flush()
+            os.fsync(f.fileno())
+        with self._lock:
+            # Отображённый файл нельзя подменить в Windows: сначала закрываем отображение
+            _close_main(self._main)
+            self._main = (None, (), (), (), (), None)
+            os.replace(tmp_path, self.path)
+            try:
+                os.unlink(self.journal_path)
+            except FileNotFoundError:
+                pass
+            self._journal = []
+            self._overlay = None
+            self._open_main()
+        return len(segments)
+
+
+def parse_ip2asn(lines: Iterable[str], skip_unrouted: bool = True) -> Iterator[Entry]:
+    """Строки ip2asn-v4.tsv (адреса точками или числами); IPv6 и ошибочные строки пропускаются,
+    интервалы с AS 0 (не анонсируются) — если skip_unrouted"""
+    for line in lines:
+        fields = line.rstrip('\r\n').split('\t')
+        if len(fields) < 3 or line[0] in '#;':
+            continue
+        try:
+            start, end = (int(field) if field.isdigit() else ip_to_int(field) for field in fields[:2])
+            asn = int(fields[2].upper().lstrip('AS') or 0)
+        except (OSError, ValueError):
+            continue
+        if (skip_unrouted and not asn) or start > end:
+            continue
+        country = fields[3] if len(fields) > 3 and fields[3] not in ('None', 'Unknown') else ''
+        provider = fields[4] if len(fields) > 4 and fields[4] != 'Not routed' else ''
+        yield start, end, end - start, (asn, country[:2], provider)
+
+
+def parse_rib(lines: Iterable[str]) -> Iterator[Entry]:
+    """Префиксы и исходные AS из дампа RIB: строки «префикс AS» (как у pyasn) или вывод
+    bgpdump -m (префикс и AS_PATH, исходная AS — последняя в пути)"""
+    for line in lines:
+        if '|' in line:
+            fields = line.split('|')
+            if len(fields) < 7:
+                continue
+            prefix, path = fields[5], fields[6].split()
+            origin = path[-1].strip('{}').split(',')[0] if path else ''
+        else:
+            fields = line.split()
+            if len(fields) < 2 or line[0] in '#;':
+                continue
+            prefix, origin = fields[:2]
+        try:
+            network = ip_network(prefix, strict=False)
+            asn = int(origin.upper().lstrip('AS'))
+        except ValueError:
+            continue
+        if network.version != 4:
+            continue
+        start = int(network.network_address)
+        end = int(network.broadcast_address)
+        yield start, end, end - start, (asn, '', '')
+
+
+def _flatten(entries: Iterable[Entry]) -> List[Entry]:
+    """Раскладывает пересекающиеся интервалы на непересекающиеся: каждому адресу —
+    самый узкий покрывающий интервал, при равной ширине — идущий позже во входе"""
+    latest: Dict[Tuple[int, int], Tuple[int, int, tuple]] = {}
+    for seq, (start, end, width, info) in enumerate(entries):
+        latest[start, end] = (seq, width, info)
+    items = sorted((start, end, seq, width, info) for (start, end), (seq, width, info) in latest.items())
+    del latest
+
+    segments: List[Entry] = []
+    heap = []  # действующие интервалы: самый узкий и самый поздний сверху
+    i, n = 0, len(items)
+    point = 0
+    while i < n or heap:
+        if not heap:
+            point = items[i][0]
+        while i < n and items[i][0] == point:
+            start, end, seq, width, info = items[i]
+            heapq.heappush(heap, (width, -seq, end, info))
+            i += 1
+        while heap and heap[0][2] < point:
+            heapq.heappop(heap)  # закончившиеся, пока были перекрыты более узкими
+        if not heap:
+            continue
+        width, _, end, info = heap[0]
+        # Владелец меняется, когда заканчивается он сам или начинается следующий интервал
+        stop = min(end, items[i][0] - 1) if i < n else end
+        if segments and segments[-1][1] == point - 1 and segments[-1][2:] == (width, info):
+            segments[-1] = (segments[-1][0], stop, width, info)
+        else:
+            segments.append((point, stop, width, info))
+        point = stop + 1
+    return segments
+
+
+def _overlay_insert(overlay: Tuple[list, list, list, list], entry: Entry) -> Tuple[list, list, list, list]:
+    """Добавляет интервал в разложенные интервалы журнала по тем же правилам, что и _flatten:
+    пересобираются только пересекающиеся с ним отрезки. Возвращает новые списки, чтобы
+    читатели без замка не видели их наполовину изменёнными"""
+    starts, ends, widths, infos = overlay
+    start, end, width, info = entry
+    lo = bisect_left(ends, start)
+    hi = bisect_right(starts, end)
+    pieces: List[Entry] = []
+    point = start
+    for i in range(lo, hi):
+        first, last, old_width, old_info = starts[i], ends[i], widths[i], infos[i]
+        if first < start:
+            pieces.append((first, start - 1, old_width, old_info))
+        if first > point:
+            pieces.append((point, first - 1, width, info))
+        inner_first, inner_last = max(first, start), min(last, end)
+        # При равной ширине побеждает более поздний интервал
+        if old_width < width:
+            pieces.append((inner_first, inner_last, old_width, old_info))
+        else:
+            pieces.append((inner_first, inner_last, width, info))
+        if last > end:
+            pieces.append((end + 1, last, old_width, old_info))
+        point = inner_last + 1
+    if point <= end:
+        pieces.append((point, end, width, info))
+    return tuple(column[:lo] + [piece[k] for piece in pieces] + column[hi:]
+                 for k, column in enumerate(overlay))
+
+
+def _close_main(main):
+    index, *arrays, table = main
+    if index is None:
+        return
+    for values in (*arrays, table[0]):
+        if isinstance(values, memoryview):
+            values.release()  # mmap не закрывается, пока на него есть memoryview
+    index.close()
+
+
+def _write_index(f, segments: Sequence[Entry]):
+    infos: Dict[tuple, int] = {}
+    info_ids = array('I', (infos.setdefault(info, len(infos)) for _, _, _, info in segments))
+    names = bytearray()
+    table = bytearray()
+    for asn, country, provider in infos:
+        name = provider.encode('utf-8')[:0xFFFF]
+        table += _INFO.pack(asn, len(names), len(name), country.encode('ascii', 'replace')[:2].ljust(2))
+        names += name
+    f.write(_HEADER.pack(INDEX_MAGIC, len(segments), len(infos)))
+    for column in range(3):
+        _write_uint32s(f, array('I', (segment[column] for segment in segments)))
+    _write_uint32s(f, info_ids)
+    f.write(table)
+    f.write(names)
+
+
+def _write_uint32s(f, values: array):
+    if sys.byteorder != 'little':
+        values.byteswap()
+    values.tofile(f)
+
+
+def _uint32s(view: memoryview):
+    """Массив uint32 из файла без копирования (на big-endian — с копированием)"""
+    if sys.byteorder == 'little':
+        return view.cast('I')
+    values = array('I', bytes(view))
+    values.byteswap()
+    return values
+
+
+def _read_info(table, index: int) -> Tuple[int, str, str]:
+    view, offset, names = table
+    asn, name_offset, name_length, country = _INFO.unpack_from(view, offset + index * _INFO.size)
+    name = bytes(view[names + name_offset:names + name_offset + name_length]).decode('utf-8', 'replace')
+    return asn, country.decode('ascii', 'replace').strip(), name
+
+
+def _read_entries(path: str, skip_unrouted: bool = True) -> Iterator[Entry]:
+    try:
+        with _open_text(path) as f:
+            yield from parse_ip2asn(f, skip_unrouted)
+    except FileNotFoundError:
+        return
+
+
+def _open_text(path: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, encoding='utf-8', errors='replace')
+
+
+def _format_entry(entry: Entry) -> str:
+    start, end, _, (asn, country, provider) = entry
+    return f"{int_to_ip(start)}\t{int_to_ip(end)}\t{asn}\t{country or 'None'}\t{provider}\n"
+
+
+def _asn_number(asn: Optional[str]) -> int:
+    try:
+        return int((asn or '0').upper().lstrip('AS'))
+    except ValueError:
+        return 0
+
+
+def _clean(text: str) -> str:
+    return ' '.join(text.split())
+
+
+def _chain(first: str, lines: Iterator[str]) -> Iterator[str]:
+    yield first
+    yield from lines
+
+
+def _chain_entries(*sources: Iterable[Entry]) -> Iterator[Entry]:
+    for source in sources:
+        yield from source
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальный индекс префикс -> AS для трассировки')
+    parser.add_argument('--db', default=DEFAULT_INDEX_PATH, help=f'Файл индекса (по умолчанию: {DEFAULT_INDEX_PATH})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_command = commands.add_parser('import', help='Импорт ip2asn-v4.tsv[.gz] или дампа RIB')
+    import_command.add_argument('file')
+    lookup_command = commands.add_parser('lookup', help='Поиск адресов в индексе')
+    lookup_command.add_argument('ips', nargs='+')
+    commands.add_parser('compact', help='Влить журнал ответов RIPE в индекс')
+    args = parser.parse_args()
+
+    index = AsnIndex(args.db).open()
+    if args.command == 'import':
+        try:
+            print(f"Интервалов в индексе: {index.import_file(args.file)}")
+        except ValueError as e:
+            parser.error(str(e))
+    elif args.command == 'compact':
+        print(f"Интервалов в индексе: {index.compact()}")
+    else:
+        for ip in args.ips:
+            info = index.lookup(ip)
+            print(ip, *(info if info is not None else ['нет в индексе']))
+
+
+if __name__ == '__main__':
+    main()
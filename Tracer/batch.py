@@ -0,0 +1,132 @@
+import json
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, Set, Tuple
+
+from Tracer import Tracer
+
+BATCH_PARALLEL = 16  # одновременных трассировок
+DEDUP_WINDOW = 4096  # последних целей, среди которых пропускаются повторы
+
+
+def read_targets(path: str) -> Iterator[str]:
+    """Цели из файла: по одной в строке, # — комментарий"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            target = line.split('#', 1)[0].strip()
+            if target:
+                yield target
+
+
+def resume_point(path: str) -> Tuple[int, Set[int]]:
+    """Сколько первых целей уже записано в path и номера записанных целей после них.
+
+    Результаты пишутся в порядке завершения, но в работе не больше 2 * parallel
+    целей, поэтому множество номеров впереди ограничено этим окном, а не длиной
+    списка. Недописанная последняя строка (запуск прервали на середине записи)
+    обрезается, чтобы дописывать с новой строки"""
+    next_index, ahead = 0, set()
+    try:
+        f = open(path, 'r+b')
+    except FileNotFoundError:
+        return next_index, ahead
+    with f:
+        complete = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            complete += len(line)
+            try:
+                index = json.loads(line).get('index')
+            except ValueError:
+                continue
+            if not isinstance(index, int) or index < next_index:
+                continue
+            ahead.add(index)
+            while next_index in ahead:
+                ahead.remove(next_index)
+                next_index += 1
+        f.truncate(complete)
+    return next_index, ahead
+
+
+def unique_targets(targets: Iterable[str], stats: Dict[str, int], window: int = DEDUP_WINDOW) -> Iterator[str]:
+    """Цели без повторов среди последних window; пропущенные учитываются в stats['skipped']"""
+    recent: Dict[str, None] = {}  # dict помнит порядок вставки: первый ключ — самый старый
+    for target in targets:
+        if target in recent:
+            stats['skipped'] += 1
+            continue
+        recent[target] = None
+        if len(recent) > window:
+            del recent[next(iter(recent))]
+        yield target
+
+
+class BatchTracer:
+    """Трассировка списка целей с результатами в JSONL.
+
+    Цели читаются потоком, разрешаются и трассируются в пуле до parallel
+    одновременно; в работе держится не больше 2 * parallel целей, так что
+    память не растёт с длиной списка. AS узлов запрашиваются через кэш
+    Tracer.cached_asn_info, общий для всех трассировок: пути к разным целям
+    в основном совпадают, и каждый префикс запрашивается один раз.
+
+    На каждую цель в файл дописывается строка JSON в порядке завершения:
+    {"index", "target", "ip", "hops": [{"hop", "ip", "asn", "country", "provider"}]}
+    или {"index", "target", "error"}, где index — номер цели во входном списке
+    (без повторов). При повторном запуске с тем же списком и файлом трассировка
+    продолжается с первой незаписанной цели; прогрессом служат сами номера в
+    файле, так что память не зависит от числа уже готовых целей. Цели с ошибкой
+    тоже считаются записанными: их можно отобрать из файла по полю error.
+    """
+
+    def __init__(self, tracer: Tracer, parallel: int = BATCH_PARALLEL):
+        self.tracer = tracer
+        self.parallel = parallel
+
+    def trace(self, target: str, asn_pool: ThreadPoolExecutor) -> Dict:
+        ip = self.tracer.resolve_target(target)
+        if not ip:
+            return {'target': target, 'error': 'неверный домен или IP-адрес'}
+        output = self.tracer.trace_route(ip)
+        if not output:
+            return {'target': target, 'ip': ip, 'error': 'ошибка при выполнении трассировки'}
+        hops = self.tracer.parse_trace_output(output)
+        infos = asn_pool.map(self.tracer.cached_asn_info, hops)
+        return {'target': target, 'ip': ip, 'hops': [
+            {'hop': i, 'ip': hop_ip, 'asn': asn, 'country': country, 'provider': provider}
+            for i, (hop_ip, (asn, country, provider)) in enumerate(zip(hops, infos), 1)
+        ]}
+
+    def run(self, targets: Iterable[str], output_path: str) -> Dict[str, int]:
+        """Трассирует цели, дописывая результаты в output_path; возвращает число
+        записанных трассировок, ошибок и пропущенных (уже готовых или повторных) целей"""
+        next_index, ahead = resume_point(output_path)
+        stats = {'traced': 0, 'failed': 0, 'skipped': 0}
+        pending: Dict[Future, Tuple[int, str]] = {}
+        with ThreadPoolExecutor(max_workers=self.parallel) as traces, \
+                ThreadPoolExecutor(max_workers=self.tracer.max_workers) as asn_pool, \
+                open(output_path, 'a', encoding='utf-8') as out:
+            for index, target in enumerate(unique_targets(targets, stats)):
+                if index < next_index or index in ahead:
+                    stats['skipped'] += 1
+                    continue
+                if len(pending) >= 2 * self.parallel:
+                    self._write_finished(pending, out, stats)
+                pending[traces.submit(self.trace, target, asn_pool)] = index, target
+            while pending:
+                self._write_finished(pending, out, stats)
+        return stats
+
+    def _write_finished(self, pending: Dict[Future, Tuple[int, str]], out, stats: Dict[str, int]):
+        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in finished:
+            index, target = pending.pop(future)
+            try:
+                record = future.result()
+            except Exception as e:
+                self.tracer.logger.error(f"Ошибка трассировки {target}: {str(e)}")
+                record = {'target': target, 'error': str(e)}
+            out.write(json.dumps({'index': index, **record}, ensure_ascii=False) + '\n')
+            out.flush()
+            stats['failed' if 'error' in record else 'traced'] += 1
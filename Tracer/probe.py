@@ -0,0 +1,228 @@
+import itertools
+import os
+import select
+import socket
+import struct
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+IP_RECVERR = getattr(socket, 'IP_RECVERR', 11)  # Linux; в модуле socket есть не во всех версиях
+SO_EE_ORIGIN_ICMP = 2
+ICMP_ECHO_REPLY = 0
+ICMP_DEST_UNREACH = 3
+ICMP_PORT_UNREACH = 3
+ICMP_ECHO_REQUEST = 8
+ICMP_TIME_EXCEEDED = 11
+
+TRACE_PORT = 33434      # как у traceroute: проба с TTL n уходит на порт TRACE_PORT + n
+MAX_HOPS = 30
+PROBE_TIMEOUT = 2.0     # секунды ожидания ответов после отправки проб
+PROBE_PAYLOAD = b'\x00' * 32
+
+_EXTENDED_ERR = struct.Struct('=IBBBBII')  # struct sock_extended_err, за ней sockaddr_in отправителя ICMP
+_ICMP_ECHO = struct.Struct('!BBHHH')
+_idents = itertools.count(os.getpid())
+
+
+class Hop(NamedTuple):
+    ttl: int
+    ip: Optional[str]       # None — узел не ответил за время ожидания
+    rtt: Optional[float]    # секунды
+    reached: bool = False   # ответил сам адресат
+
+
+class PathProber:
+    """Трассировка маршрута: пробы со всеми TTL от 1 до max_hops отправляются
+    сразу, ответы собираются по мере прихода. Весь путь известен примерно
+    через RTT до адресата, а молчащие узлы стоят одного общего timeout, а не
+    timeout на каждый узел, как у последовательного traceroute.
+
+    Методы (только Linux):
+    - udp — UDP-сокет на каждый TTL с IP_RECVERR: ICMP time exceeded и
+      port unreachable ядро кладёт в очередь ошибок сокета (MSG_ERRQUEUE)
+      вместе с адресом отправителя ICMP. Прав root не нужно;
+    - icmp — эхо-запросы через raw-сокет (нужен CAP_NET_RAW): TTL пробы
+      записан в номере последовательности и возвращается во вложенном
+      заголовке ICMP-ошибки;
+    - auto — icmp, если raw-сокет открывается, иначе udp.
+    """
+
+    def __init__(self, target: str, max_hops: int = MAX_HOPS, timeout: float = PROBE_TIMEOUT,
+                 method: str = 'auto', port: int = TRACE_PORT):
+        self.target = target
+        self.max_hops = max_hops
+        self.timeout = timeout
+        self.port = port
+        self.method = method
+        self._raw = None
+        if method in ('auto', 'icmp'):
+            try:
+                self._raw = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+                self.method = 'icmp'
+            except PermissionError:
+                if method == 'icmp':
+                    raise
+                self.method = 'udp'
+
+    def probe(self) -> List[Hop]:
+        """Узлы по порядку TTL до адресата (или до последнего ответившего), молчащие — с ip=None"""
+        hops: Dict[int, Hop] = {hop.ttl: hop for hop in self.replies()}
+        last = min((hop.ttl for hop in hops.values() if hop.reached), default=max(hops, default=0))
+        return [hops.get(ttl, Hop(ttl, None, None)) for ttl in range(1, last + 1)]
+
+    def replies(self) -> Iterator[Hop]:
+        """Ответы узлов в порядке прихода. Ожидание заканчивается, когда ответили
+        адресат и все узлы перед ним, или через timeout после отправки проб"""
+        if self.method == 'icmp':
+            return self._icmp_replies()
+        return self._udp_replies()
+
+    def _udp_replies(self) -> Iterator[Hop]:
+        sockets: Dict[int, socket.socket] = {}
+        try:
+            for ttl in range(1, self.max_hops + 1):
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sockets[ttl] = sock
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
+                sock.setsockopt(socket.IPPROTO_IP, IP_RECVERR, 1)
+                sock.setblocking(False)
+            by_fd = {sock.fileno(): ttl for ttl, sock in sockets.items()}
+            poller = select.poll()
+            sent = {}
+            for ttl, sock in sockets.items():
+                poller.register(sock, select.POLLERR)
+                sent[ttl] = time.perf_counter()
+                sock.sendto(PROBE_PAYLOAD, (self.target, self.port + ttl))
+
+            waiting = _Waiting(self.max_hops, self.timeout)
+            while waiting:
+                for fd, _ in poller.poll(waiting.remaining_ms()):
+                    ttl = by_fd[fd]
+                    received = time.perf_counter()
+                    try:
+                        _, ancdata, _, _ = sockets[ttl].recvmsg(0, 512, socket.MSG_ERRQUEUE)
+                    except (BlockingIOError, InterruptedError):
+                        continue
+                    poller.unregister(fd)
+                    if waiting.seen(ttl):
+                        continue  # проба дальше уже найденного адресата
+                    error = _icmp_error(ancdata)
+                    if error is None:
+                        continue
+                    ip, icmp_type, code = error
+                    hop = Hop(ttl, ip, received - sent[ttl],
+                              icmp_type == ICMP_DEST_UNREACH and code == ICMP_PORT_UNREACH)
+                    waiting.answered(hop, terminal=icmp_type == ICMP_DEST_UNREACH)
+                    yield hop
+        finally:
+            for sock in sockets.values():
+                sock.close()
+
+    def _icmp_replies(self) -> Iterator[Hop]:
+        sock = self._raw
+        ident = next(_idents) & 0xFFFF
+        sent = {}
+        try:
+            sock.setblocking(False)
+            for ttl in range(1, self.max_hops + 1):
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
+                sent[ttl] = time.perf_counter()
+                sock.sendto(_echo_request(ident, ttl), (self.target, 0))
+
+            poller = select.poll()
+            poller.register(sock, select.POLLIN)
+            waiting = _Waiting(self.max_hops, self.timeout)
+            while waiting:
+                if not poller.poll(waiting.remaining_ms()):
+                    continue
+                while True:
+                    try:
+                        packet, (ip, _) = sock.recvfrom(1500)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    received = time.perf_counter()
+                    reply = _parse_icmp(packet, ident, self.target)
+                    if reply is None or reply[0] not in sent or waiting.seen(reply[0]):
+                        continue
+                    ttl, icmp_type = reply
+                    reached = icmp_type == ICMP_ECHO_REPLY
+                    hop = Hop(ttl, ip, received - sent[ttl], reached)
+                    waiting.answered(hop, terminal=reached or icmp_type == ICMP_DEST_UNREACH)
+                    yield hop
+        finally:
+            sock.close()
+
+
+class _Waiting:
+    """Какие TTL ещё ждут ответа: после ответа адресата (или недоступности) на
+    TTL n пробы с большими TTL больше не нужны"""
+
+    def __init__(self, max_hops: int, timeout: float):
+        self.pending = set(range(1, max_hops + 1))
+        self.deadline = time.monotonic() + timeout
+
+    def __bool__(self):
+        return bool(self.pending) and time.monotonic() < self.deadline
+
+    def remaining_ms(self) -> int:
+        return max(0, int((self.deadline - time.monotonic()) * 1000) + 1)
+
+    def seen(self, ttl: int) -> bool:
+        return ttl not in self.pending
+
+    def answered(self, hop: Hop, terminal: bool):
+        self.pending.discard(hop.ttl)
+        if terminal:
+            self.pending = {ttl for ttl in self.pending if ttl < hop.ttl}
+
+
+def _icmp_error(ancdata):
+    """(адрес отправителя, тип, код) ICMP-ошибки из IP_RECVERR или None"""
+    for level, kind, data in ancdata:
+        if level != socket.IPPROTO_IP or kind != IP_RECVERR:
+            continue
+        _, origin, icmp_type, code, _, _, _ = _EXTENDED_ERR.unpack_from(data)
+        if origin != SO_EE_ORIGIN_ICMP:
+            continue
+        offset = _EXTENDED_ERR.size + 4  # sockaddr_in: sin_family, sin_port, sin_addr
+        return socket.inet_ntoa(data[offset:offset + 4]), icmp_type, code
+    return None
+
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _echo_request(ident: int, seq: int) -> bytes:
+    header = _ICMP_ECHO.pack(ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    checksum = _checksum(header + PROBE_PAYLOAD)
+    return _ICMP_ECHO.pack(ICMP_ECHO_REQUEST, 0, checksum, ident, seq) + PROBE_PAYLOAD
+
+
+def _parse_icmp(packet: bytes, ident: int, target: str):
+    """(TTL пробы, тип ICMP) для ответа на нашу пробу, иначе None"""
+    icmp = packet[(packet[0] & 0x0F) * 4:]
+    if len(icmp) < 8:
+        return None
+    icmp_type = icmp[0]
+    if icmp_type == ICMP_ECHO_REPLY:
+        _, _, _, reply_ident, seq = _ICMP_ECHO.unpack_from(icmp)
+        return (seq, icmp_type) if reply_ident == ident else None
+    if icmp_type not in (ICMP_TIME_EXCEEDED, ICMP_DEST_UNREACH):
+        return None
+    # Вложенный заголовок IP исходной пробы и первые 8 байт её ICMP
+    inner = icmp[8:]
+    if len(inner) < 20 or inner[9] != socket.IPPROTO_ICMP or socket.inet_ntoa(inner[16:20]) != target:
+        return None
+    probe = inner[(inner[0] & 0x0F) * 4:]
+    if len(probe) < 8:
+        return None
+    probe_type, _, _, probe_ident, seq = _ICMP_ECHO.unpack_from(probe)
+    if probe_type != ICMP_ECHO_REQUEST or probe_ident != ident:
+        return None
+    return seq, icmp_type
@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class RipeStub:
+    """Локальный HTTP-сервер вместо stat.ripe.net для тестов и замеров.
+
+    На /data/whois/data.json?resource=a.b.c.d отвечает записями whois:
+    origin AS(64512 + b), country ZZ, netname NET-a-b-c, с задержкой latency
+    секунд. Считает запросы, TCP-соединения и наибольшее число запросов,
+    обрабатывавшихся одновременно.
+    """
+
+    def __init__(self, latency: float = 0.0, host: str = '127.0.0.1', port: int = 0):
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+
+    def start(self) -> 'RipeStub':
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @staticmethod
+    def whois(ip: str) -> dict:
+        a, b, c, _ = ip.split('.')
+        return {'data': {'records': [[
+            {'key': 'inetnum', 'value': f"{a}.{b}.{c}.0 - {a}.{b}.{c}.255"},
+            {'key': 'netname', 'value': f"NET-{a}-{b}-{c}"},
+            {'key': 'country', 'value': 'ZZ'},
+        ], [
+            {'key': 'route', 'value': f"{a}.{b}.{c}.0/24"},
+            {'key': 'origin', 'value': f"AS{64512 + int(b)}"},
+        ]]}}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != '/data/whois/data.json':
+                    self.send_error(404)
+                    return
+                with stub._lock:
+                    stub.requests += 1
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                try:
+                    time.sleep(stub.latency)
+                    body = json.dumps(stub.whois(parse_qs(url.query)['resource'][0])).encode()
+                finally:
+                    with stub._lock:
+                        stub.in_flight -= 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
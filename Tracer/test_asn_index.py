@@ -0,0 +1,128 @@
+import gzip
+import os
+import random
+import tempfile
+import unittest
+
+from asn_index import AsnIndex, ip_to_int, parse_rib
+from ripe_stub import RipeStub
+from Tracer import Tracer
+
+IP2ASN = """1.0.0.0\t1.0.0.255\t13335\tUS\tCLOUDFLARENET
+1.0.1.0\t1.0.3.255\t0\tNone\tNot routed
+16777216\t16777471\t13335\tUS\tCLOUDFLARENET-DUP
+8.8.8.0\t8.8.8.255\t15169\tUS\tGOOGLE
+2001:200::\t2001:200:ffff:ffff:ffff:ffff:ffff:ffff\t2500\tJP\tWIDE
+"""
+
+RIB = """; префиксы вложены друг в друга
+10.0.0.0/8\t100
+10.1.0.0/16\t200
+10.1.2.0/24\t300
+TABLE_DUMP2|1700000000|B|192.0.2.1|64496|11.0.0.0/8|64496 3356 {400,401}|IGP
+"""
+
+
+class TestAsnIndex(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, 'asn.idx')
+
+    def write(self, name, text):
+        path = os.path.join(self.dir.name, name)
+        with (gzip.open(path, 'wt') if name.endswith('.gz') else open(path, 'w')) as f:
+            f.write(text)
+        return path
+
+    def test_import_ip2asn(self):
+        index = AsnIndex(self.path).open()
+        self.assertEqual(index.import_file(self.write('ip2asn-v4.tsv.gz', IP2ASN)), 2)
+        self.assertEqual(index.lookup('1.0.0.1'), ('AS13335', 'US', 'CLOUDFLARENET-DUP'))
+        self.assertEqual(index.lookup('8.8.8.8'), ('AS15169', 'US', 'GOOGLE'))
+        self.assertIsNone(index.lookup('1.0.2.1'))  # не анонсируется — спросим RIPE
+        self.assertIsNone(index.lookup('9.9.9.9'))
+
+    def test_import_empty_file(self):
+        """Пустой файл или одни комментарии не затирают индекс"""
+        index = AsnIndex(self.path).open()
+        index.import_file(self.write('ip2asn.tsv', IP2ASN))
+        for text in ('', '# только комментарий\n\n; и ещё один\n'):
+            with self.assertRaises(ValueError):
+                index.import_file(self.write('empty.txt', text))
+        self.assertEqual(index.lookup('8.8.8.8'), ('AS15169', 'US', 'GOOGLE'))
+
+    def test_longest_prefix_match(self):
+        index = AsnIndex(self.path).open()
+        index.import_file(self.write('rib.txt', RIB))
+        for ip, asn in (('10.0.0.1', 'AS100'), ('10.1.0.1', 'AS200'), ('10.1.2.3', 'AS300'),
+                        ('10.1.3.0', 'AS200'), ('10.255.255.255', 'AS100'), ('11.2.3.4', 'AS400')):
+            self.assertEqual(index.lookup(ip), (asn, None, None), ip)
+        self.assertEqual(list(parse_rib(['2001:db8::/32 64500'])), [])
+
+    def test_write_back_persists_and_compacts(self):
+        index = AsnIndex(self.path).open()
+        index.import_file(self.write('rib.txt', RIB))
+        # Ответ RIPE уже префикса из индекса побеждает, шире — нет
+        index.add(ip_to_int('10.1.2.0'), ip_to_int('10.1.2.127'), ('AS64500', 'ZZ', 'NARROW'))
+        index.add(ip_to_int('10.0.0.0'), ip_to_int('10.15.255.255'), ('AS64501', 'ZZ', 'WIDE'))
+        expected = {'10.1.2.1': ('AS64500', 'ZZ', 'NARROW'), '10.1.2.200': ('AS300', None, None),
+                    '10.0.0.1': ('AS64501', 'ZZ', 'WIDE'), '10.1.0.1': ('AS200', None, None),
+                    '10.16.0.0': ('AS100', None, None)}
+
+        reopened = AsnIndex(self.path).open()
+        self.assertEqual({ip: reopened.lookup(ip) for ip in expected}, expected)
+        compacted = AsnIndex(self.path, compact_after=2).open()
+        self.assertFalse(os.path.exists(compacted.journal_path))
+        self.assertEqual({ip: compacted.lookup(ip) for ip in expected}, expected)
+
+        # Повторный импорт не теряет уже влитые в индекс ответы RIPE
+        compacted.import_file(self.write('ip2asn.tsv', IP2ASN))
+        expected['8.8.8.8'] = ('AS15169', 'US', 'GOOGLE')
+        self.assertEqual({ip: compacted.lookup(ip) for ip in expected}, expected)
+
+    def test_write_back_updates_overlay_incrementally(self):
+        """Ответы RIPE вставляются в уже собранные интервалы журнала так же, как при полной сборке"""
+        index = AsnIndex(self.path).open()
+        index.import_file(self.write('rib.txt', RIB))
+        index.add(ip_to_int('10.0.0.0'), ip_to_int('10.0.0.255'), ('AS1', 'ZZ', 'FIRST'))
+        index.lookup('10.0.0.1')  # собирает интервалы журнала
+        rng = random.Random(7)
+        for i in range(300):
+            start = ip_to_int('10.0.0.0') + rng.randrange(1 << 16)
+            index.add(start, start + rng.randrange(1 << rng.randrange(1, 14)), (f'AS{i + 2}', 'ZZ', f'NET{i}'))
+            self.assertIsNotNone(index._overlay)
+        rebuilt = AsnIndex(self.path).open()
+        for _ in range(2000):
+            ip = f'10.{rng.choice((0, 1))}.{rng.randrange(256)}.{rng.randrange(256)}'
+            self.assertEqual(index.lookup(ip), rebuilt.lookup(ip), ip)
+
+    def test_rebuild_closes_old_mapping(self):
+        index = AsnIndex(self.path).open()
+        index.import_file(self.write('rib.txt', RIB))
+        old = index._main[0]
+        index.add(ip_to_int('10.1.2.0'), ip_to_int('10.1.2.127'), ('AS64500', 'ZZ', 'NARROW'))
+        index.compact()
+        self.assertTrue(old.closed)
+        self.assertEqual(index.lookup('10.1.2.1'), ('AS64500', 'ZZ', 'NARROW'))
+
+    def test_tracer_falls_back_to_ripe_and_writes_back(self):
+        stub = RipeStub().start()
+        self.addCleanup(stub.stop)
+        index = AsnIndex(self.path).open()
+        index.import_file(self.write('ip2asn.tsv', IP2ASN))
+        tracer = Tracer(stub.url, asn_index=index)
+
+        infos = tracer.get_asn_info_many(['8.8.8.8', '203.0.5.9', '203.0.5.200'])
+        self.assertEqual(infos['8.8.8.8'], ('AS15169', 'US', 'GOOGLE'))
+        self.assertEqual(infos['203.0.5.200'], ('AS64512', 'ZZ', 'NET-203-0-5'))
+        self.assertEqual(stub.requests, 1)
+
+        # Следующий запуск находит ответ RIPE (route 203.0.5.0/24) в индексе
+        tracer = Tracer(stub.url, asn_index=AsnIndex(self.path).open())
+        self.assertEqual(tracer.get_asn_info('203.0.5.50'), ('AS64512', 'ZZ', 'NET-203-0-5'))
+        self.assertEqual(stub.requests, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from batch import BatchTracer, resume_point, unique_targets
+from ripe_stub import RipeStub
+from Tracer import Tracer
+
+
+class FakeRoutes:
+    """trace_route для Tracer: общие для всех целей узлы, затем своя сеть цели"""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.traced = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, target):
+        with self.lock:
+            self.traced.append(target)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        last = int(target.split('.')[2])
+        return [" 1  192.168.0.1  0.1 ms", " 2  203.0.100.1  1 ms", f" 3  203.0.101.{last % 3}  2 ms",
+                f" 4  {target}  3 ms"]
+
+
+class TestBatchTracer(unittest.TestCase):
+    def setUp(self):
+        self.stub = RipeStub(latency=0.01).start()
+        self.addCleanup(self.stub.stop)
+        fd, self.output = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        self.addCleanup(os.unlink, self.output)
+
+    def make_tracer(self):
+        tracer = Tracer(self.stub.url)
+        tracer.trace_route = FakeRoutes()
+        return tracer
+
+    def read_output(self):
+        with open(self.output) as f:
+            return {record['target']: record for record in map(json.loads, f)}
+
+    def test_parallel_traces_share_asn_cache(self):
+        tracer = self.make_tracer()
+        targets = [f'203.0.{i}.1' for i in range(20)] + ['203.0.0.1', 'no-such-host.invalid']
+        stats = BatchTracer(tracer, parallel=4).run(targets, self.output)
+
+        self.assertEqual(stats, {'traced': 20, 'failed': 1, 'skipped': 1})
+        records = self.read_output()
+        self.assertEqual(len(records), 21)
+        self.assertIn('error', records['no-such-host.invalid'])
+        self.assertEqual(records['203.0.7.1']['hops'], [
+            {'hop': 1, 'ip': '192.168.0.1', 'asn': None, 'country': None, 'provider': None},
+            {'hop': 2, 'ip': '203.0.100.1', 'asn': 'AS64512', 'country': 'ZZ', 'provider': 'NET-203-0-100'},
+            {'hop': 3, 'ip': '203.0.101.1', 'asn': 'AS64512', 'country': 'ZZ', 'provider': 'NET-203-0-101'},
+            {'hop': 4, 'ip': '203.0.7.1', 'asn': 'AS64512', 'country': 'ZZ', 'provider': 'NET-203-0-7'},
+        ])
+        self.assertEqual(tracer.trace_route.max_in_flight, 4)
+        self.assertEqual(self.stub.requests, 22)  # 203.0.100/24, 203.0.101/24 и 20 сетей целей
+
+    def test_resume_skips_completed_targets(self):
+        BatchTracer(self.make_tracer(), parallel=4).run([f'203.0.{i}.1' for i in range(5)], self.output)
+        with open(self.output, 'a') as f:
+            f.write('{"index": 9, "target": "203.0.9.1", "ip": "203.0')  # запуск прервали посреди записи
+
+        self.assertEqual(resume_point(self.output), (5, set()))
+        tracer = self.make_tracer()
+        stats = BatchTracer(tracer, parallel=4).run([f'203.0.{i}.1' for i in range(10)], self.output)
+
+        self.assertEqual(stats, {'traced': 5, 'failed': 0, 'skipped': 5})
+        self.assertEqual(sorted(tracer.trace_route.traced), [f'203.0.{i}.1' for i in range(5, 10)])
+        self.assertEqual(sorted(self.read_output()), sorted(f'203.0.{i}.1' for i in range(10)))
+
+    def test_resume_point_tracks_out_of_order_results(self):
+        """Записанные раньше предыдущих цели не трассируются повторно, а множество номеров не растёт"""
+        with open(self.output, 'w') as f:
+            for index in (1, 0, 3, 2, 6, 4):
+                f.write(json.dumps({'index': index, 'target': f'203.0.{index}.1', 'hops': []}) + '\n')
+        self.assertEqual(resume_point(self.output), (5, {6}))
+
+        tracer = self.make_tracer()
+        stats = BatchTracer(tracer, parallel=4).run([f'203.0.{i}.1' for i in range(8)], self.output)
+        self.assertEqual(stats, {'traced': 2, 'failed': 0, 'skipped': 6})
+        self.assertEqual(sorted(tracer.trace_route.traced), ['203.0.5.1', '203.0.7.1'])
+
+    def test_duplicates_skipped_within_window(self):
+        stats = {'skipped': 0}
+        targets = ['a', 'b', 'a', 'c', 'd', 'a']
+        self.assertEqual(list(unique_targets(targets, stats, window=2)), ['a', 'b', 'c', 'd', 'a'])
+        self.assertEqual(stats['skipped'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import unittest
+
+from probe import PathProber
+
+TRACER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def raw_sockets_allowed() -> bool:
+    try:
+        socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP).close()
+        return True
+    except PermissionError:
+        return False
+
+
+class TestLoopback(unittest.TestCase):
+    def test_udp(self):
+        hops = PathProber('127.0.0.1', method='udp', timeout=1).probe()
+        self.assertEqual([(hop.ttl, hop.ip, hop.reached) for hop in hops], [(1, '127.0.0.1', True)])
+
+    @unittest.skipUnless(raw_sockets_allowed(), 'нужен CAP_NET_RAW')
+    def test_icmp(self):
+        hops = PathProber('127.0.0.1', method='icmp', timeout=1).probe()
+        self.assertEqual([(hop.ttl, hop.ip, hop.reached) for hop in hops], [(1, '127.0.0.1', True)])
+
+
+@unittest.skipUnless(sys.platform.startswith('linux') and os.geteuid() == 0 and shutil.which('ip'),
+                     'нужны root и iproute2 для сетевых пространств имён')
+class TestNamespaceTopology(unittest.TestCase):
+    """Клиент A -> маршрутизатор R1 -> маршрутизатор R2 -> адресат B, каждый в своём netns"""
+
+    PREFIX = f'trc{os.getpid()}'
+
+    @classmethod
+    def ip(cls, *args):
+        subprocess.run(['ip', *args], check=True, capture_output=True)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.namespaces = [cls.PREFIX + name for name in ('a', 'r1', 'r2', 'b')]
+        a, r1, r2, b = cls.namespaces
+        try:
+            for ns in cls.namespaces:
+                cls.ip('netns', 'add', ns)
+                cls.ip('-n', ns, 'link', 'set', 'lo', 'up')
+            for left, left_dev, right, right_dev, subnet in ((a, 'a0', r1, 'r1a', 1), (r1, 'r1b', r2, 'r2a', 2),
+                                                             (r2, 'r2b', b, 'b0', 3)):
+                cls.ip('link', 'add', left_dev, 'netns', left, 'type', 'veth', 'peer', 'name', right_dev,
+                       'netns', right)
+                for ns, dev, host in ((left, left_dev, 1), (right, right_dev, 2)):
+                    cls.ip('-n', ns, 'addr', 'add', f'10.201.{subnet}.{host}/24', 'dev', dev)
+                    cls.ip('-n', ns, 'link', 'set', dev, 'up')
+            cls.ip('-n', a, 'route', 'add', 'default', 'via', '10.201.1.2')
+            cls.ip('-n', b, 'route', 'add', 'default', 'via', '10.201.3.1')
+            cls.ip('-n', r1, 'route', 'add', '10.201.3.0/24', 'via', '10.201.2.2')
+            cls.ip('-n', r2, 'route', 'add', '10.201.1.0/24', 'via', '10.201.2.1')
+            for router in (r1, r2):
+                subprocess.run(['ip', 'netns', 'exec', router, 'sysctl', '-qw', 'net.ipv4.ip_forward=1'], check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            cls.tearDownClass()
+            raise unittest.SkipTest(f'не удалось собрать топологию: {e}')
+
+    @classmethod
+    def tearDownClass(cls):
+        for ns in cls.namespaces:
+            subprocess.run(['ip', 'netns', 'del', ns], capture_output=True)
+
+    def probe(self, method, timeout=1.0):
+        """Трассировка из пространства имён клиента: (узлы, время в секундах).
+        max_hops=5: на пробы дальше адресата B отвечает port unreachable, а ядро
+        ограничивает их ~6 подряд и 1 в секунду — иначе следующий тест остался бы без ответа B"""
+        code = (f"import json, sys, time; sys.path.insert(0, {TRACER_DIR!r}); from probe import PathProber; "
+                f"t = time.monotonic(); "
+                f"hops = PathProber('10.201.3.2', max_hops=5, method={method!r}, timeout={timeout}).probe(); "
+                f"print(json.dumps([[h.ttl, h.ip, h.reached] for h in hops] + [time.monotonic() - t]))")
+        result = subprocess.run(['ip', 'netns', 'exec', self.namespaces[0], sys.executable, '-c', code],
+                                check=True, capture_output=True, text=True)
+        *hops, elapsed = json.loads(result.stdout)
+        return [tuple(hop) for hop in hops], elapsed
+
+    def methods(self):
+        return ['udp', 'icmp'] if raw_sockets_allowed() else ['udp']
+
+    def test_full_path(self):
+        for method in self.methods():
+            hops, elapsed = self.probe(method)
+            self.assertEqual(hops, [(1, '10.201.1.2', False), (2, '10.201.2.2', False), (3, '10.201.3.2', True)],
+                             method)
+            self.assertLess(elapsed, 0.5, method)  # все ответили — ждать timeout не нужно
+
+    def test_silent_router_costs_one_timeout(self):
+        """R2 пересылает пакеты, но не отправляет свои ICMP: узел 2 пустой, а путь
+        известен через один общий timeout"""
+        self.ip('-n', self.namespaces[2], 'rule', 'add', 'priority', '10', 'ipproto', 'icmp', 'iif', 'lo',
+                'to', '10.201.1.0/24', 'blackhole')
+        self.addCleanup(self.ip, '-n', self.namespaces[2], 'rule', 'del', 'priority', '10')
+        for method in self.methods():
+            hops, elapsed = self.probe(method, timeout=1.0)
+            self.assertEqual(hops, [(1, '10.201.1.2', False), (2, None, False), (3, '10.201.3.2', True)], method)
+            self.assertLess(elapsed, 1.5, method)
+
+
+if __name__ == '__main__':
+    unittest.main()
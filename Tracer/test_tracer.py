@@ -0,0 +1,71 @@
+import time
+import unittest
+
+from ripe_stub import RipeStub
+from Tracer import Tracer
+
+
+class TestAsnLookups(unittest.TestCase):
+    def setUp(self):
+        self.stub = RipeStub(latency=0.05).start()
+        self.addCleanup(self.stub.stop)
+
+    def test_single_lookup(self):
+        tracer = Tracer(self.stub.url)
+        self.assertEqual(tracer.get_asn_info('8.8.8.8'), ('AS64520', 'ZZ', 'NET-8-8-8'))
+        self.assertEqual(tracer.get_asn_info('192.168.0.1'), (None, None, None))
+        self.assertEqual(self.stub.requests, 1)
+
+    def test_many_lookups_are_concurrent_and_deduplicated(self):
+        """Адреса одной /24 запрашиваются один раз, запросы идут параллельно по keep-alive соединениям"""
+        hops = ['10.0.0.1', '100.64.0.1'] + [f'203.0.{i}.1' for i in range(16)] + ['203.0.5.77', '203.0.5.1']
+        tracer = Tracer(self.stub.url, max_workers=4)
+
+        started = time.monotonic()
+        infos = tracer.get_asn_info_many(hops)
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(list(infos), hops[:-1])  # повторный адрес — одна запись
+        self.assertEqual(infos['10.0.0.1'], (None, None, None))
+        self.assertEqual(infos['203.0.3.1'], ('AS64512', 'ZZ', 'NET-203-0-3'))
+        self.assertEqual(infos['203.0.5.77'], infos['203.0.5.1'])
+        self.assertEqual(self.stub.requests, 17)  # 16 сетей /24 и 100.64.0.1
+        self.assertEqual(self.stub.max_in_flight, 4)
+        self.assertLessEqual(self.stub.connections, 4)
+        self.assertLess(elapsed, 17 * 0.05)  # последовательно — не меньше 0.85 с
+
+    def test_unreachable_server(self):
+        tracer = Tracer('http://127.0.0.1:9', timeout=1)
+        with self.assertLogs('AS_Tracer', level='ERROR'):
+            self.assertEqual(tracer.get_asn_info_many(['8.8.8.8']), {'8.8.8.8': (None, None, None)})
+
+
+class TestTraceStream(unittest.TestCase):
+    def test_rows_stream_in_ttl_order_while_hops_are_discovered(self):
+        stub = RipeStub(latency=0.2).start()
+        self.addCleanup(stub.stop)
+        tracer = Tracer(stub.url)
+
+        def discover_hops(target):
+            # Ответы приходят не по порядку, узел 2 молчит, адресат ответил и на TTL 5
+            for delay, hop in ((0, (1, '203.0.1.1', False)), (0.05, (4, '203.0.4.1', True)),
+                               (0, (3, '203.0.3.1', False)), (0, (5, '203.0.4.1', True))):
+                time.sleep(delay)
+                yield hop
+            time.sleep(0.5)  # timeout ожидания узла 2
+
+        tracer.discover_hops = discover_hops
+        started = time.monotonic()
+        rows = []
+        for row in tracer.trace_stream('203.0.4.1'):
+            rows.append((row['hop'], row['ip'], row['asn'], time.monotonic() - started))
+
+        self.assertEqual([row[:3] for row in rows],
+                         [(1, '203.0.1.1', 'AS64512'), (2, '203.0.3.1', 'AS64512'), (3, '203.0.4.1', 'AS64512')])
+        self.assertLess(rows[0][3], 0.45)   # первая строка — не дожидаясь конца трассировки
+        self.assertLess(rows[-1][3], 0.8)   # AS запрашивались, пока шла трассировка
+        self.assertEqual(stub.requests, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()